@@ -1 +1,5 @@
-# app package 
\ No newline at end of file
+# app package
+from dotenv import load_dotenv
+
+# Read .env once, before any module reads its configuration from the environment
+load_dotenv()
@@ -0,0 +1,358 @@
+import calendar
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import models
+
+try:
+    import fcntl
+except ImportError:
+    # Not POSIX: refreshes take an exclusively created lock file instead
+    fcntl = None
+
+# Columnar snapshot configuration
+SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR", "./analytics_snapshot")
+SNAPSHOT_TTL_SECONDS = int(os.getenv("ANALYTICS_SNAPSHOT_TTL_SECONDS", "300"))
+SNAPSHOT_BATCH_SIZE = int(os.getenv("ANALYTICS_SNAPSHOT_BATCH_SIZE", "50000"))
+
+# An exclusively created lock file older than this was left by a crashed refresh
+SNAPSHOT_LOCK_STALE_SECONDS = 600
+
+SECONDS_PER_DAY = 86400
+UNCATEGORIZED = "Uncategorized"
+
+# Column name -> dtype of the persisted column file (raw, native byte order)
+COLUMNS = {
+    "id": np.int64,
+    "amount": np.float64,
+    "timestamp": np.int64,  # UTC epoch seconds
+    "sender": np.int64,
+    "recipient": np.int64,
+    "category": np.int32,  # index into the categories dictionary
+}
+
+
+def _map_column(path: str, dtype, rows: int) -> np.ndarray:
+    # np.memmap cannot map zero bytes
+    if rows == 0:
+        os.stat(path)
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+class SnapshotState(NamedTuple):
+    """One published generation as mapped by this process; never mutated"""
+    generation: Optional[str]
+    last_id: int
+    refreshed_at: float
+    categories: List[str]
+    columns: Dict[str, np.ndarray]
+
+    @property
+    def row_count(self) -> int:
+        return len(self.columns["id"])
+
+
+EMPTY_STATE = SnapshotState(None, 0, 0.0, [], _empty_columns())
+
+
+def _epoch_seconds(value: Optional[datetime]) -> int:
+    # Naive timestamps are stored in UTC by the database
+    if value is None:
+        return 0
+    return calendar.timegm(value.utctimetuple())
+
+
+class TransactionSnapshot:
+    """Append-only columnar copy of the transactions table.
+
+    A generation directory holds one raw file per column. Each refresh
+    appends the new rows to the files and then atomically swaps meta.json,
+    whose row count is how much of each file readers map, so other workers
+    keep reading while a refresh is in progress. Refreshes in all workers
+    take an exclusive file lock; a new generation is only started when there
+    is none this code can read, and any generation meta.json no longer
+    names is deleted.
+
+    The mapped generation is a SnapshotState replaced with one assignment,
+    so a query that takes one reference to it never sees the columns of one
+    load with the categories of another.
+    """
+
+    def __init__(self, directory: str = SNAPSHOT_DIR):
+        self.directory = directory
+        self.state = EMPTY_STATE
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> Optional[str]:
+        return self.state.generation
+
+    @property
+    def last_id(self) -> int:
+        return self.state.last_id
+
+    @property
+    def categories(self) -> List[str]:
+        return self.state.categories
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        return self.state.columns
+
+    @property
+    def row_count(self) -> int:
+        return self.state.row_count
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    @contextmanager
+    def _publish_lock(self):
+        """Exclusive across processes while the files are extended and meta.json swapped"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, ".lock")
+        if fcntl is not None:
+            with open(path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return
+
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > SNAPSHOT_LOCK_STALE_SECONDS:
+                        os.remove(path)
+                        continue
+                except OSError:
+                    # Released in between
+                    continue
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.remove(path)
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self) -> bool:
+        """Map the current on-disk generation, if it changed since the last load"""
+        meta = self._read_meta()
+        state = self.state
+        if not meta or (meta["generation"], meta["rows"]) == (state.generation, state.row_count):
+            return False
+
+        gen_dir = os.path.join(self.directory, meta["generation"])
+        try:
+            columns = {
+                name: _map_column(os.path.join(gen_dir, f"{name}.bin"), dtype, meta["rows"])
+                for name, dtype in COLUMNS.items()
+            }
+        except (OSError, ValueError):
+            # Generation was swept by a newer refresh, or written in an older
+            # format; pick it up next time
+            return False
+
+        self.state = SnapshotState(
+            generation=meta["generation"],
+            last_id=meta["last_id"],
+            refreshed_at=meta["refreshed_at"],
+            categories=meta["categories"],
+            columns=columns
+        )
+        return True
+
+    def _fetch_new_rows(self, db: Session, last_id: int, category_index: dict):
+        chunks = {name: [] for name in COLUMNS}
+        query = db.query(
+            models.Transaction.id,
+            models.Transaction.amount,
+            models.Transaction.timestamp,
+            models.Transaction.sender_id,
+            models.Transaction.recipient_id,
+            models.Transaction.category
+        ).filter(
+            models.Transaction.id > last_id
+        ).order_by(models.Transaction.id)
+
+        def flush(batch):
+            ids, amounts, timestamps, senders, recipients, categories = zip(*batch)
+            codes = []
+            for category in categories:
+                name = category or UNCATEGORIZED
+                code = category_index.get(name)
+                if code is None:
+                    code = category_index[name] = len(category_index)
+                codes.append(code)
+
+            chunks["id"].append(np.asarray(ids, dtype=np.int64))
+            chunks["amount"].append(np.asarray([a or 0.0 for a in amounts], dtype=np.float64))
+            chunks["timestamp"].append(np.asarray([_epoch_seconds(t) for t in timestamps], dtype=np.int64))
+            chunks["sender"].append(np.asarray([s if s is not None else -1 for s in senders], dtype=np.int64))
+            chunks["recipient"].append(np.asarray([r if r is not None else -1 for r in recipients], dtype=np.int64))
+            chunks["category"].append(np.asarray(codes, dtype=np.int32))
+
+        batch = []
+        for row in query.yield_per(SNAPSHOT_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) >= SNAPSHOT_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        return {
+            name: np.concatenate(parts) if parts else np.empty(0, dtype=COLUMNS[name])
+            for name, parts in chunks.items()
+        }
+
+    def refresh(self, db: Session) -> int:
+        """Append transactions newer than last_id and publish a new generation.
+
+        Returns the number of rows added.
+        """
+        with self._lock, self._publish_lock():
+            self.load()
+            state = self.state
+            meta = self._read_meta()
+            if state.generation is None or not meta or meta["generation"] != state.generation:
+                # Nothing readable on disk: build a new generation from the start
+                state = EMPTY_STATE
+
+            category_index = {name: code for code, name in enumerate(state.categories)}
+            new_rows = self._fetch_new_rows(db, state.last_id, category_index)
+            added = len(new_rows["id"])
+            now = time.time()
+
+            if added == 0 and state.generation is not None:
+                self.state = state._replace(refreshed_at=now)
+                return 0
+
+            generation = state.generation or f"gen-{int(now)}-{uuid.uuid4().hex[:8]}"
+            gen_dir = os.path.join(self.directory, generation)
+            os.makedirs(gen_dir, exist_ok=True)
+
+            total = state.row_count + added
+            for name, dtype in COLUMNS.items():
+                with open(os.path.join(gen_dir, f"{name}.bin"), "ab") as f:
+                    # Drop anything a failed refresh wrote past the published rows
+                    f.truncate(state.row_count * np.dtype(dtype).itemsize)
+                    f.write(np.ascontiguousarray(new_rows[name], dtype=dtype).tobytes())
+
+            categories = [None] * len(category_index)
+            for name, code in category_index.items():
+                categories[code] = name
+
+            meta = {
+                "generation": generation,
+                "last_id": int(new_rows["id"][-1]) if added else state.last_id,
+                "rows": total,
+                "categories": categories,
+                "refreshed_at": now
+            }
+            tmp_path = self._meta_path() + f".{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._meta_path())
+
+            self.load()
+            for entry in os.listdir(self.directory):
+                if entry.startswith("gen-") and entry != generation:
+                    # Readers that still map the old files keep their open handles
+                    shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+            return added
+
+    def refresh_if_stale(self, db: Session, ttl_seconds: int = SNAPSHOT_TTL_SECONDS) -> None:
+        self.load()
+        state = self.state
+        if state.generation is None or time.time() - state.refreshed_at >= ttl_seconds:
+            self.refresh(db)
+
+    # Vectorized queries; each takes one reference to the state
+    @staticmethod
+    def _window(state: SnapshotState, start: datetime, end: datetime) -> np.ndarray:
+        ts = state.columns["timestamp"]
+        return (ts >= _epoch_seconds(start)) & (ts <= _epoch_seconds(end))
+
+    def daily_volume(self, start: datetime, end: datetime):
+        state = self.state
+        mask = self._window(state, start, end)
+        first_day = _epoch_seconds(start) // SECONDS_PER_DAY
+        num_days = _epoch_seconds(end) // SECONDS_PER_DAY - first_day + 1
+
+        days = state.columns["timestamp"][mask] // SECONDS_PER_DAY - first_day
+        volume = np.bincount(days, weights=state.columns["amount"][mask], minlength=num_days)
+        counts = np.bincount(days, minlength=num_days)
+
+        start_day = datetime.utcfromtimestamp(first_day * SECONDS_PER_DAY).date()
+        return [
+            {
+                "date": start_day + timedelta(days=offset),
+                "volume": float(volume[offset]),
+                "transaction_count": int(counts[offset])
+            }
+            for offset in range(num_days)
+        ]
+
+    def category_share(self, start: datetime, end: datetime):
+        state = self.state
+        mask = self._window(state, start, end)
+        totals = np.bincount(
+            state.columns["category"][mask],
+            weights=state.columns["amount"][mask],
+            minlength=len(state.categories)
+        )
+        total_volume = float(totals.sum())
+
+        categories = []
+        for code in np.flatnonzero(totals):
+            amount = float(totals[code])
+            categories.append({
+                "category": state.categories[code],
+                "amount": amount,
+                "percentage": (amount / total_volume) * 100 if total_volume > 0 else 0
+            })
+        categories.sort(key=lambda x: x["amount"], reverse=True)
+
+        return {"total_volume": total_volume, "categories": categories}
+
+    def active_users(self, start: datetime, end: datetime) -> int:
+        state = self.state
+        mask = self._window(state, start, end)
+        participants = np.concatenate([state.columns["sender"][mask], state.columns["recipient"][mask]])
+        participants = participants[participants >= 0]
+        return int(np.unique(participants).size)
+
+
+# Shared per-process snapshot
+snapshot = TransactionSnapshot()
+
+
+def get_snapshot(db: Session) -> TransactionSnapshot:
+    snapshot.refresh_if_stale(db)
+    return snapshot
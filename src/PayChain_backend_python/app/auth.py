@@ -1,55 +1,155 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
+import threading
+import time
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from app import schemas, models
+from app.hashing import hasher, UNUSABLE_PASSWORD
 from app.database import get_db
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Authentication caches (0 disables)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "5"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Password hashing runs on the bounded process pool in app.hashing and
+# raises hashing.HashingBusy when it is saturated
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hasher.verify_and_update(plain_password, hashed_password)[0]
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hasher.hash(password)
+
+def _rehash(db: Session, user: models.User, new_hash: Optional[str]):
+    # The stored hash used outdated cost parameters; replace it transparently
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
 
 def authenticate_user(db: Session, email: str, password: str):
     user = db.query(models.User).filter(models.User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
         return False
+    verified, new_hash = hasher.verify_and_update(password, user.hashed_password)
+    if not verified:
+        return False
+    _rehash(db, user, new_hash)
     return user
 
+def _jwt():
+    # python-jose loads its cryptography backend on import; defer it to the first token
+    from jose import jwt
+    return jwt
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = _jwt().encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class UserSnapshot:
+    """Detached copy of a user's columns, cached by get_current_user.
+
+    `balance` may be up to AUTH_USER_CACHE_TTL seconds old; read it from the
+    database where it matters.
+    """
+
+    COLUMNS = (
+        "id", "email", "principal_id", "is_active", "created_at", "updated_at", "balance",
+        "full_name", "profile_image", "notification_preferences"
+    )
+    __slots__ = COLUMNS
+
+    def __init__(self, user: models.User):
+        for column in self.COLUMNS:
+            setattr(self, column, getattr(user, column))
+
+# Verified token digest -> claims, least recently used first
+_token_cache = OrderedDict()
+# Email -> (expiry on the monotonic clock, UserSnapshot)
+_user_cache = {}
+_cache_lock = threading.Lock()
+
+def _decode_token(token: str) -> dict:
+    """jwt.decode with an LRU of already verified tokens; expired entries are re-checked"""
+    if AUTH_TOKEN_CACHE_SIZE <= 0:
+        return _jwt().decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    with _cache_lock:
+        payload = _token_cache.get(key)
+        if payload is not None:
+            if payload.get("exp") is None or payload["exp"] > time.time():
+                _token_cache.move_to_end(key)
+                return payload
+            del _token_cache[key]
+    
+    # Raises ExpiredSignatureError for the entry evicted above
+    payload = _jwt().decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    with _cache_lock:
+        _token_cache[key] = payload
+        if len(_token_cache) > AUTH_TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return payload
+
+def _get_user_snapshot(db: Session, email: str) -> Optional[UserSnapshot]:
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _user_cache.get(email)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    
+    user = db.query(models.User).filter(models.User.email == email).first()
+    if user is None:
+        return None
+    snapshot = UserSnapshot(user)
+    if AUTH_USER_CACHE_TTL > 0:
+        with _cache_lock:
+            _user_cache[email] = (now + AUTH_USER_CACHE_TTL, snapshot)
+            # Drop expired entries once the cache grows past the token cache size
+            if len(_user_cache) > max(AUTH_TOKEN_CACHE_SIZE, 1):
+                for key in [k for k, (expires, _) in _user_cache.items() if expires <= now]:
+                    del _user_cache[key]
+    return snapshot
+
+def invalidate_user(*emails: str):
+    """Drop cached users; called when email, password or is_active change.
+
+    Only affects this process; other workers pick the change up within
+    AUTH_USER_CACHE_TTL seconds.
+    """
+    with _cache_lock:
+        for email in emails:
+            _user_cache.pop(email, None)
+
+def clear_auth_caches():
+    with _cache_lock:
+        _token_cache.clear()
+        _user_cache.clear()
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    from jose import JWTError
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
@@ -57,7 +157,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    user = _get_user_snapshot(db, token_data.email)
     if user is None:
         raise credentials_exception
-    return user 
\ No newline at end of file
+    return user 
+
+def get_current_admin_user(current_user: UserSnapshot = Depends(get_current_user)):
+    # Check if user has admin privileges (for simplicity, we'll just check by email)
+    if not current_user.email.endswith("@admin.com"):
+        raise HTTPException(
+            status_code=403,
+            detail="You don't have permission to access this endpoint"
+        )
+    return current_user
@@ -1,12 +1,18 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import and_, or_, func, desc, bindparam, type_coerce, Text
 from datetime import datetime, timedelta, date
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import calendar
 import json
+import os
+import socket
+import uuid
 
-from app import models, schemas
-from app.auth import get_password_hash
+from app import events, listcache, models, notifications, schemas, sketches
+from app.fastjson import RawJSON
+from app.auth import get_password_hash, invalidate_user, UNUSABLE_PASSWORD
 
 # User operations
 def get_user(db: Session, user_id: int):
@@ -18,16 +24,47 @@ def get_user_by_email(db: Session, email: str):
 def get_user_by_principal(db: Session, principal_id: str):
     return db.query(models.User).filter(models.User.principal_id == principal_id).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def get_user_ids_by_principal(db: Session, principal_ids) -> Dict[str, int]:
+    """Map principal ids to user ids with one query; unknown principals are omitted"""
+    if not principal_ids:
+        return {}
+    return dict(db.query(models.User.principal_id, models.User.id).filter(
+        models.User.principal_id.in_(set(principal_ids))
+    ))
+
+# Per-user data versions, used as ETags for conditional GETs
+def get_user_data_version(db: Session, user_id: int) -> int:
+    return db.query(models.User.data_version).filter(models.User.id == user_id).scalar() or 0
+
+def _bump_data_version(db: Session, user_ids):
+    """Invalidate the ETags of these users; committed with the caller's write.
+
+    Writes that change templates or scheduled payments also stage the rows
+    with listcache.stage, so cached lists are patched instead of dropped.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        db.query(models.User).filter(models.User.id.in_(user_ids)).update(
+            {models.User.data_version: models.User.data_version + 1},
+            synchronize_session=False
+        )
+        listcache.record_bump(db, user_ids)
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    # Callers on the request path hash asynchronously and pass the result in
+    hashed_password = hashed_password or get_password_hash(user.password)
     db_user = models.User(
         email=user.email,
         principal_id=user.principal_id,
         hashed_password=hashed_password
     )
     db.add(db_user)
+    db.flush()
+    pinned = _pin_pending_recipients(db, db_user)
     db.commit()
     db.refresh(db_user)
+    for payment_id in pinned:
+        _notify_schedule_change(payment_id)
     return db_user
 
 def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
@@ -36,6 +73,7 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
         return None
     
     update_data = user_update.dict(exclude_unset=True)
+    previous_email = db_user.email
     
     # Hash the password if it's being updated
     if "password" in update_data and update_data["password"]:
@@ -45,8 +83,13 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
     for key, value in update_data.items():
         setattr(db_user, key, value)
     
+    _bump_data_version(db, [user_id])
     db.commit()
     db.refresh(db_user)
+    
+    # Cached authentication snapshots must not outlive these changes
+    if {"email", "hashed_password", "is_active"} & set(update_data):
+        invalidate_user(previous_email, db_user.email)
     return db_user
 
 def get_user_balance(db: Session, user_id: int):
@@ -65,6 +108,7 @@ def update_user_balance(db: Session, user_id: int, amount: float, is_increase: b
     else:
         user.balance -= amount
     
+    _bump_data_version(db, [user_id])
     db.commit()
     db.refresh(user)
     return user
@@ -92,16 +136,16 @@ def create_transaction(db: Session, transaction: schemas.TransactionCreate, user
     recipient = get_user_by_principal(db, transaction.recipient_principal)
     
     if not recipient:
-        # Create a placeholder recipient if not found (for demo purposes)
-        temp_password = get_password_hash("temporary")
+        # Create a placeholder recipient if not found (for demo purposes).
+        # It cannot log in, so no password is hashed on the payment path.
         recipient = models.User(
             email=f"{transaction.recipient_principal}@placeholder.com",
             principal_id=transaction.recipient_principal,
-            hashed_password=temp_password
+            hashed_password=UNUSABLE_PASSWORD
         )
         db.add(recipient)
-        db.commit()
-        db.refresh(recipient)
+        # For its id; committed with the payment
+        db.flush()
     
     # Convert metadata to string for storage
     metadata_json = None
@@ -121,28 +165,68 @@ def create_transaction(db: Session, transaction: schemas.TransactionCreate, user
     
     db.add(db_transaction)
     
-    # Add tags if provided
-    if transaction.tags:
-        for tag_name in transaction.tags:
-            tag = get_or_create_tag(db, tag_name)
-            db_transaction.tags.append(tag)
+    # Add tags if provided; new tags are created with the payment
+    tags = {}
+    for tag_name in transaction.tags or []:
+        if tag_name not in tags:
+            tags[tag_name] = get_tag_by_name(db, tag_name) or models.Tag(name=tag_name)
+    db_transaction.tags.extend(tags.values())
     
-    # Update balances
-    update_user_balance(db, user_id, transaction.amount, is_increase=False)
-    update_user_balance(db, recipient.id, transaction.amount, is_increase=True)
+    # Relative updates, so concurrent credits are never overwritten
+    db.execute(
+        models.User.__table__.update().where(
+            models.User.id == bindparam("account_id")
+        ).values(balance=models.User.balance + bindparam("delta")),
+        [{"account_id": user_id, "delta": -transaction.amount},
+         {"account_id": recipient.id, "delta": transaction.amount}]
+    )
+    _bump_data_version(db, [user_id, recipient.id])
     
-    db.commit()
-    db.refresh(db_transaction)
+    # Fold into the approximate analytics sketches
+    sketches.record_transaction(db, user_id, recipient.id, transaction.amount)
     
-    # Create NFT receipt
-    create_nft_receipt(db, db_transaction.id, user_id)
+    # Ids for the receipt and events
+    db.flush()
+    sender_principal = get_user(db, user_id).principal_id
+    recipient_principal = recipient.principal_id
+    db.add(_nft_receipt(db_transaction, user_id, sender_principal, recipient_principal))
     
-    # Add principal IDs to response
-    db_transaction.sender_principal = get_user(db, user_id).principal_id
-    db_transaction.recipient_principal = recipient.principal_id
+    # Inbox entries, all committed together with the payment, then push to
+    # both parties' live connections
+    published = _payment_events(db_transaction, sender_principal, recipient_principal)
+    notifications.record_notifications(db, published)
+    db.commit()
     
+    # Add principal IDs to response
+    db_transaction.sender_principal = sender_principal
+    db_transaction.recipient_principal = recipient_principal
+    events.hub.publish_many(published + _balance_events(db, [user_id, recipient.id]))
     return db_transaction
 
+def _payment_events(tx: models.Transaction, sender_principal: str, recipient_principal: str, **extra) -> List[tuple]:
+    """payment.sent / payment.received events for events.hub.publish_many"""
+    data = {
+        "transaction_id": tx.id,
+        "amount": tx.amount,
+        "description": tx.description,
+        "sender_principal": sender_principal,
+        "recipient_principal": recipient_principal,
+        **extra
+    }
+    return [
+        (tx.sender_id, events.PAYMENT_SENT, data),
+        (tx.recipient_id, events.PAYMENT_RECEIVED, data)
+    ]
+
+def _balance_events(db: Session, user_ids) -> List[tuple]:
+    """balance.changed events carrying the committed balances, read with one query"""
+    return [
+        (user_id, events.BALANCE_CHANGED, {"balance": balance})
+        for user_id, balance in db.query(models.User.id, models.User.balance).filter(
+            models.User.id.in_(set(user_ids))
+        )
+    ]
+
 def get_user_transactions(
     db: Session, 
     user_id: int, 
@@ -151,7 +235,18 @@ def get_user_transactions(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None
 ):
-    query = db.query(models.Transaction).filter(
+    query = _filter_user_transactions(db.query(models.Transaction), user_id, start_date, end_date)
+    transactions = query.offset(skip).limit(limit).all()
+    
+    # Add principal IDs to all transactions
+    for tx in transactions:
+        tx.sender_principal = get_user(db, tx.sender_id).principal_id
+        tx.recipient_principal = get_user(db, tx.recipient_id).principal_id
+    
+    return transactions
+
+def _filter_user_transactions(query, user_id: int, start_date: Optional[datetime], end_date: Optional[datetime]):
+    query = query.filter(
         (models.Transaction.sender_id == user_id) | 
         (models.Transaction.recipient_id == user_id)
     )
@@ -162,15 +257,65 @@ def get_user_transactions(
     if end_date:
         query = query.filter(models.Transaction.timestamp <= end_date)
     
-    query = query.order_by(desc(models.Transaction.timestamp))
-    transactions = query.offset(skip).limit(limit).all()
+    return query.order_by(desc(models.Transaction.timestamp))
+
+def _raw_json(value, default):
+    # Stored JSON text is passed through; drivers that parse JSON return objects
+    if value is None or value == "":
+        return default
+    return RawJSON(value) if isinstance(value, str) else value
+
+def get_user_transaction_rows(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """get_user_transactions projected into plain dicts for fastjson.
+
+    Principals come from two joins instead of two lookups per row, tag
+    names from one query for the whole page, and metadata is passed
+    through as the stored JSON text.
+    """
+    tx = models.Transaction
+    sender = aliased(models.User)
+    recipient = aliased(models.User)
+    query = db.query(
+        tx.id, tx.sender_id, tx.recipient_id, tx.amount, tx.description, tx.transaction_metadata,
+        tx.status, tx.timestamp, tx.updated_at, tx.category,
+        sender.principal_id.label("sender_principal"),
+        recipient.principal_id.label("recipient_principal")
+    ).outerjoin(sender, sender.id == tx.sender_id).outerjoin(recipient, recipient.id == tx.recipient_id)
+    rows = _filter_user_transactions(query, user_id, start_date, end_date).offset(skip).limit(limit).all()
     
-    # Add principal IDs to all transactions
-    for tx in transactions:
-        tx.sender_principal = get_user(db, tx.sender_id).principal_id
-        tx.recipient_principal = get_user(db, tx.recipient_id).principal_id
+    tags = defaultdict(list)
+    if rows:
+        tag_rows = db.query(models.transaction_tags.c.transaction_id, models.Tag.name).join(
+            models.Tag, models.Tag.id == models.transaction_tags.c.tag_id
+        ).filter(models.transaction_tags.c.transaction_id.in_([row.id for row in rows]))
+        for transaction_id, name in tag_rows:
+            tags[transaction_id].append(name)
     
-    return transactions
+    return [
+        {
+            "recipient_principal": row.recipient_principal,
+            "amount": row.amount,
+            "description": row.description,
+            "metadata": _raw_json(row.transaction_metadata, {}),
+            "id": row.id,
+            "sender_id": row.sender_id,
+            "recipient_id": row.recipient_id,
+            "status": row.status,
+            "timestamp": row.timestamp,
+            "updated_at": row.updated_at,
+            "category": row.category,
+            "tags": tags.get(row.id, []),
+            "sender_principal": row.sender_principal
+        }
+        for row in rows
+    ]
 
 def get_transaction(db: Session, transaction_id: int):
     return db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
@@ -182,12 +327,12 @@ def create_payment_template(db: Session, template: schemas.PaymentTemplateCreate
         name=template.name,
         description=template.description,
         recipient_principal=template.recipient_principal,
+        recipient_id=get_user_ids_by_principal(db, [template.recipient_principal]).get(template.recipient_principal),
         amount=template.amount,
         is_active=template.is_active
     )
     db.add(db_template)
-    db.commit()
-    db.refresh(db_template)
+    db.flush()
     
     # Add conditions
     for condition in template.conditions:
@@ -199,6 +344,9 @@ def create_payment_template(db: Session, template: schemas.PaymentTemplateCreate
         )
         db.add(db_condition)
     
+    # Template and conditions in one commit, so no version sees a template without its conditions
+    listcache.stage(db, listcache.TEMPLATES, [db_template.id])
+    _bump_data_version(db, [user_id])
     db.commit()
     db.refresh(db_template)
     return db_template
@@ -206,6 +354,49 @@ def create_payment_template(db: Session, template: schemas.PaymentTemplateCreate
 def get_user_templates(db: Session, user_id: int):
     return db.query(models.PaymentTemplate).filter(models.PaymentTemplate.owner_id == user_id).all()
 
+def get_user_template_rows(db: Session, user_id: int, data_version: Optional[int] = None) -> List[Dict[str, Any]]:
+    """get_user_templates projected into plain dicts.
+
+    With the user's data_version (read by the caller for its ETag) the list
+    is served from, and stored in, the per-user list cache.
+    """
+    if data_version is None:
+        return _template_rows(db, models.PaymentTemplate.owner_id == user_id)
+    rows = listcache.cache.get(user_id, listcache.TEMPLATES, data_version)
+    if rows is None:
+        rows = _template_rows(db, models.PaymentTemplate.owner_id == user_id)
+        listcache.cache.put(user_id, listcache.TEMPLATES, data_version, rows)
+    return rows
+
+def _template_rows(db: Session, *criteria) -> List[Dict[str, Any]]:
+    """Templates matching criteria as plain dicts, conditions loaded with one query"""
+    pt = models.PaymentTemplate
+    rows = db.query(
+        pt.id, pt.name, pt.description, pt.recipient_principal, pt.amount, pt.is_active,
+        pt.owner_id, pt.created_at, pt.updated_at, pt.recipient_id
+    ).filter(*criteria).order_by(pt.id).all()
+    
+    conditions = defaultdict(list)
+    if rows:
+        tc = models.TemplateCondition
+        condition_rows = db.query(tc.id, tc.template_id, tc.condition_type, tc.operator, tc.value).filter(
+            tc.template_id.in_([row.id for row in rows])
+        ).order_by(tc.id)
+        for condition in condition_rows:
+            conditions[condition.template_id].append({
+                "condition_type": condition.condition_type,
+                "operator": condition.operator,
+                "value": condition.value,
+                "id": condition.id,
+                "template_id": condition.template_id
+            })
+    
+    return [dict(row._mapping, conditions=conditions.get(row.id, [])) for row in rows]
+
+listcache.cache.loaders[listcache.TEMPLATES] = lambda db, ids, owner_ids: _template_rows(
+    db, models.PaymentTemplate.id.in_(ids), models.PaymentTemplate.owner_id.in_(owner_ids)
+)
+
 def get_template(db: Session, template_id: int):
     return db.query(models.PaymentTemplate).filter(models.PaymentTemplate.id == template_id).first()
 
@@ -223,6 +414,11 @@ def update_payment_template(db: Session, template_id: int, template: schemas.Pay
     for key, value in update_data.items():
         setattr(db_template, key, value)
     
+    if "recipient_principal" in update_data:
+        db_template.recipient_id = get_user_ids_by_principal(
+            db, [db_template.recipient_principal]
+        ).get(db_template.recipient_principal)
+    
     # Update conditions if provided
     if conditions is not None:
         # Remove existing conditions
@@ -230,16 +426,12 @@ def update_payment_template(db: Session, template_id: int, template: schemas.Pay
             models.TemplateCondition.template_id == template_id
         ).delete()
         
-        # Add new conditions
+        # Add new conditions (dicts here, from template.dict())
         for condition in conditions:
-            db_condition = models.TemplateCondition(
-                template_id=template_id,
-                condition_type=condition.condition_type,
-                operator=condition.operator,
-                value=condition.value
-            )
-            db.add(db_condition)
+            db.add(models.TemplateCondition(template_id=template_id, **condition))
     
+    listcache.stage(db, listcache.TEMPLATES, [template_id])
+    _bump_data_version(db, [db_template.owner_id])
     db.commit()
     db.refresh(db_template)
     return db_template
@@ -248,10 +440,72 @@ def delete_template(db: Session, template_id: int):
     db_template = get_template(db, template_id)
     if db_template:
         db.delete(db_template)
+        listcache.stage(db, listcache.TEMPLATES, [template_id])
+        _bump_data_version(db, [db_template.owner_id])
         db.commit()
     return db_template
 
 # Scheduled Payment operations
+_schedule_change_listeners = []
+
+def add_schedule_change_listener(listener):
+    """Register a callable invoked with the payment id after a schedule changes"""
+    _schedule_change_listeners.append(listener)
+
+def remove_schedule_change_listener(listener):
+    if listener in _schedule_change_listeners:
+        _schedule_change_listeners.remove(listener)
+
+def _record_schedule_change(db: Session, payment_id: int):
+    # Written in the same transaction, so other processes see it once committed
+    db.add(models.ScheduledPaymentChange(scheduled_payment_id=payment_id))
+
+def _notify_schedule_change(payment_id: int):
+    for listener in list(_schedule_change_listeners):
+        listener(payment_id)
+
+def _pin_pending_recipients(db: Session, user: models.User) -> List[int]:
+    """Resolve schedules and templates waiting for a newly registered principal.
+
+    Returns the ids of scheduled payments that became payable, so the caller
+    can notify change listeners after committing.
+    """
+    sp = models.ScheduledPayment
+    pending = db.query(sp.id, sp.user_id).filter(
+        sp.recipient_principal == user.principal_id,
+        sp.recipient_id.is_(None)
+    ).all()
+    payment_ids = [payment_id for payment_id, _ in pending]
+    if payment_ids:
+        db.query(sp).filter(sp.id.in_(payment_ids)).update(
+            {sp.recipient_id: user.id, sp.recipient_unresolvable: False},
+            synchronize_session=False
+        )
+        for payment_id in payment_ids:
+            _record_schedule_change(db, payment_id)
+        listcache.stage(db, listcache.SCHEDULES, payment_ids)
+    
+    pt = models.PaymentTemplate
+    pending_templates = db.query(pt.id, pt.owner_id).filter(
+        pt.recipient_principal == user.principal_id,
+        pt.recipient_id.is_(None)
+    ).all()
+    if pending_templates:
+        template_ids = [template_id for template_id, _ in pending_templates]
+        db.query(pt).filter(pt.id.in_(template_ids)).update(
+            {pt.recipient_id: user.id}, synchronize_session=False
+        )
+        listcache.stage(db, listcache.TEMPLATES, template_ids)
+    
+    _bump_data_version(db, [owner_id for _, owner_id in pending + pending_templates])
+    return payment_ids
+
+def _resolve_scheduled_payment_recipient(db: Session, db_payment: models.ScheduledPayment):
+    db_payment.recipient_id = get_user_ids_by_principal(
+        db, [db_payment.recipient_principal]
+    ).get(db_payment.recipient_principal)
+    db_payment.recipient_unresolvable = db_payment.recipient_id is None
+
 def create_scheduled_payment(db: Session, payment: schemas.ScheduledPaymentCreate, user_id: int):
     # Calculate next payment date
     next_payment_date = payment.start_date
@@ -268,10 +522,16 @@ def create_scheduled_payment(db: Session, payment: schemas.ScheduledPaymentCreat
         is_active=payment.is_active,
         next_payment_date=next_payment_date
     )
+    _resolve_scheduled_payment_recipient(db, db_payment)
     
     db.add(db_payment)
+    db.flush()
+    _record_schedule_change(db, db_payment.id)
+    listcache.stage(db, listcache.SCHEDULES, [db_payment.id])
+    _bump_data_version(db, [user_id])
     db.commit()
     db.refresh(db_payment)
+    _notify_schedule_change(db_payment.id)
     return db_payment
 
 def get_user_scheduled_payments(db: Session, user_id: int):
@@ -279,6 +539,30 @@ def get_user_scheduled_payments(db: Session, user_id: int):
         models.ScheduledPayment.user_id == user_id
     ).all()
 
+def get_user_scheduled_payment_rows(db: Session, user_id: int, data_version: Optional[int] = None) -> List[Dict[str, Any]]:
+    """get_user_scheduled_payments projected into plain dicts; cached like get_user_template_rows"""
+    if data_version is None:
+        return _scheduled_payment_rows(db, models.ScheduledPayment.user_id == user_id)
+    rows = listcache.cache.get(user_id, listcache.SCHEDULES, data_version)
+    if rows is None:
+        rows = _scheduled_payment_rows(db, models.ScheduledPayment.user_id == user_id)
+        listcache.cache.put(user_id, listcache.SCHEDULES, data_version, rows)
+    return rows
+
+def _scheduled_payment_rows(db: Session, *criteria) -> List[Dict[str, Any]]:
+    sp = models.ScheduledPayment
+    rows = db.query(
+        sp.recipient_principal, sp.amount, sp.description, sp.start_date, sp.frequency, sp.end_date,
+        sp.max_payments, sp.is_active, sp.id, sp.user_id, sp.created_at, sp.updated_at,
+        sp.last_processed, sp.next_payment_date, sp.payments_made, sp.recipient_id,
+        sp.recipient_unresolvable
+    ).filter(*criteria).order_by(sp.id)
+    return [dict(row._mapping) for row in rows]
+
+listcache.cache.loaders[listcache.SCHEDULES] = lambda db, ids, owner_ids: _scheduled_payment_rows(
+    db, models.ScheduledPayment.id.in_(ids), models.ScheduledPayment.user_id.in_(owner_ids)
+)
+
 def get_scheduled_payment(db: Session, payment_id: int):
     return db.query(models.ScheduledPayment).filter(
         models.ScheduledPayment.id == payment_id
@@ -294,6 +578,9 @@ def update_scheduled_payment(db: Session, payment_id: int, payment: schemas.Sche
     for key, value in update_data.items():
         setattr(db_payment, key, value)
     
+    if "recipient_principal" in update_data:
+        _resolve_scheduled_payment_recipient(db, db_payment)
+    
     # Recalculate next payment date if start date or frequency changed
     if "start_date" in update_data or "frequency" in update_data:
         if db_payment.last_processed:
@@ -306,17 +593,33 @@ def update_scheduled_payment(db: Session, payment_id: int, payment: schemas.Sche
             # Calculate from start date
             db_payment.next_payment_date = db_payment.start_date
     
+    _record_schedule_change(db, payment_id)
+    listcache.stage(db, listcache.SCHEDULES, [payment_id])
+    _bump_data_version(db, [db_payment.user_id])
     db.commit()
     db.refresh(db_payment)
+    _notify_schedule_change(payment_id)
     return db_payment
 
 def delete_scheduled_payment(db: Session, payment_id: int):
     db_payment = get_scheduled_payment(db, payment_id)
     if db_payment:
         db.delete(db_payment)
+        _record_schedule_change(db, payment_id)
+        listcache.stage(db, listcache.SCHEDULES, [payment_id])
+        _bump_data_version(db, [db_payment.user_id])
         db.commit()
+        _notify_schedule_change(payment_id)
     return db_payment
 
+def _add_months(current_date: date, months: int) -> date:
+    # Clamp to the last day of shorter months (Jan 31 -> Feb 28/29)
+    month_index = current_date.month - 1 + months
+    year = current_date.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(current_date.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
 def calculate_next_payment_date(current_date: date, frequency: models.ScheduledPaymentFrequency) -> date:
     """Calculate the next payment date based on frequency"""
     if frequency == models.ScheduledPaymentFrequency.ONCE:
@@ -331,115 +634,455 @@ def calculate_next_payment_date(current_date: date, frequency: models.ScheduledP
     elif frequency == models.ScheduledPaymentFrequency.BIWEEKLY:
         return today + timedelta(days=14)
     elif frequency == models.ScheduledPaymentFrequency.MONTHLY:
-        # Handle month logic (may need more sophisticated handling for 31->30 day months)
-        next_month = today.month + 1
-        next_year = today.year
-        if next_month > 12:
-            next_month = 1
-            next_year += 1
-        # Handle end of month cases
-        month_days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        if today.month == 2 and today.day == 29:  # Leap year
-            day = min(today.day, month_days[next_month-1])
-        else:
-            day = min(today.day, month_days[next_month-1])
-        return date(next_year, next_month, day)
+        return _add_months(today, 1)
     elif frequency == models.ScheduledPaymentFrequency.QUARTERLY:
-        # Add 3 months
-        next_month = today.month + 3
-        next_year = today.year
-        if next_month > 12:
-            next_month = next_month - 12
-            next_year += 1
-        month_days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        day = min(today.day, month_days[next_month-1])
-        return date(next_year, next_month, day)
+        return _add_months(today, 3)
     elif frequency == models.ScheduledPaymentFrequency.YEARLY:
-        return date(today.year + 1, today.month, today.day)
+        return _add_months(today, 12)
     else:
         return None
 
-def process_scheduled_payments(db: Session, current_date: Optional[date] = None):
-    """Process all due scheduled payments"""
-    today = date.today() if not current_date else current_date
-    
-    # Find all active scheduled payments that are due
-    due_payments = db.query(models.ScheduledPayment).filter(
+# Scheduled payment processing
+SCHEDULER_CHUNK_SIZE = int(os.getenv("SCHEDULER_CHUNK_SIZE", "500"))
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "1"))
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+
+def new_lease_owner() -> str:
+    """Identifier for one scheduler run, unique across hosts and processes"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def _empty_processing_stats():
+    return {
+        "due": 0,
+        "processed": 0,
+        "deactivated": 0,
+        "missing_recipient": 0,
+        "insufficient_funds": 0,
+        "failed": 0
+    }
+
+def _due_scheduled_payments_query(db: Session, today: date):
+    return db.query(models.ScheduledPayment).filter(
         models.ScheduledPayment.is_active == True,
+        models.ScheduledPayment.recipient_unresolvable == False,
         models.ScheduledPayment.next_payment_date <= today
-    ).all()
+    )
+
+def _live_lease(now: datetime):
+    return and_(
+        models.ScheduledPayment.lease_owner.isnot(None),
+        models.ScheduledPayment.lease_expires_at >= now
+    )
+
+def _claimable(now: datetime):
+    # Also excludes skipped rows whose retry back-off has not passed yet
+    return or_(
+        models.ScheduledPayment.lease_expires_at.is_(None),
+        models.ScheduledPayment.lease_expires_at < now
+    )
+
+def claim_scheduled_payments(
+    db: Session,
+    lease_owner: str,
+    today: date,
+    limit: int = SCHEDULER_CHUNK_SIZE,
+    payment_ids: Optional[List[int]] = None,
+    partition: Optional[tuple] = None
+) -> List[int]:
+    """Lease up to `limit` due schedules for lease_owner and return their ids.
+
+    The claim is one conditional UPDATE, so concurrent schedulers never lease
+    the same row; expired leases (crashed schedulers) are taken over. Payers
+    with a schedule leased by another owner are skipped so that only one
+    scheduler debits an account at a time. `partition` is (index, count) to
+    split payers across workers by user_id.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+    sp = models.ScheduledPayment
+    
+    busy_payers = db.query(sp.user_id).filter(
+        _live_lease(now),
+        sp.lease_owner != lease_owner,
+        sp.user_id.isnot(None)
+    ).subquery().select()
+    candidates = db.query(sp.id).filter(
+        sp.is_active == True,
+        sp.recipient_unresolvable == False,
+        sp.next_payment_date <= today,
+        _claimable(now),
+        sp.user_id.notin_(busy_payers)
+    )
+    if payment_ids is not None:
+        candidates = candidates.filter(sp.id.in_(payment_ids))
+    if partition is not None:
+        index, count = partition
+        candidates = candidates.filter(sp.user_id % count == index)
+    candidates = candidates.order_by(sp.user_id, sp.id).limit(limit)
+    
+    # The lease condition is repeated outside the subquery so it is
+    # re-checked against the row actually being updated
+    db.query(sp).filter(
+        sp.id.in_(candidates.subquery().select()),
+        sp.is_active == True,
+        sp.next_payment_date <= today,
+        _claimable(now)
+    ).update(
+        {sp.lease_owner: lease_owner, sp.lease_expires_at: expires_at},
+        synchronize_session=False
+    )
+    db.commit()
     
-    for payment in due_payments:
-        # Skip if max payments reached
-        if payment.max_payments and payment.payments_made >= payment.max_payments:
+    return [
+        payment_id for (payment_id,) in db.query(sp.id).filter(
+            sp.lease_owner == lease_owner,
+            sp.lease_expires_at == expires_at
+        ).order_by(sp.user_id, sp.id)
+    ]
+
+def _release_lease(payment, retry_after: Optional[datetime] = None):
+    payment.lease_owner = None
+    payment.lease_expires_at = retry_after
+
+def _process_scheduled_payment_chunk(
+    db: Session,
+    payment_ids: List[int],
+    today: date,
+    stats: Dict[str, int],
+    lease_owner: str
+):
+    """Process one chunk of leased scheduled payments and commit once.
+
+    Balances are loaded with one query keyed on the pinned recipient_id,
+    transactions are flushed together, and association rows and balance
+    deltas are written as executemany statements. Legacy rows without a
+    recipient_id are resolved here; those whose principal matches no user
+    are flagged recipient_unresolvable and stop being claimed. Rows skipped
+    for insufficient funds are released with a back-off of one lease period,
+    so the same run does not claim them again.
+    """
+    # First write of the transaction: extend the lease on rows we still own.
+    # This takes the write lock, so a scheduler that took over an expired
+    # lease cannot commit payments for the same rows concurrently.
+    sp = models.ScheduledPayment
+    retry_after = datetime.utcnow() + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+    db.query(sp).filter(
+        sp.id.in_(payment_ids),
+        sp.lease_owner == lease_owner
+    ).update({sp.lease_expires_at: retry_after}, synchronize_session=False)
+    
+    payments = _due_scheduled_payments_query(db, today).filter(
+        sp.id.in_(payment_ids),
+        sp.lease_owner == lease_owner
+    ).order_by(sp.user_id, sp.id).all()
+    
+    # Rows created before recipients were pinned
+    recipients = get_user_ids_by_principal(
+        db, [payment.recipient_principal for payment in payments if payment.recipient_id is None]
+    )
+    for payment in payments:
+        if payment.recipient_id is None:
+            payment.recipient_id = recipients.get(payment.recipient_principal)
+            payment.recipient_unresolvable = payment.recipient_id is None
+    
+    account_ids = {payment.user_id for payment in payments} | {payment.recipient_id for payment in payments}
+    balances = {}
+    principals = {}
+    for account_id, balance, principal_id in db.query(
+        models.User.id, models.User.balance, models.User.principal_id
+    ).filter(models.User.id.in_(account_ids)):
+        balances[account_id] = balance
+        principals[account_id] = principal_id
+    
+    balance_deltas = defaultdict(float)
+    executed = []
+    for payment in payments:
+        # Deactivate if max payments reached or end date passed
+        if (payment.max_payments and payment.payments_made >= payment.max_payments) or \
+                (payment.end_date and payment.end_date < today):
             payment.is_active = False
-            db.commit()
+            _release_lease(payment)
+            stats["deactivated"] += 1
             continue
         
-        # Skip if end date passed
-        if payment.end_date and payment.end_date < today:
-            payment.is_active = False
-            db.commit()
+        recipient_id = payment.recipient_id
+        if recipient_id is None:
+            _release_lease(payment)
+            stats["missing_recipient"] += 1
+            continue  # Skip if recipient not found
+        
+        # Check if user has enough balance, including earlier payments in this chunk
+        if balances.get(payment.user_id, 0) < payment.amount:
+            _release_lease(payment, retry_after)
+            stats["insufficient_funds"] += 1
             continue
         
-        # Process the payment
-        try:
-            recipient = get_user_by_principal(db, payment.recipient_principal)
-            
-            if not recipient:
-                continue  # Skip if recipient not found
-            
-            # Check if user has enough balance
-            user_balance = get_user_balance(db, payment.user_id)
-            if user_balance < payment.amount:
-                continue  # Skip if insufficient funds
-            
-            # Create transaction
-            tx = models.Transaction(
-                sender_id=payment.user_id,
-                recipient_id=recipient.id,
-                amount=payment.amount,
-                description=f"{payment.description} (Automated payment #{payment.payments_made + 1})",
-                status=models.TransactionStatus.COMPLETED
-            )
-            
-            db.add(tx)
-            db.commit()
-            db.refresh(tx)
-            
-            # Create association record
-            association = models.ScheduledPaymentTransaction(
-                scheduled_payment_id=payment.id,
-                transaction_id=tx.id
+        balances[payment.user_id] -= payment.amount
+        balances[recipient_id] += payment.amount
+        balance_deltas[payment.user_id] -= payment.amount
+        balance_deltas[recipient_id] += payment.amount
+        
+        tx = models.Transaction(
+            sender_id=payment.user_id,
+            recipient_id=recipient_id,
+            amount=payment.amount,
+            description=f"{payment.description} (Automated payment #{payment.payments_made + 1})",
+            status=models.TransactionStatus.COMPLETED
+        )
+        db.add(tx)
+        executed.append((payment, tx))
+        
+        # Update payment record
+        payment.payments_made += 1
+        payment.last_processed = datetime.utcnow()
+        payment.next_payment_date = calculate_next_payment_date(today, payment.frequency)
+        _release_lease(payment)
+        
+        # Deactivate if it was a one-time payment or max payments reached
+        if payment.frequency == models.ScheduledPaymentFrequency.ONCE or \
+                (payment.max_payments and payment.payments_made >= payment.max_payments):
+            payment.is_active = False
+    
+    # Assign transaction ids in a single flush
+    db.flush()
+    
+    # Built before commit, which expires the ORM objects
+    published = []
+    for payment, tx in executed:
+        published += _payment_events(
+            tx, principals[payment.user_id], principals[tx.recipient_id], scheduled_payment_id=payment.id
+        )
+        published.append((payment.user_id, events.SCHEDULE_EXECUTED, {
+            "scheduled_payment_id": payment.id,
+            "transaction_id": tx.id,
+            "amount": tx.amount,
+            "recipient_principal": principals[tx.recipient_id],
+            "payments_made": payment.payments_made,
+            # None once a one-time schedule has been paid
+            "next_payment_date": payment.next_payment_date and payment.next_payment_date.isoformat(),
+            "is_active": payment.is_active
+        }))
+    
+    if executed:
+        db.execute(models.ScheduledPaymentTransaction.__table__.insert(), [
+            {"scheduled_payment_id": payment.id, "transaction_id": tx.id}
+            for payment, tx in executed
+        ])
+        # Relative updates, so concurrent credits are never overwritten
+        db.execute(
+            models.User.__table__.update().where(
+                models.User.id == bindparam("account_id")
+            ).values(balance=models.User.balance + bindparam("delta")),
+            [{"account_id": account_id, "delta": delta} for account_id, delta in balance_deltas.items()]
+        )
+        sketches.record_transactions(db, [
+            (tx.sender_id, tx.recipient_id, tx.amount) for _, tx in executed
+        ])
+        notifications.record_notifications(db, published)
+    
+    # Payers see changed schedules (patched into cached lists in place),
+    # recipients new transactions and balances
+    listcache.stage(db, listcache.SCHEDULES, [payment.id for payment in payments])
+    _bump_data_version(db, [payment.user_id for payment in payments] + [tx.recipient_id for _, tx in executed])
+    db.commit()
+    if executed:
+        events.hub.publish_many(published + _balance_events(db, balance_deltas))
+    stats["due"] += len(payments)
+    stats["processed"] += len(executed)
+    return payments
+
+def _process_leased_payments(db: Session, payment_ids: List[int], today: date, lease_owner: str) -> Dict[str, int]:
+    """Process leased schedules as one chunk, retrying each half if it fails.
+
+    Only a schedule that fails on its own keeps its lease (and is retried
+    once the lease expires), so one bad row cannot hold back the rest of
+    its chunk.
+    """
+    stats = _empty_processing_stats()
+    try:
+        _process_scheduled_payment_chunk(db, payment_ids, today, stats, lease_owner)
+        return stats
+    except Exception as e:
+        db.rollback()
+        if len(payment_ids) == 1:
+            print(f"Error processing scheduled payment {payment_ids[0]}: {str(e)}")
+            # Nothing the chunk counted was committed
+            return {**_empty_processing_stats(), "failed": 1}
+
+    stats = _empty_processing_stats()
+    middle = len(payment_ids) // 2
+    for half in (payment_ids[:middle], payment_ids[middle:]):
+        for key, value in _process_leased_payments(db, half, today, lease_owner).items():
+            stats[key] += value
+    return stats
+
+def _process_scheduled_payment_partition(
+    db: Session,
+    today: date,
+    chunk_size: int,
+    lease_owner: str,
+    payment_ids: Optional[List[int]] = None,
+    partition: Optional[tuple] = None,
+    on_chunk: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
+    """Claim and process chunks until no unleased due schedules remain.
+
+    on_chunk is called with the counters of each committed chunk; an
+    exception raised from it stops the partition between chunks.
+    """
+    stats = _empty_processing_stats()
+    while True:
+        chunk = claim_scheduled_payments(db, lease_owner, today, chunk_size, payment_ids, partition)
+        if not chunk:
+            break
+        chunk_stats = _process_leased_payments(db, chunk, today, lease_owner)
+        for key, value in chunk_stats.items():
+            stats[key] += value
+        if on_chunk:
+            on_chunk(chunk_stats)
+    return stats
+
+def _process_partition_in_new_session(session_factory, today: date, chunk_size: int, lease_owner: str, partition: tuple, on_chunk=None):
+    db = session_factory()
+    try:
+        return _process_scheduled_payment_partition(
+            db, today, chunk_size, lease_owner, partition=partition, on_chunk=on_chunk
+        )
+    finally:
+        db.close()
+
+def process_scheduled_payment_ids(db: Session, payment_ids: List[int], today: date, chunk_size: int = SCHEDULER_CHUNK_SIZE):
+    """Process the given schedules, skipping any that are no longer due or are leased elsewhere"""
+    return _process_scheduled_payment_partition(
+        db, today, chunk_size, new_lease_owner(), payment_ids=payment_ids
+    )
+
+def process_scheduled_payments(
+    db: Session,
+    current_date: Optional[date] = None,
+    chunk_size: int = SCHEDULER_CHUNK_SIZE,
+    workers: int = SCHEDULER_WORKERS,
+    session_factory=None,
+    on_chunk: Optional[Callable[[Dict[str, int]], None]] = None
+):
+    """Process all due scheduled payments in leased chunks.
+
+    Any number of schedulers may run at once: each chunk is claimed with a
+    lease, so every due schedule is paid exactly once. Within this run, due
+    schedules are partitioned by payer user_id across `workers` threads,
+    each with its own session from `session_factory`; with a single worker
+    the given session is used. on_chunk receives the counters of every
+    committed chunk (from worker threads when workers > 1). Returns counters
+    describing the run.
+    """
+    today = date.today() if not current_date else current_date
+    lease_owner = new_lease_owner()
+    
+    workers = max(1, workers) if session_factory else 1
+    if workers == 1:
+        return _process_scheduled_payment_partition(db, today, chunk_size, lease_owner, on_chunk=on_chunk)
+    
+    stats = _empty_processing_stats()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _process_partition_in_new_session,
+                session_factory, today, chunk_size, f"{lease_owner}:{index}", (index, workers), on_chunk
             )
-            db.add(association)
-            
-            # Update balances
-            update_user_balance(db, payment.user_id, payment.amount, is_increase=False)
-            update_user_balance(db, recipient.id, payment.amount, is_increase=True)
-            
-            # Update payment record
-            payment.payments_made += 1
-            payment.last_processed = datetime.utcnow()
-            payment.next_payment_date = calculate_next_payment_date(today, payment.frequency)
-            
-            # Deactivate if it was a one-time payment
-            if payment.frequency == models.ScheduledPaymentFrequency.ONCE:
-                payment.is_active = False
+            for index in range(workers)
+        ]
+        for future in futures:
+            for key, value in future.result().items():
+                stats[key] += value
+    return stats
+
+def resolve_payment_recipients(
+    db: Session,
+    batch_size: int = SCHEDULER_CHUNK_SIZE,
+    on_batch: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
+    """Pin recipient_id on scheduled payments and templates that lack one.
+
+    Re-resolution job for rows created before recipients were pinned, and
+    for schedules flagged recipient_unresolvable whose principal may have
+    registered since. Rows are walked in id order, one commit per batch.
+    Schedules that still match no user are flagged so the scheduler skips
+    them; schedules that resolve are unflagged and logged as changed.
+    on_batch receives the counters of each committed batch.
+    """
+    stats = {"resolved": 0, "unresolvable": 0}
+    for model in (models.ScheduledPayment, models.PaymentTemplate):
+        is_schedule = model is models.ScheduledPayment
+        owner_column = model.user_id if is_schedule else model.owner_id
+        last_id = 0
+        while True:
+            rows = db.query(model.id, model.recipient_principal, owner_column).filter(
+                model.recipient_id.is_(None),
+                model.id > last_id
+            ).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
             
-            # Deactivate if max payments reached
-            if payment.max_payments and payment.payments_made >= payment.max_payments:
-                payment.is_active = False
+            recipients = get_user_ids_by_principal(db, [principal for _, principal, _ in rows])
+            resolved = [
+                {"row_id": row_id, "recipient_id": recipients[principal]}
+                for row_id, principal, _ in rows if principal in recipients
+            ]
+            unresolved = [row_id for row_id, principal, _ in rows if principal not in recipients]
             
+            values = {"recipient_id": bindparam("recipient_id")}
+            if is_schedule:
+                values["recipient_unresolvable"] = False
+            if resolved:
+                db.execute(
+                    model.__table__.update().where(model.id == bindparam("row_id")).values(**values),
+                    resolved
+                )
+            if is_schedule:
+                if unresolved:
+                    db.query(model).filter(model.id.in_(unresolved)).update(
+                        {model.recipient_unresolvable: True}, synchronize_session=False
+                    )
+                for row in resolved:
+                    _record_schedule_change(db, row["row_id"])
+                stats["unresolvable"] += len(unresolved)
+            stats["resolved"] += len(resolved)
+            listcache.stage(db, listcache.SCHEDULES if is_schedule else listcache.TEMPLATES, [row[0] for row in rows])
+            _bump_data_version(db, [owner_id for _, _, owner_id in rows])
             db.commit()
             
-        except Exception as e:
-            print(f"Error processing scheduled payment {payment.id}: {str(e)}")
-            db.rollback()
-    
-    return due_payments
+            if is_schedule:
+                for row in resolved:
+                    _notify_schedule_change(row["row_id"])
+            if on_batch:
+                on_batch({
+                    "resolved": len(resolved),
+                    "unresolvable": len(unresolved) if is_schedule else 0
+                })
+    return stats
 
 # NFT Receipt operations
+def _nft_receipt(tx: models.Transaction, owner_id: int, sender_principal: str, recipient_principal: str) -> models.NFTReceipt:
+    # Generate random image URL for demo
+    image_url = f"https://picsum.photos/200/300?random={tx.id}"
+    metadata = {
+        "amount": tx.amount,
+        "timestamp": tx.timestamp.timestamp(),
+        "sender": sender_principal,
+        "recipient": recipient_principal,
+        "description": tx.description,
+        "category": tx.category,
+        "blockHeight": 1000000 + tx.id,  # Mock blockchain data
+        "confirmations": 15 + (tx.id % 30)  # Mock blockchain data
+    }
+    return models.NFTReceipt(
+        transaction_id=tx.id,
+        owner_id=owner_id,
+        image_url=image_url,
+        receipt_metadata=metadata
+    )
+
 def create_nft_receipt(db: Session, transaction_id: int, owner_id: int):
     # Check if receipt already exists
     existing = db.query(models.NFTReceipt).filter(
@@ -449,34 +1092,18 @@ def create_nft_receipt(db: Session, transaction_id: int, owner_id: int):
     if existing:
         return existing
     
-    # Generate random image URL for demo
-    image_url = f"https://picsum.photos/200/300?random={transaction_id}"
-    
     # Get transaction details for metadata
     tx = get_transaction(db, transaction_id)
     if not tx:
         return None
     
-    metadata = {
-        "amount": tx.amount,
-        "timestamp": tx.timestamp.timestamp(),
-        "sender": get_user(db, tx.sender_id).principal_id,
-        "recipient": get_user(db, tx.recipient_id).principal_id,
-        "description": tx.description,
-        "category": tx.category,
-        "blockHeight": 1000000 + transaction_id,  # Mock blockchain data
-        "confirmations": 15 + (transaction_id % 30)  # Mock blockchain data
-    }
-    
     # Create NFT receipt
-    nft_receipt = models.NFTReceipt(
-        transaction_id=transaction_id,
-        owner_id=owner_id,
-        image_url=image_url,
-        receipt_metadata=metadata
+    nft_receipt = _nft_receipt(
+        tx, owner_id, get_user(db, tx.sender_id).principal_id, get_user(db, tx.recipient_id).principal_id
     )
     
     db.add(nft_receipt)
+    _bump_data_version(db, [owner_id])
     db.commit()
     db.refresh(nft_receipt)
     return nft_receipt
@@ -486,6 +1113,16 @@ def get_user_nft_receipts(db: Session, user_id: int):
         models.NFTReceipt.owner_id == user_id
     ).all()
 
+def get_user_nft_receipt_rows(db: Session, user_id: int) -> List[Dict[str, Any]]:
+    """get_user_nft_receipts projected into plain dicts, metadata passed through as stored"""
+    receipt = models.NFTReceipt
+    rows = db.query(
+        receipt.transaction_id, receipt.image_url,
+        type_coerce(receipt.receipt_metadata, Text).label("metadata"),
+        receipt.id, receipt.owner_id, receipt.created_at
+    ).filter(receipt.owner_id == user_id).order_by(receipt.id)
+    return [dict(row._mapping, metadata=_raw_json(row.metadata, {})) for row in rows]
+
 def get_nft_receipt(db: Session, receipt_id: int):
     return db.query(models.NFTReceipt).filter(
         models.NFTReceipt.id == receipt_id
@@ -598,4 +1235,51 @@ def get_spending_by_category(db: Session, user_id: int, start_date: Optional[dat
         "period": "custom",
         "start_date": start_date,
         "end_date": end_date
-    } 
\ No newline at end of file
+    } 
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    # Lower-rank percentile, matching the rank used by the sketches
+    if not sorted_values:
+        return None
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+def get_counterparty_stats(db: Session, user_id: Optional[int], start_date: datetime, end_date: datetime):
+    """Exact counterparty and payment-size statistics (scans the date range)"""
+    query = db.query(
+        models.Transaction.sender_id,
+        models.Transaction.recipient_id,
+        models.Transaction.amount
+    ).filter(
+        models.Transaction.timestamp >= start_date,
+        models.Transaction.timestamp <= end_date
+    )
+    if user_id is not None:
+        query = query.filter(
+            (models.Transaction.sender_id == user_id) | (models.Transaction.recipient_id == user_id)
+        )
+    
+    counterparties = set()
+    payers = set()
+    amounts = []
+    for sender_id, recipient_id, amount in query:
+        amounts.append(amount)
+        if user_id is None:
+            payers.add(sender_id)
+            continue
+        if sender_id == user_id:
+            counterparties.add(recipient_id)
+        if recipient_id == user_id:
+            counterparties.add(sender_id)
+            payers.add(sender_id)
+    amounts.sort()
+    
+    return {
+        "distinct_counterparties": len(counterparties) if user_id is not None else None,
+        "unique_payers": len(payers),
+        "payment_count": len(amounts),
+        "median_payment": _percentile(amounts, 0.5),
+        "p95_payment": _percentile(amounts, 0.95),
+        "approximate": False,
+        "start_date": start_date,
+        "end_date": end_date
+    }
@@ -2,9 +2,6 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 # Use environment variables for database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./paychain.db")
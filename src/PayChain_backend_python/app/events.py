@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger("events")
+
+# Event types
+PAYMENT_RECEIVED = "payment.received"
+PAYMENT_SENT = "payment.sent"
+BALANCE_CHANGED = "balance.changed"
+SCHEDULE_EXECUTED = "schedule.executed"
+
+# Events buffered per connection; a consumer that falls this far behind is dropped
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Idle streams send a keep-alive this often
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# "local" relays events between processes on this host (API workers, the
+# scheduler daemon) through datagram sockets in EVENTS_SOCKET_DIR
+EVENTS_BROKER = os.getenv("EVENTS_BROKER", "")
+EVENTS_SOCKET_DIR = os.getenv("EVENTS_SOCKET_DIR", "/tmp/paychain-events")
+
+
+class ConsumerDropped(Exception):
+    """The subscription overflowed its queue and was closed"""
+
+
+class Subscription:
+    """One connection's bounded event queue, consumed on its event loop.
+
+    Publishers run on other threads and never wait: events are handed to
+    the loop with call_soon_threadsafe, and a full queue closes the
+    subscription instead of blocking or growing.
+    """
+
+    def __init__(self, hub: "EventHub", user_id: int, maxsize: int = EVENTS_QUEUE_SIZE):
+        self.hub = hub
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.dropped = False
+        self._loop = asyncio.get_running_loop()
+        self._events = deque()
+        self._ready = asyncio.Event()
+
+    def _offer(self, event: dict):
+        # Runs on the subscription's loop
+        if self.dropped:
+            return
+        if len(self._events) >= self.maxsize:
+            self.dropped = True
+            self.hub.unsubscribe(self)
+        else:
+            self._events.append(event)
+        self._ready.set()
+
+    def offer(self, event: dict):
+        try:
+            self._loop.call_soon_threadsafe(self._offer, event)
+        except RuntimeError:
+            # Loop already closed
+            self.hub.unsubscribe(self)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next event, or None if `timeout` passes without one"""
+        while not self._events:
+            if self.dropped:
+                raise ConsumerDropped()
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Broker:
+    """Relays events between processes.
+
+    `publish` is called with the events published in this process;
+    `start` begins passing events published elsewhere to `deliver`.
+    The base class keeps events in-process.
+    """
+
+    def start(self, deliver: Callable[[dict], None]):
+        pass
+
+    def publish(self, events: List[dict]):
+        pass
+
+    def stop(self):
+        pass
+
+
+class LocalSocketBroker(Broker):
+    """Stand-in broker for a single host, without an external service.
+
+    Each listening process binds a Unix datagram socket in `directory`;
+    publishing sends each event to every other socket there. Sockets of
+    processes that exited are removed on the first failed send. Processes
+    that only publish (e.g. the scheduler) never bind one.
+    """
+
+    def __init__(self, directory: str = EVENTS_SOCKET_DIR):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._receiver: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, deliver: Callable[[dict], None]):
+        if self._receiver is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        # recv does not return when the socket is closed from another thread
+        self._receiver.settimeout(1.0)
+        self._thread = threading.Thread(
+            target=self._receive, args=(self._receiver, deliver), name="events-broker", daemon=True
+        )
+        self._thread.start()
+
+    def _receive(self, receiver: socket.socket, deliver: Callable[[dict], None]):
+        while self._receiver is receiver:
+            try:
+                data = receiver.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                return  # closed by stop()
+            try:
+                deliver(json.loads(data))
+            except Exception as e:
+                logger.error(f"Dropping malformed event from broker: {str(e)}")
+
+    def publish(self, events: List[dict]):
+        try:
+            peers = [
+                os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith(".sock")
+            ]
+        except FileNotFoundError:
+            return
+        peers = [path for path in peers if path != self.path]
+        if not peers:
+            return
+        datagrams = [json.dumps(event, default=str).encode("utf-8") for event in events]
+        for path in peers:
+            try:
+                for data in datagrams:
+                    self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody listening any more
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                # The peer's receive buffer is full; it is behind, like a slow consumer
+                logger.warning(f"Event broker peer {path} is not keeping up, events dropped")
+
+    def stop(self):
+        receiver, self._receiver = self._receiver, None
+        if receiver is not None:
+            self._thread.join()
+            receiver.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def create_broker(name: str = EVENTS_BROKER) -> Broker:
+    if name == "local":
+        return LocalSocketBroker()
+    if name:
+        raise ValueError(f"Unknown EVENTS_BROKER: {name}")
+    return Broker()
+
+
+class EventHub:
+    """In-process fan-out of per-user events to live connections"""
+
+    def __init__(self, broker: Optional[Broker] = None):
+        self.broker = broker or create_broker()
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int, maxsize: int = EVENTS_QUEUE_SIZE) -> Subscription:
+        """Must be called on the event loop that will consume the subscription"""
+        subscription = Subscription(self, user_id, maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connections(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def deliver(self, event: dict):
+        """Fan an event out to this process's subscribers of its user"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(event["user_id"], ()))
+        for subscription in subscriptions:
+            subscription.offer(event)
+
+    def publish(self, user_id: int, event_type: str, data: dict):
+        self.publish_many([(user_id, event_type, data)])
+
+    def publish_many(self, events: Iterable[tuple]):
+        """Publish (user_id, type, data) events to the users' connections in every process.
+
+        Never blocks on consumers. Call after the write is committed, so
+        clients never see an event for data they cannot read yet.
+        """
+        now = time.time()
+        events = [
+            {"user_id": user_id, "type": event_type, "data": data, "timestamp": now}
+            for user_id, event_type, data in events
+        ]
+        if not events:
+            return
+        for event in events:
+            self.deliver(event)
+        try:
+            self.broker.publish(events)
+        except Exception as e:
+            logger.error(f"Error relaying {len(events)} events: {str(e)}")
+
+    def start(self):
+        """Start receiving events published by other processes"""
+        self.broker.start(self.deliver)
+
+    def stop(self):
+        self.broker.stop()
+
+
+hub = EventHub()
@@ -0,0 +1,183 @@
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import models
+
+Frequency = models.ScheduledPaymentFrequency
+
+# Frequencies that advance by a fixed number of days or of calendar months
+DAY_STEPS = {
+    Frequency.DAILY: 1,
+    Frequency.WEEKLY: 7,
+    Frequency.BIWEEKLY: 14,
+}
+MONTH_STEPS = {
+    Frequency.MONTHLY: 1,
+    Frequency.QUARTERLY: 3,
+    Frequency.YEARLY: 12,
+}
+
+NO_LIMIT = np.iinfo(np.int64).max
+
+
+def _days_in_month(months: np.ndarray) -> np.ndarray:
+    return ((months + 1).astype("M8[D]") - months.astype("M8[D]")).astype(np.int64)
+
+
+def _expand_day_steps(first: np.ndarray, step: int, limit: np.ndarray, horizon_end: np.datetime64):
+    # Occurrences first + k*step for k < count, flattened with np.repeat
+    counts = np.maximum((horizon_end - first).astype(np.int64) // step + 1, 0)
+    counts = np.minimum(counts, limit)
+    owners = np.repeat(np.arange(len(first)), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    k = np.arange(counts.sum()) - starts
+    return owners, first[owners] + k * step
+
+
+def _expand_month_steps(first: np.ndarray, step: int, limit: np.ndarray, horizon_end: np.datetime64):
+    if len(first) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype="M8[D]")
+
+    first_months = first.astype("M8[M]")
+    anchor_day = (first - first_months.astype("M8[D]")).astype(np.int64) + 1
+    span = (horizon_end.astype("M8[M]") - first_months.min()).astype(np.int64)
+    k = np.arange(span // step + 1)
+
+    months = first_months[:, None] + k[None, :] * step
+    # crud.calculate_next_payment_date steps from the previous date, so once a
+    # short month clamps the day it stays clamped: a running minimum.
+    days = np.minimum.accumulate(np.minimum(anchor_day[:, None], _days_in_month(months)), axis=1)
+    dates = months.astype("M8[D]") + (days - 1)
+
+    valid = (dates <= horizon_end) & (k[None, :] < limit[:, None])
+    owners, _ = np.nonzero(valid)
+    return owners, dates[valid]
+
+
+def expand_occurrences(payments, start_date: date, end_date: date):
+    """Expand scheduled payments into (payment index, occurrence date) arrays.
+
+    Overdue schedules are paid on the first processing run, so their first
+    occurrence is start_date. end_date and max_payments cap each schedule.
+    """
+    horizon_end = np.datetime64(end_date, "D")
+    today = np.datetime64(start_date, "D")
+
+    frequencies = np.array([Frequency(p.frequency).value for p in payments], dtype=str)
+    first = np.array([max(p.next_payment_date, start_date) for p in payments], dtype="M8[D]")
+    limit = np.array([
+        NO_LIMIT if not p.max_payments else max(p.max_payments - (p.payments_made or 0), 0)
+        for p in payments
+    ], dtype=np.int64)
+    last = np.array([p.end_date or end_date for p in payments], dtype="M8[D]")
+    last = np.minimum(last, horizon_end)
+
+    owners, dates = [], []
+    for frequency in Frequency:
+        selected = np.flatnonzero(frequencies == frequency.value)
+        if len(selected) == 0:
+            continue
+
+        if frequency == Frequency.ONCE:
+            group_owners, group_dates = np.arange(len(selected)), first[selected]
+            keep = limit[selected] > 0
+            group_owners, group_dates = group_owners[keep], group_dates[keep]
+        elif frequency in DAY_STEPS:
+            group_owners, group_dates = _expand_day_steps(
+                first[selected], DAY_STEPS[frequency], limit[selected], horizon_end
+            )
+        else:
+            group_owners, group_dates = _expand_month_steps(
+                first[selected], MONTH_STEPS[frequency], limit[selected], horizon_end
+            )
+
+        group_owners = selected[group_owners]
+        in_range = (group_dates >= today) & (group_dates <= last[group_owners])
+        owners.append(group_owners[in_range])
+        dates.append(group_dates[in_range])
+
+    if not owners:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype="M8[D]")
+    return np.concatenate(owners), np.concatenate(dates)
+
+
+def _active_schedules(db: Session):
+    return db.query(
+        models.ScheduledPayment.id,
+        models.ScheduledPayment.user_id,
+        models.ScheduledPayment.recipient_principal,
+        models.ScheduledPayment.amount,
+        models.ScheduledPayment.frequency,
+        models.ScheduledPayment.next_payment_date,
+        models.ScheduledPayment.end_date,
+        models.ScheduledPayment.max_payments,
+        models.ScheduledPayment.payments_made
+    ).filter(
+        models.ScheduledPayment.is_active == True,
+        models.ScheduledPayment.recipient_unresolvable == False,
+        models.ScheduledPayment.next_payment_date.isnot(None)
+    )
+
+
+def forecast_cash_flow(db: Session, user: Optional[models.User], days: int, start_date: Optional[date] = None):
+    """Project scheduled payments over the next `days` days.
+
+    For a user the series includes incoming schedules and a running balance;
+    platform-wide (user None) it reports the total scheduled outflow per day.
+    """
+    start_date = start_date or date.today()
+    end_date = start_date + timedelta(days=days - 1)
+
+    query = _active_schedules(db)
+    if user is not None:
+        query = query.filter(
+            (models.ScheduledPayment.user_id == user.id) |
+            (models.ScheduledPayment.recipient_principal == user.principal_id)
+        )
+    payments = query.all()
+
+    owners, dates = expand_occurrences(payments, start_date, end_date)
+    amounts = np.array([p.amount for p in payments], dtype=np.float64)[owners]
+    offsets = (dates - np.datetime64(start_date, "D")).astype(np.int64)
+
+    user_ids = np.array([p.user_id for p in payments], dtype=np.int64)[owners]
+    recipients = np.array([p.recipient_principal for p in payments], dtype=object)[owners]
+    if user is None:
+        outgoing_mask = np.ones(len(owners), dtype=bool)
+        incoming_mask = np.zeros(len(owners), dtype=bool)
+    else:
+        outgoing_mask = user_ids == user.id
+        incoming_mask = recipients == user.principal_id
+
+    outgoing = np.bincount(offsets[outgoing_mask], weights=amounts[outgoing_mask], minlength=days)
+    incoming = np.bincount(offsets[incoming_mask], weights=amounts[incoming_mask], minlength=days)
+    counts = np.bincount(offsets[outgoing_mask], minlength=days)
+
+    starting_balance = None
+    balances = [None] * days
+    if user is not None:
+        starting_balance = user.balance or 0.0
+        balances = (starting_balance + np.cumsum(incoming - outgoing)).tolist()
+
+    series = [
+        {
+            "date": start_date + timedelta(days=offset),
+            "outgoing": float(outgoing[offset]),
+            "incoming": float(incoming[offset]),
+            "payment_count": int(counts[offset]),
+            "balance": balances[offset]
+        }
+        for offset in range(days)
+    ]
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "starting_balance": starting_balance,
+        "total_outgoing": float(outgoing.sum()),
+        "total_incoming": float(incoming.sum()),
+        "series": series
+    }
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Optional, Tuple
+
+
+def _default_workers() -> int:
+    # Every API worker process (WEB_CONCURRENCY of them under app.server) has
+    # its own pool, so each gets its share of the cores, up to 4
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    api_workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, min(4, cores // api_workers))
+
+
+# Password hashing configuration, per API worker process. HASHING_WORKERS=0
+# hashes on the calling thread.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASHING_WORKERS = int(os.getenv("HASHING_WORKERS", str(_default_workers())))
+# Requests allowed to wait for a worker before HashingBusy is raised
+HASHING_QUEUE_LIMIT = int(os.getenv("HASHING_QUEUE_LIMIT", "32"))
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """The passlib context, built on first use: importing passlib slows worker startup"""
+    from passlib.context import CryptContext
+    # Hashes created with other rounds are upgraded on the next successful login
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def __getattr__(name):
+    # `from app.hashing import pwd_context` keeps working
+    if name == "pwd_context":
+        return get_pwd_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Stored for accounts that cannot log in (e.g. placeholder recipients).
+# Never produced by bcrypt, so checking it needs no hashing at all.
+UNUSABLE_PASSWORD = "!"
+
+
+class HashingBusy(Exception):
+    """All hashing workers are busy and the wait queue is full"""
+
+
+def is_usable_password(hashed_password: Optional[str]) -> bool:
+    return bool(hashed_password) and not hashed_password.startswith(UNUSABLE_PASSWORD)
+
+
+# Run in the worker processes
+def _hash(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return get_pwd_context().verify_and_update(password, hashed_password)
+
+
+def _load_context():
+    get_pwd_context()
+
+
+class PasswordHasher:
+    """Runs bcrypt on a size-limited process pool.
+
+    At most `workers` hashes run at once and `queue_limit` more may wait;
+    beyond that submissions fail fast with HashingBusy instead of tying up
+    request threads, so a login burst cannot stall unrelated endpoints.
+    """
+
+    def __init__(self, workers: int = HASHING_WORKERS, queue_limit: int = HASHING_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._slots = threading.BoundedSemaphore(max(1, workers + queue_limit))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a process that is already running threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _submit(self, fn, *args) -> Future:
+        if self.workers <= 0:
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next request
+            self._slots.release()
+            self.shutdown()
+            raise HashingBusy()
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        try:
+            return self._submit(fn, *args).result()
+        except BrokenProcessPool:
+            self.shutdown()
+            raise HashingBusy()
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    def verify_and_update(self, password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """(matches, new hash if the stored one uses outdated parameters)"""
+        if not is_usable_password(hashed_password):
+            return False, None
+        return self._run(_verify_and_update, password, hashed_password)
+
+    def warm(self):
+        """Start the pool and load passlib in its workers ahead of the first login"""
+        if self.workers <= 0:
+            get_pwd_context()
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(_load_context) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+hasher = PasswordHasher()
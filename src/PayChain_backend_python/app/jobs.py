@@ -0,0 +1,420 @@
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel, Extra, conint, validator
+from sqlalchemy.orm import Session
+
+from app import crud, models, notifications, sketches
+from app.database import SessionLocal
+
+# Job runner configuration
+JOB_DEFAULT_WORKERS = int(os.getenv("JOB_DEFAULT_WORKERS", "1"))
+# Progress counters are written to the jobs table at most this often
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1.0"))
+# Running jobs without a heartbeat for this long are marked failed on startup
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_EXPORT_DIR = os.getenv("JOB_EXPORT_DIR", "./exports")
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "500"))
+# Upper bounds on client-supplied job params; larger worker counts are clamped
+JOB_MAX_BATCH_SIZE = int(os.getenv("JOB_MAX_BATCH_SIZE", "10000"))
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "8"))
+
+logger = logging.getLogger("jobs")
+
+FINISHED_STATUSES = (models.JobStatus.SUCCEEDED, models.JobStatus.FAILED, models.JobStatus.CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested"""
+
+
+class JobContext:
+    """Handed to a running job: its own session, progress counters and cancellation.
+
+    Counters are accumulated in memory and written to the jobs row at most
+    every JOB_PROGRESS_INTERVAL seconds, through a separate short-lived
+    session so the job's own transaction is never committed early. The same
+    write refreshes the heartbeat and reads back cancel_requested.
+    """
+
+    def __init__(self, job_id: int, db: Session, session_factory=SessionLocal):
+        self.job_id = job_id
+        self.db = db
+        self.session_factory = session_factory
+        self.counters: Dict[str, Any] = {}
+        self._cancelled = False
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def progress(self, **counters):
+        """Add to the job's counters; safe to call from several threads"""
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            due = time.monotonic() - self._last_flush >= JOB_PROGRESS_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counters = dict(self.counters)
+            self._last_flush = time.monotonic()
+        db = self.session_factory()
+        try:
+            job = db.query(models.Job).filter(models.Job.id == self.job_id).first()
+            if job is None:
+                self._cancelled = True
+                return
+            job.progress = counters
+            job.heartbeat_at = datetime.utcnow()
+            self._cancelled = self._cancelled or job.cancel_requested
+            db.commit()
+        finally:
+            db.close()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was seen at the last progress write"""
+        if self._cancelled:
+            raise JobCancelled()
+
+
+class JobParams(BaseModel):
+    """Params of a job type; unknown keys are rejected"""
+
+    class Config:
+        extra = Extra.forbid
+
+
+BatchSize = conint(ge=1, le=JOB_MAX_BATCH_SIZE)
+
+
+class JobType:
+    def __init__(self, name: str, handler: Callable, params: Type[JobParams], workers: int):
+        self.name = name
+        self.handler = handler
+        self.params = params
+        # JOB_WORKERS_<NAME> overrides the registered worker count
+        self.workers = int(os.getenv(f"JOB_WORKERS_{name.upper()}", str(workers)))
+
+
+class JobManager:
+    """Runs persisted jobs on one thread pool per job type.
+
+    Jobs are rows in the jobs table. A worker claims a job by moving it from
+    queued to running with a conditional UPDATE, so when several API
+    processes share the database each job still runs once.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.job_types: Dict[str, JobType] = {}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, params: Type[JobParams] = JobParams, workers: int = JOB_DEFAULT_WORKERS):
+        """Decorator registering handler(ctx, **params) as a job type.
+
+        The handler is called with the fields the client set in params,
+        validated by the params model.
+        """
+        def decorator(handler):
+            self.job_types[name] = JobType(name, handler, params, workers)
+            return handler
+        return decorator
+
+    def validate_params(self, job_type: str, params: Optional[dict]) -> dict:
+        """The params as stored on the job; raises pydantic.ValidationError"""
+        model = self.job_types[job_type].params(**(params or {}))
+        return json.loads(model.json(exclude_unset=True))
+
+    def _executor(self, job_type: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(job_type)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.job_types[job_type].workers),
+                    thread_name_prefix=f"job-{job_type}"
+                )
+                self._executors[job_type] = executor
+            return executor
+
+    def submit(self, db: Session, job_type: str, params: Optional[dict] = None, user_id: Optional[int] = None) -> models.Job:
+        if job_type not in self.job_types:
+            raise ValueError(f"Unknown job type: {job_type}")
+        params = self.validate_params(job_type, params)
+        job = models.Job(job_type=job_type, params=params, progress={}, created_by=user_id)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._executor(job_type).submit(self._run, job.id)
+        return job
+
+    def cancel(self, db: Session, job_id: int) -> Optional[models.Job]:
+        """Request cancellation; queued jobs are cancelled immediately"""
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+        job.cancel_requested = True
+        db.query(models.Job).filter(
+            models.Job.id == job_id,
+            models.Job.status == models.JobStatus.QUEUED
+        ).update({
+            models.Job.status: models.JobStatus.CANCELLED,
+            models.Job.finished_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def _claim(self, db: Session, job_id: int) -> bool:
+        now = datetime.utcnow()
+        claimed = db.query(models.Job).filter(
+            models.Job.id == job_id,
+            models.Job.status == models.JobStatus.QUEUED
+        ).update({
+            models.Job.status: models.JobStatus.RUNNING,
+            models.Job.started_at: now,
+            models.Job.heartbeat_at: now
+        }, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+
+    def _finish(self, db: Session, job_id: int, status: models.JobStatus, ctx: JobContext,
+                result: Optional[dict] = None, error: Optional[str] = None):
+        db.rollback()
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        job.status = status
+        job.progress = dict(ctx.counters)
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        db.commit()
+
+    def _run(self, job_id: int):
+        db = self.session_factory()
+        try:
+            if not self._claim(db, job_id):
+                return  # cancelled while queued, or claimed by another process
+            job = db.query(models.Job).filter(models.Job.id == job_id).first()
+            job_type = self.job_types[job.job_type]
+
+            ctx = JobContext(job_id, db, self.session_factory)
+            try:
+                # Validated again: queued rows may predate the current params model
+                params = job_type.params(**(job.params or {}))
+                result = job_type.handler(ctx, **params.dict(exclude_unset=True))
+            except JobCancelled:
+                self._finish(db, job_id, models.JobStatus.CANCELLED, ctx)
+            except Exception as e:
+                logger.exception(f"Job {job_id} ({job.job_type}) failed")
+                self._finish(db, job_id, models.JobStatus.FAILED, ctx, error=str(e) or type(e).__name__)
+            else:
+                self._finish(db, job_id, models.JobStatus.SUCCEEDED, ctx, result=result)
+        finally:
+            db.close()
+
+    def recover(self):
+        """Fail jobs orphaned by a dead process and resubmit queued ones"""
+        db = self.session_factory()
+        try:
+            stale = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+            db.query(models.Job).filter(
+                models.Job.status == models.JobStatus.RUNNING,
+                models.Job.heartbeat_at < stale
+            ).update({
+                models.Job.status: models.JobStatus.FAILED,
+                models.Job.error: "Interrupted before completion",
+                models.Job.finished_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+
+            queued = db.query(models.Job.id, models.Job.job_type).filter(
+                models.Job.status == models.JobStatus.QUEUED
+            ).order_by(models.Job.id).all()
+            for job_id, job_type in queued:
+                if job_type in self.job_types:
+                    self._executor(job_type).submit(self._run, job_id)
+        finally:
+            db.close()
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for executor in executors:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+manager = JobManager()
+
+
+def get_job(db: Session, job_id: int):
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+
+def get_jobs(db: Session, job_type: Optional[str] = None, limit: int = 50):
+    query = db.query(models.Job)
+    if job_type:
+        query = query.filter(models.Job.job_type == job_type)
+    return query.order_by(models.Job.id.desc()).limit(limit).all()
+
+
+# Job types
+def _chunk_progress(ctx: JobContext):
+    def on_chunk(counters):
+        ctx.progress(**counters)
+        ctx.check_cancelled()
+    return on_chunk
+
+
+class ProcessScheduledPaymentsParams(JobParams):
+    current_date: Optional[date] = None
+    chunk_size: BatchSize = crud.SCHEDULER_CHUNK_SIZE
+    workers: conint(ge=1) = crud.SCHEDULER_WORKERS
+
+    @validator("workers")
+    def clamp_workers(cls, value):
+        # Each worker holds a thread and a database connection
+        return min(value, JOB_MAX_WORKERS)
+
+
+@manager.register("process_scheduled_payments", params=ProcessScheduledPaymentsParams)
+def process_scheduled_payments_job(ctx: JobContext, current_date: Optional[date] = None,
+                                   chunk_size: int = crud.SCHEDULER_CHUNK_SIZE,
+                                   workers: int = crud.SCHEDULER_WORKERS):
+    return crud.process_scheduled_payments(
+        ctx.db,
+        current_date or date.today(),
+        chunk_size=chunk_size,
+        workers=workers,
+        session_factory=ctx.session_factory,
+        on_chunk=_chunk_progress(ctx)
+    )
+
+
+class BatchParams(JobParams):
+    batch_size: BatchSize = JOB_BATCH_SIZE
+
+
+@manager.register("resolve_recipients", params=BatchParams)
+def resolve_recipients_job(ctx: JobContext, batch_size: int = JOB_BATCH_SIZE):
+    return crud.resolve_payment_recipients(ctx.db, batch_size=batch_size, on_batch=_chunk_progress(ctx))
+
+
+@manager.register("refresh_analytics_snapshot")
+def refresh_analytics_snapshot_job(ctx: JobContext):
+    from app import analytics  # numpy; not needed at startup
+    added = analytics.snapshot.refresh(ctx.db)
+    return {"rows_added": added, "row_count": analytics.snapshot.row_count}
+
+
+class SweepNotificationsParams(JobParams):
+    retention_days: conint(ge=1) = notifications.NOTIFICATION_RETENTION_DAYS
+    batch_size: BatchSize = notifications.NOTIFICATION_SWEEP_BATCH
+
+
+@manager.register("sweep_notifications", params=SweepNotificationsParams)
+def sweep_notifications_job(ctx: JobContext, retention_days: int = notifications.NOTIFICATION_RETENTION_DAYS,
+                            batch_size: int = notifications.NOTIFICATION_SWEEP_BATCH):
+    return notifications.sweep_notifications(
+        ctx.db, retention_days=retention_days, batch_size=batch_size, on_batch=_chunk_progress(ctx)
+    )
+
+
+class PruneSketchesParams(JobParams):
+    retention_days: conint(ge=1) = sketches.SKETCH_RETENTION_DAYS
+    batch_size: BatchSize = sketches.SKETCH_PRUNE_BATCH
+
+
+@manager.register("prune_sketches", params=PruneSketchesParams)
+def prune_sketches_job(ctx: JobContext, retention_days: int = sketches.SKETCH_RETENTION_DAYS,
+                       batch_size: int = sketches.SKETCH_PRUNE_BATCH):
+    return sketches.prune_sketches(
+        ctx.db, retention_days=retention_days, batch_size=batch_size, on_batch=_chunk_progress(ctx)
+    )
+
+
+class UserBatchParams(BatchParams):
+    user_id: Optional[conint(ge=1)] = None
+
+
+@manager.register("mint_nft_receipts", params=UserBatchParams)
+def mint_nft_receipts_job(ctx: JobContext, user_id: Optional[int] = None, batch_size: int = JOB_BATCH_SIZE):
+    """Create receipts for completed transactions that do not have one yet"""
+    db = ctx.db
+    last_id = 0
+    while True:
+        query = db.query(models.Transaction.id, models.Transaction.recipient_id).outerjoin(
+            models.NFTReceipt, models.NFTReceipt.transaction_id == models.Transaction.id
+        ).filter(
+            models.NFTReceipt.id.is_(None),
+            models.Transaction.status == models.TransactionStatus.COMPLETED,
+            models.Transaction.id > last_id
+        )
+        if user_id is not None:
+            query = query.filter(models.Transaction.recipient_id == user_id)
+        batch = query.order_by(models.Transaction.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        for transaction_id, recipient_id in batch:
+            crud.create_nft_receipt(db, transaction_id=transaction_id, owner_id=recipient_id)
+        ctx.progress(minted=len(batch))
+        ctx.check_cancelled()
+    return {"minted": ctx.counters.get("minted", 0)}
+
+
+@manager.register("export_transactions", params=UserBatchParams)
+def export_transactions_job(ctx: JobContext, user_id: Optional[int] = None, batch_size: int = JOB_BATCH_SIZE):
+    """Write transactions (optionally one user's) to a CSV file under JOB_EXPORT_DIR"""
+    os.makedirs(JOB_EXPORT_DIR, exist_ok=True)
+    path = os.path.join(JOB_EXPORT_DIR, f"transactions-job-{ctx.job_id}.csv")
+    columns = [
+        models.Transaction.id,
+        models.Transaction.timestamp,
+        models.Transaction.sender_id,
+        models.Transaction.recipient_id,
+        models.Transaction.amount,
+        models.Transaction.status,
+        models.Transaction.category,
+        models.Transaction.description
+    ]
+    query = ctx.db.query(*columns)
+    if user_id is not None:
+        query = query.filter(
+            (models.Transaction.sender_id == user_id) | (models.Transaction.recipient_id == user_id)
+        )
+
+    try:
+        _write_transactions_csv(ctx, path, query, columns, batch_size)
+    except JobCancelled:
+        os.remove(path)
+        raise
+    return {"path": path, "rows": ctx.counters.get("rows", 0)}
+
+
+def _write_transactions_csv(ctx: JobContext, path: str, query, columns, batch_size: int):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([column.key for column in columns])
+        last_id = 0
+        while True:
+            batch = query.filter(models.Transaction.id > last_id).order_by(
+                models.Transaction.id
+            ).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            for row in batch:
+                writer.writerow([
+                    value.value if isinstance(value, models.TransactionStatus) else value
+                    for value in row
+                ])
+            ctx.progress(rows=len(batch))
+            ctx.check_cancelled()
@@ -0,0 +1,227 @@
+"""Per-user cache of the materialized template and scheduled payment lists.
+
+Entries are labelled with the user's data_version, the counter behind the
+per-user ETags that every write touching the user's data bumps. A lookup
+hits only when the label equals the version the request just read, so
+writes made by other processes turn entries into misses and the cache is
+never served stale.
+
+Writes in this process update entries instead of dropping them: crud records
+each data_version bump (record_bump) and each template or schedule it
+changes (stage). Before the commit, the staged rows of cached users are
+re-read inside the writing transaction together with the bumped versions;
+after the commit they are patched into the cached lists and the labels
+advanced. A write that touches neither list and bumps each user once (a
+payment, say) just advances the label, without reading anything back. Any
+mismatch, such as a bump made by another process in between, drops the
+entry, or for an unread advance leaves its label behind the committed
+version, so it only misses until the next read replaces it.
+
+Memory is bounded by USER_LIST_CACHE_ROWS cached rows in total, evicting
+least recently used users first.
+"""
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Rows (templates, their conditions and scheduled payments) kept in total; 0 disables
+USER_LIST_CACHE_ROWS = int(os.getenv("USER_LIST_CACHE_ROWS", "200000"))
+
+TEMPLATES = "templates"
+SCHEDULES = "schedules"
+# Key of each row's owning user
+_OWNER_KEYS = {TEMPLATES: "owner_id", SCHEDULES: "user_id"}
+
+# Session.info keys of the current transaction's bumps and staged row ids
+_BUMPS = "listcache_bumps"
+_STAGED = "listcache_staged"
+_PENDING = "listcache_pending"
+
+
+def _row_count(kind: str, rows: List[dict]) -> int:
+    if kind == TEMPLATES:
+        return sum(1 + len(row["conditions"]) for row in rows)
+    return len(rows)
+
+
+class _Entry:
+    __slots__ = ("version", "lists", "rows")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.lists: Dict[str, List[dict]] = {}
+        self.rows = 0
+
+
+class UserListCache:
+    """user id -> lists labelled with a data_version, least recently used first.
+
+    Cached lists are shared between requests and never mutated; patches
+    replace them with new lists.
+    """
+
+    def __init__(self, max_rows: int = USER_LIST_CACHE_ROWS):
+        self.max_rows = max_rows
+        # kind -> callable(db, row ids, owner ids) returning fresh rows
+        self.loaders: Dict[str, Callable] = {}
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, kind: str, version: int) -> Optional[List[dict]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.version == version and kind in entry.lists:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry.lists[kind]
+            self.misses += 1
+            return None
+
+    def put(self, user_id: int, kind: str, version: int, rows: List[dict]):
+        """Store a list read at `version`; never replaces a newer entry"""
+        if self.max_rows <= 0:
+            return
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.version > version:
+                return
+            if entry is None or entry.version < version:
+                self._drop(user_id)
+                entry = self._entries[user_id] = _Entry(version)
+            self._set(entry, kind, rows)
+            self._entries.move_to_end(user_id)
+            self._evict()
+
+    def cached_users(self, user_ids: Iterable[int]) -> List[int]:
+        with self._lock:
+            return [user_id for user_id in user_ids if user_id in self._entries]
+
+    def advance(self, user_id: int, bumps: int, version: Optional[int], changed: Dict[str, tuple]):
+        """Apply a committed write that took the user from version - bumps to version.
+
+        changed maps a kind to (staged row ids, their rows after the write);
+        staged ids without a row were deleted. version is None when it was
+        not read back: versions only grow, so the advanced label can never
+        match a version that includes another write.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if version is None:
+                version = entry.version + bumps
+            if entry.version + bumps != version:
+                # Another write came in between; the next read reloads
+                self._drop(user_id)
+                return
+            entry.version = version
+            for kind, (ids, rows) in changed.items():
+                current = entry.lists.get(kind)
+                if current is None:
+                    continue
+                patched = [row for row in current if row["id"] not in ids] + rows
+                patched.sort(key=lambda row: row["id"])
+                self._set(entry, kind, patched)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def render(self) -> str:
+        """Prometheus text lines, appended to GET /metrics"""
+        with self._lock:
+            values = [
+                ("paychain_list_cache_users", "gauge", "Users with cached lists", len(self._entries)),
+                ("paychain_list_cache_rows", "gauge", "Cached list rows", self._rows),
+                ("paychain_list_cache_hits_total", "counter", "List reads served from the cache", self.hits),
+                ("paychain_list_cache_misses_total", "counter", "List reads that queried the database", self.misses),
+            ]
+        lines = []
+        for name, kind, description, value in values:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    # Called with the lock held
+    def _set(self, entry: _Entry, kind: str, rows: List[dict]):
+        size = _row_count(kind, rows)
+        if kind in entry.lists:
+            size -= _row_count(kind, entry.lists[kind])
+        entry.lists[kind] = rows
+        entry.rows += size
+        self._rows += size
+
+    def _drop(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._rows -= entry.rows
+
+    def _evict(self):
+        while self._rows > self.max_rows and self._entries:
+            self._drop(next(iter(self._entries)))
+
+
+# Shared per-process cache
+cache = UserListCache()
+
+
+def record_bump(db: Session, user_ids: Iterable[int]):
+    """Note data_version bumps made in the session's current transaction"""
+    db.info.setdefault(_BUMPS, Counter()).update(user_ids)
+
+
+def stage(db: Session, kind: str, row_ids: Iterable[int]):
+    """Note templates or scheduled payments written in the current transaction"""
+    db.info.setdefault(_STAGED, {}).setdefault(kind, set()).update(row_ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _read_committed_state(session: Session):
+    bumps = session.info.pop(_BUMPS, None)
+    staged = session.info.pop(_STAGED, {})
+    if not bumps:
+        return
+    user_ids = cache.cached_users(bumps)
+    if not user_ids:
+        return
+    if not staged and all(bumps[user_id] == 1 for user_id in user_ids):
+        # Nothing to patch; advance the labels without a flush or a query
+        session.info[_PENDING] = [(user_id, 1, None, {}) for user_id in user_ids]
+        return
+
+    session.flush()
+    # The bumps hold write locks on these users' rows until commit, so the
+    # versions and rows read here are exactly what the commit publishes
+    versions = dict(session.query(models.User.id, models.User.data_version).filter(models.User.id.in_(user_ids)))
+    changed = {user_id: {} for user_id in user_ids}
+    for kind, ids in staged.items():
+        owner_key = _OWNER_KEYS[kind]
+        rows = cache.loaders[kind](session, ids, user_ids)
+        for user_id in user_ids:
+            changed[user_id][kind] = (ids, [row for row in rows if row[owner_key] == user_id])
+    session.info[_PENDING] = [
+        (user_id, bumps[user_id], versions[user_id], changed[user_id])
+        for user_id in user_ids if user_id in versions
+    ]
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_state(session: Session):
+    for user_id, bumps, version, changed in session.info.pop(_PENDING, ()):
+        cache.advance(user_id, bumps, version, changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_staged_state(session: Session):
+    for key in (_BUMPS, _STAGED, _PENDING):
+        session.info.pop(key, None)
@@ -1,24 +1,36 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Request, status, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import uvicorn
+import asyncio
+import hashlib
+import json
 from datetime import datetime, timedelta, date
+from urllib.parse import urlencode
 
-from app import models, schemas, crud, auth
-from app.database import engine, get_db
-from app.auth import get_current_user, create_access_token
+from app import models, schemas, crud, auth, sketches, jobs, hashing, ratelimit, events, notifications, profiling, migrations, readiness, listcache, rules
+from app.fastjson import RowsResponse
+from app.database import engine, get_db, SessionLocal
+from app.auth import get_current_user, get_current_admin_user, create_access_token
 from app.models import TransactionStatus
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="PayChain API",
     description="FastAPI backend for PayChain application",
     version="1.0.0"
 )
 
+# Per-route latency, SQL statement counts and response sizes (GET /metrics).
+# Added first, so it sits next to the router and times the route itself.
+profiling.instrument(engine)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Per-client token buckets by route class, and load shedding under pressure.
+# Added before CORS so rejected responses still carry CORS headers.
+app.add_middleware(ratelimit.RateLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -28,13 +40,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Schema migrations (app.migrations) are checked on startup rather than at
+# import, before anything below touches the database
+@app.on_event("startup")
+def check_schema():
+    migrations.ensure_schema(engine)
+
+# Readiness (GET /ready): warm up before the worker accepts traffic, and stop
+# advertising readiness as soon as shutdown begins
+@app.on_event("startup")
+def warm_up():
+    readiness.warm_up()
+
+@app.on_event("shutdown")
+def start_draining():
+    readiness.state.start_draining()
+
+# Background jobs: resume queued jobs left by a previous process
+@app.on_event("startup")
+def start_jobs():
+    jobs.manager.recover()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    jobs.manager.shutdown()
+    hashing.hasher.shutdown()
+
+@app.on_event("startup")
+async def start_load_monitor():
+    ratelimit.monitor.start()
+
+@app.on_event("shutdown")
+def stop_load_monitor():
+    ratelimit.monitor.stop()
+
+# Live events published by other workers and the scheduler (EVENTS_BROKER)
+@app.on_event("startup")
+def start_event_hub():
+    events.hub.start()
+
+@app.on_event("shutdown")
+def stop_event_hub():
+    events.hub.stop()
+
+# Password hashing pool saturated: shed the request instead of queueing it
+@app.exception_handler(hashing.HashingBusy)
+def hashing_busy_handler(request: Request, exc: hashing.HashingBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+
+# Conditional GETs for per-user resources. The weak ETag combines the user id
+# with their data version, which every write touching their data bumps, so
+# answering 304 costs one primary-key lookup and no list query. Query
+# parameters (pages, date filters) are part of the tag, so one page cannot
+# revalidate another.
+def _user_etag(request: Request, db: Session, user_id: int) -> str:
+    return _version_etag(request, user_id, crud.get_user_data_version(db, user_id))
+
+def _version_etag(request: Request, user_id: int, data_version: int) -> str:
+    if not request.query_params:
+        return f'W/"{user_id}-{data_version}"'
+    # Canonical order, so ?limit=10&skip=20 and ?skip=20&limit=10 share a tag
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f'W/"{user_id}-{data_version}-{hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]}"'
+
+def _etag_headers(etag: str) -> dict:
+    # Browsers revalidate on every poll instead of serving stale data
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    # Weak comparison: the W/ prefix is ignored on both sides
+    tags = {tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")}
+    if "*" in tags or etag.replace("W/", "", 1) in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+    return None
+
 # User endpoints
+# Signup and login run in the threadpool: their queries and commits are
+# blocking, and bcrypt itself runs on the hashing pool (app.hashing)
 @app.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = auth.get_password_hash(user.password)
+    return crud.create_user(db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/login/", response_model=schemas.Token)
 def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
@@ -49,8 +145,9 @@ def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me/", response_model=schemas.User)
-def read_users_me(current_user: schemas.User = Depends(get_current_user)):
-    return current_user
+def read_users_me(current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # current_user may be a cached snapshot; return the current balance
+    return crud.get_user(db, current_user.id)
 
 @app.put("/users/me/", response_model=schemas.User)
 def update_user(
@@ -75,6 +172,7 @@ def create_transaction(
 
 @app.get("/transactions/", response_model=List[schemas.Transaction])
 def read_transactions(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     start_date: Optional[datetime] = None,
@@ -82,7 +180,13 @@ def read_transactions(
     current_user: schemas.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    transactions = crud.get_user_transactions(
+    etag = _user_etag(request, db, current_user.id)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    # List endpoints project rows straight to JSON; response_model documents the shape
+    transactions = crud.get_user_transaction_rows(
         db, 
         user_id=current_user.id, 
         skip=skip, 
@@ -90,7 +194,7 @@ def read_transactions(
         start_date=start_date,
         end_date=end_date
     )
-    return transactions
+    return RowsResponse(transactions, headers=_etag_headers(etag))
 
 @app.get("/transactions/{transaction_id}", response_model=schemas.Transaction)
 def read_transaction(
@@ -109,9 +213,14 @@ def read_transaction(
     return transaction
 
 @app.get("/balance/")
-def get_balance(current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_balance(request: Request, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    etag = _user_etag(request, db, current_user.id)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
     balance = crud.get_user_balance(db, user_id=current_user.id)
-    return {"balance": balance}
+    return JSONResponse({"balance": balance}, headers=_etag_headers(etag))
 
 # Templates endpoints
 @app.post("/templates/", response_model=schemas.PaymentTemplate)
@@ -124,11 +233,44 @@ def create_template(
 
 @app.get("/templates/", response_model=List[schemas.PaymentTemplate])
 def read_templates(
+    request: Request,
     current_user: schemas.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    templates = crud.get_user_templates(db, user_id=current_user.id)
-    return templates
+    # The data version also labels the per-user list cache (app.listcache)
+    data_version = crud.get_user_data_version(db, current_user.id)
+    etag = _version_etag(request, current_user.id, data_version)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    templates = crud.get_user_template_rows(db, user_id=current_user.id, data_version=data_version)
+    return RowsResponse(templates, headers=_etag_headers(etag))
+
+@app.post("/templates/evaluate", response_model=schemas.TemplateEvaluation)
+def evaluate_templates(
+    evaluation: schemas.TemplateEvaluationRequest,
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Compiled rule sets follow the cached template list (app.rules)
+    data_version = crud.get_user_data_version(db, current_user.id)
+    templates = crud.get_user_template_rows(db, user_id=current_user.id, data_version=data_version)
+    rule_set = rules.engine.rules_for(current_user.id, templates)
+
+    candidates = [
+        rules.Candidate(tx.amount, tx.category, tx.tags, tx.metadata, tx.timestamp)
+        for tx in evaluation.transactions
+    ]
+    matches, checked = rule_set.match_many(candidates)
+    return {
+        "matches": matches,
+        "templates": len(rule_set.templates),
+        "candidates_checked": checked,
+        "invalid_templates": [
+            {"template_id": template_id, "detail": detail} for template_id, detail in rule_set.invalid()
+        ]
+    }
 
 @app.get("/templates/{template_id}", response_model=schemas.PaymentTemplate)
 def read_template(
@@ -168,22 +310,22 @@ def delete_template(
     return {"detail": "Template deleted successfully"}
 
 # Analytics and reporting endpoints
+def _period_start(period: str) -> datetime:
+    today = datetime.utcnow()
+    if period == "week":
+        return today - timedelta(days=7)
+    elif period == "month":
+        return today - timedelta(days=30)
+    return today - timedelta(days=365)
+
 @app.get("/reports/transaction-summary/")
 def get_transaction_summary(
     period: str = Query("month", enum=["week", "month", "year"]),
     current_user: schemas.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    today = datetime.utcnow()
-    
-    if period == "week":
-        start_date = today - timedelta(days=7)
-    elif period == "month":
-        start_date = today - timedelta(days=30)
-    else:  # year
-        start_date = today - timedelta(days=365)
-    
-    report = crud.generate_transaction_report(db, user_id=current_user.id, start_date=start_date)
+    # Always exact: the sketches keep no sums or sent/received split
+    report = crud.generate_transaction_report(db, user_id=current_user.id, start_date=_period_start(period))
     return report
 
 @app.get("/reports/spending-categories/")
@@ -192,25 +334,35 @@ def get_spending_categories(
     current_user: schemas.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    today = datetime.utcnow()
-    
-    if period == "week":
-        start_date = today - timedelta(days=7)
-    elif period == "month":
-        start_date = today - timedelta(days=30)
-    else:  # year
-        start_date = today - timedelta(days=365)
-    
-    categories = crud.get_spending_by_category(db, user_id=current_user.id, start_date=start_date)
+    # Always exact: there are no per-category sketches
+    categories = crud.get_spending_by_category(db, user_id=current_user.id, start_date=_period_start(period))
     return {"categories": categories}
 
+@app.get("/reports/counterparty-stats/", response_model=schemas.CounterpartyStats)
+def get_counterparty_stats(
+    period: str = Query("month", enum=["week", "month", "year"]),
+    approx: bool = False,
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    start_date, end_date = _period_start(period), datetime.utcnow()
+    if approx:
+        return sketches.get_approx_counterparty_stats(db, current_user.id, start_date, end_date)
+    return crud.get_counterparty_stats(db, current_user.id, start_date, end_date)
+
 # NFT Receipt endpoints
 @app.get("/nft-receipts/", response_model=List[schemas.NFTReceipt])
 def get_nft_receipts(
+    request: Request,
     current_user: schemas.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    return crud.get_user_nft_receipts(db, user_id=current_user.id)
+    etag = _user_etag(request, db, current_user.id)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    return RowsResponse(crud.get_user_nft_receipt_rows(db, user_id=current_user.id), headers=_etag_headers(etag))
 
 @app.get("/nft-receipts/{receipt_id}", response_model=schemas.NFTReceipt)
 def get_nft_receipt(
@@ -260,10 +412,28 @@ def create_scheduled_payment(
 
 @app.get("/scheduled-payments/", response_model=List[schemas.ScheduledPayment])
 def read_scheduled_payments(
+    request: Request,
     current_user: schemas.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    return crud.get_user_scheduled_payments(db, user_id=current_user.id)
+    data_version = crud.get_user_data_version(db, current_user.id)
+    etag = _version_etag(request, current_user.id, data_version)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    payments = crud.get_user_scheduled_payment_rows(db, user_id=current_user.id, data_version=data_version)
+    return RowsResponse(payments, headers=_etag_headers(etag))
+
+@app.get("/scheduled-payments/forecast", response_model=schemas.CashFlowForecast)
+def forecast_scheduled_payments(
+    days: int = Query(90, ge=1, le=1095),
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # app.forecast uses numpy; imported on first use like app.analytics below
+    from app import forecast
+    return forecast.forecast_cash_flow(db, crud.get_user(db, current_user.id), days)
 
 @app.delete("/scheduled-payments/{payment_id}")
 def delete_scheduled_payment(
@@ -278,33 +448,288 @@ def delete_scheduled_payment(
     crud.delete_scheduled_payment(db, payment_id=payment_id)
     return {"detail": "Scheduled payment deleted successfully"}
 
+# Notification endpoints
+@app.get("/notifications/", response_model=schemas.NotificationList)
+def read_notifications(
+    skip: int = 0,
+    limit: int = Query(20, le=100),
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    return {
+        "items": notifications.get_notifications(db, current_user.id, skip=skip, limit=limit),
+        "unread_count": notifications.get_unread_count(db, current_user.id)
+    }
+
+@app.get("/notifications/unread-count", response_model=schemas.UnreadCount)
+def read_unread_notification_count(
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    return {"count": notifications.get_unread_count(db, current_user.id)}
+
+@app.put("/notifications/read-all")
+def mark_all_notifications_read(
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    return {"success": True, "updated": notifications.mark_all_read(db, current_user.id)}
+
+@app.put("/notifications/{notification_id}/read")
+def mark_notification_read(
+    notification_id: int,
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not notifications.mark_read(db, current_user.id, notification_id):
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return {"success": True}
+
+# Live events
+async def _stream_user(headers, token: Optional[str]):
+    # EventSource and browser WebSockets cannot set headers, so ?token= works too.
+    # Streams outlive request dependencies: use a session only for the lookup.
+    authorization = headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    db = SessionLocal()
+    try:
+        return await get_current_user(token or "", db)
+    finally:
+        db.close()
+
+def _event_message(event: dict) -> dict:
+    return {"type": event["type"], "data": event["data"], "timestamp": event["timestamp"]}
+
+async def _server_sent_events(subscription: events.Subscription):
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await subscription.get(timeout=events.EVENTS_HEARTBEAT_SECONDS)
+            except events.ConsumerDropped:
+                # Too far behind: the client reconnects and refetches its data
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(_event_message(event))}\n\n"
+    finally:
+        subscription.close()
+
+@app.get("/events")
+async def stream_events(request: Request, token: Optional[str] = None):
+    user = await _stream_user(request.headers, token)
+    return StreamingResponse(
+        _server_sent_events(events.hub.subscribe(user.id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/events/ws")
+async def stream_events_websocket(websocket: WebSocket, token: Optional[str] = None):
+    try:
+        user = await _stream_user(websocket.headers, token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    subscription = events.hub.subscribe(user.id)
+
+    async def send_events():
+        while True:
+            try:
+                event = await subscription.get(timeout=events.EVENTS_HEARTBEAT_SECONDS)
+            except events.ConsumerDropped:
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+            if event is None:
+                await websocket.send_json({"type": "ping"})
+                continue
+            await websocket.send_json(_event_message(event))
+
+    async def wait_for_disconnect():
+        # Clients only listen; without reading, a disconnect would go
+        # unnoticed until the next send
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(send_events()), asyncio.ensure_future(wait_for_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            try:
+                task.result()
+            except WebSocketDisconnect:
+                pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
+
+# Prometheus metrics of this process
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(
+        profiling.registry.render() + listcache.cache.render(), media_type="text/plain; version=0.0.4"
+    )
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
 
+# Readiness check: 503 while warming up or draining (app.readiness)
+@app.get("/ready")
+def readiness_check():
+    return JSONResponse(readiness.state.status(), status_code=200 if readiness.state.ready else 503)
+
 # Admin endpoints (protected)
 @app.post("/admin/process-scheduled-payments")
 def trigger_scheduled_payments(
-    background_tasks: BackgroundTasks,
-    current_user: schemas.User = Depends(get_current_user),
+    current_user: schemas.User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    # Check if user has admin privileges (for simplicity, we'll just check by email)
-    if not current_user.email.endswith("@admin.com"):
-        raise HTTPException(
-            status_code=403,
-            detail="You don't have permission to access this endpoint"
-        )
-    
-    # Process scheduled payments in the background
-    def process():
-        today = date.today()
-        crud.process_scheduled_payments(db, today)
-    
-    background_tasks.add_task(process)
-    
-    return {"message": "Scheduled payments processing triggered"}
+    # Runs as a background job with its own sessions; poll GET /admin/jobs/{job_id}
+    job = jobs.manager.submit(db, "process_scheduled_payments", user_id=current_user.id)
+    return {"message": "Scheduled payments processing triggered", "job_id": job.id}
+
+# Background job endpoints
+@app.post("/admin/jobs/", response_model=schemas.Job)
+def create_job(
+    job: schemas.JobCreate,
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    if job.job_type not in jobs.manager.job_types:
+        raise HTTPException(status_code=400, detail=f"Unknown job type: {job.job_type}")
+    try:
+        return jobs.manager.submit(db, job.job_type, job.params, user_id=current_user.id)
+    except ValidationError as e:
+        # Shaped like FastAPI's own request validation errors
+        errors = [{**error, "loc": ("body", "params") + tuple(error["loc"])} for error in e.errors()]
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+
+@app.get("/admin/jobs/", response_model=List[schemas.Job])
+def read_jobs(
+    job_type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    return jobs.get_jobs(db, job_type=job_type, limit=limit)
+
+@app.get("/admin/jobs/{job_id}", response_model=schemas.Job)
+def read_job(
+    job_id: int,
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/admin/jobs/{job_id}/cancel", response_model=schemas.Job)
+def cancel_job(
+    job_id: int,
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    job = jobs.manager.cancel(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/admin/scheduled-payments/forecast", response_model=schemas.CashFlowForecast)
+def forecast_platform_scheduled_payments(
+    days: int = Query(90, ge=1, le=1095),
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    from app import forecast
+    return forecast.forecast_cash_flow(db, None, days)
+
+# Platform-wide analytics, answered from the columnar snapshot. app.analytics
+# pulls in numpy, so it is imported on first use rather than at worker startup.
+@app.get("/admin/analytics/daily-volume")
+def get_platform_daily_volume(
+    period: str = Query("month", enum=["week", "month", "year"]),
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    from app import analytics
+    snapshot = analytics.get_snapshot(db)
+    return {
+        "period": period,
+        "days": snapshot.daily_volume(_period_start(period), datetime.utcnow())
+    }
+
+@app.get("/admin/analytics/category-share")
+def get_platform_category_share(
+    period: str = Query("month", enum=["week", "month", "year"]),
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    from app import analytics
+    snapshot = analytics.get_snapshot(db)
+    share = snapshot.category_share(_period_start(period), datetime.utcnow())
+    share["period"] = period
+    return share
+
+@app.get("/admin/analytics/active-users")
+def get_platform_active_users(
+    period: str = Query("month", enum=["week", "month", "year"]),
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    from app import analytics
+    snapshot = analytics.get_snapshot(db)
+    return {
+        "period": period,
+        "active_users": snapshot.active_users(_period_start(period), datetime.utcnow())
+    }
+
+@app.get("/admin/analytics/payment-stats", response_model=schemas.CounterpartyStats)
+def get_platform_payment_stats(
+    period: str = Query("month", enum=["week", "month", "year"]),
+    approx: bool = True,
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    start_date, end_date = _period_start(period), datetime.utcnow()
+    if approx:
+        return sketches.get_approx_counterparty_stats(db, None, start_date, end_date)
+    return crud.get_counterparty_stats(db, None, start_date, end_date)
+
+# Slow-query log (enabled with SLOW_QUERY_MS)
+@app.get("/admin/slow-queries")
+def get_slow_queries(
+    limit: int = Query(20, le=200),
+    order_by: str = Query("total", enum=["total", "p99", "max", "count"]),
+    current_user: schemas.User = Depends(get_current_admin_user)
+):
+    return {
+        "enabled": profiling.slow_queries.enabled,
+        "threshold_ms": profiling.slow_queries.threshold_ms,
+        "queries": profiling.slow_queries.top(limit=limit, order_by=order_by)
+    }
+
+@app.post("/admin/analytics/refresh")
+def refresh_analytics_snapshot(
+    current_user: schemas.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    from app import analytics
+    added = analytics.snapshot.refresh(db)
+    return {
+        "rows_added": added,
+        "row_count": analytics.snapshot.row_count,
+        "last_id": analytics.snapshot.last_id
+    }
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8001, reload=True) 
\ No newline at end of file
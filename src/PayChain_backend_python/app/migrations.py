@@ -0,0 +1,201 @@
+"""Versioned schema migrations.
+
+The applied version is recorded in the schema_version table. Apply pending
+migrations before starting the API:
+
+    python -m app.migrations           # migrate to the latest version
+    python -m app.migrations --check   # exit 1 if migrations are pending
+
+Migration 1 creates the current schema, so a migration that changes an
+existing table must be a no-op when its change is already present (see
+_add_column). Migrations run under a database lock, so concurrently
+starting workers apply them once.
+"""
+import argparse
+import logging
+import os
+import sys
+from contextlib import contextmanager
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, literal, select, text
+from sqlalchemy.schema import CreateColumn
+
+from app import models
+from app.database import engine as default_engine
+
+logger = logging.getLogger("migrations")
+
+# Apply pending migrations when the API starts (convenient for development;
+# production runs `python -m app.migrations` as a release step instead)
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+# Arbitrary key of the Postgres advisory lock held while migrating
+_LOCK_KEY = 7342001
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now())
+)
+
+
+class SchemaOutOfDate(RuntimeError):
+    """The database is behind the code and automatic migration is off"""
+
+
+def _add_column(conn, table: Table, name: str):
+    """ALTER TABLE ... ADD COLUMN for a model column, unless it already exists"""
+    if name in {column["name"] for column in inspect(conn).get_columns(table.name)}:
+        return
+    column = table.c[name]
+    ddl = str(CreateColumn(column).compile(dialect=conn.dialect))
+    if not column.nullable and column.server_default is None:
+        # Existing rows need a value: use the column's Python-side default
+        default = literal(column.default.arg).compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        ddl += f" DEFAULT {default}"
+    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def _create_missing_indexes(conn, table: Table):
+    existing = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+
+def _initial_schema(conn):
+    # Tables that already exist (databases created before versioning) are kept
+    models.Base.metadata.create_all(bind=conn)
+
+
+def _pre_versioning_columns(conn):
+    # Columns and indexes added to existing tables before schema versioning,
+    # which create_all did not add to databases created earlier
+    _add_column(conn, models.User.__table__, "data_version")
+    _add_column(conn, models.User.__table__, "unread_notifications")
+    _add_column(conn, models.PaymentTemplate.__table__, "recipient_id")
+    for name in ("recipient_id", "recipient_unresolvable", "lease_owner", "lease_expires_at"):
+        _add_column(conn, models.ScheduledPayment.__table__, name)
+    for table in (models.PaymentTemplate.__table__, models.ScheduledPayment.__table__):
+        _create_missing_indexes(conn, table)
+
+
+def _unique_sketch_rows(conn):
+    # Concurrent writers could insert the same (user, kind, day) sketch twice;
+    # merge any duplicates into the oldest row before the unique indexes go on
+    from app import sketches
+    table = models.AnalyticsSketch.__table__
+    duplicates = conn.execute(
+        select(table.c.user_id, table.c.kind, table.c.bucket)
+        .group_by(table.c.user_id, table.c.kind, table.c.bucket)
+        .having(func.count() > 1)
+    ).all()
+    for user_id, kind, bucket in duplicates:
+        owner = table.c.user_id.is_(None) if user_id is None else table.c.user_id == user_id
+        rows = conn.execute(
+            select(table.c.id, table.c.data)
+            .where(owner, table.c.kind == kind, table.c.bucket == bucket)
+            .order_by(table.c.id)
+        ).all()
+        merged = sketches.SKETCH_TYPES[kind]()
+        for _, data in rows:
+            merged.merge(sketches.SKETCH_TYPES[kind].from_bytes(data))
+        conn.execute(table.update().where(table.c.id == rows[0].id).values(data=merged.to_bytes()))
+        conn.execute(table.delete().where(table.c.id.in_([row.id for row in rows[1:]])))
+    if "ix_analytics_sketches_user_kind_bucket" in {index["name"] for index in inspect(conn).get_indexes(table.name)}:
+        conn.exec_driver_sql("DROP INDEX ix_analytics_sketches_user_kind_bucket")
+    _create_missing_indexes(conn, table)
+
+
+# (version, description, upgrade); append new migrations at the end
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "Initial schema", _initial_schema),
+    (2, "Columns added before schema versioning", _pre_versioning_columns),
+    (3, "Unique analytics sketch rows", _unique_sketch_rows),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(schema_version.select().with_only_columns(func.max(schema_version.c.version))).scalar() or 0
+
+
+@contextmanager
+def _locked(engine):
+    """A connection inside one transaction that holds the migration lock"""
+    with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            # pysqlite does not begin transactions for DDL; take the write lock explicitly,
+            # and stop SQLAlchemy from committing after each DDL statement
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT", autocommit=False)
+            conn.exec_driver_sql("PRAGMA busy_timeout = 60000")
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+        else:
+            with conn.begin():
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+                yield conn
+
+
+def migrate(engine=default_engine) -> List[int]:
+    """Apply pending migrations in one transaction; returns the versions applied"""
+    with _locked(engine) as conn:
+        schema_version.create(conn, checkfirst=True)
+        version = current_version(conn)
+        applied = []
+        for number, description, upgrade in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info(f"Applying migration {number}: {description}")
+            upgrade(conn)
+            conn.execute(schema_version.insert().values(version=number, description=description))
+            applied.append(number)
+    return applied
+
+
+def ensure_schema(engine=default_engine, auto_migrate: bool = SCHEMA_AUTO_MIGRATE):
+    """Called on API startup: one version check when the schema is current"""
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version >= LATEST_VERSION:
+        return
+    if not auto_migrate:
+        raise SchemaOutOfDate(
+            f"Database schema is at version {version}, expected {LATEST_VERSION}; "
+            f"run `python -m app.migrations`"
+        )
+    migrate(engine)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--check", action="store_true", help="Only report; exit 1 if migrations are pending")
+    args = parser.parse_args()
+
+    if args.check:
+        with default_engine.connect() as conn:
+            version = current_version(conn)
+        logger.info(f"Schema version {version}, latest {LATEST_VERSION}")
+        sys.exit(0 if version >= LATEST_VERSION else 1)
+
+    applied = migrate()
+    if applied:
+        logger.info(f"Migrated to version {applied[-1]}")
+    else:
+        logger.info(f"Schema already at version {LATEST_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
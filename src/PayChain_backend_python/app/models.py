@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Text, Enum, Date, JSON, Table
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Text, Enum, Date, JSON, Table, LargeBinary, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -34,11 +34,16 @@ class User(Base):
     full_name = Column(String, nullable=True)
     profile_image = Column(String, nullable=True)
     notification_preferences = Column(JSON, nullable=True)
+    # Bumped by every write to the user's balance, transactions, templates,
+    # schedules or receipts; per-user ETags are derived from it
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Maintained by app.notifications alongside every insert/read/delete
+    unread_notifications = Column(Integer, nullable=False, default=0, server_default="0")
 
     transactions_sent = relationship("Transaction", foreign_keys="Transaction.sender_id", back_populates="sender")
     transactions_received = relationship("Transaction", foreign_keys="Transaction.recipient_id", back_populates="recipient")
-    templates = relationship("PaymentTemplate", back_populates="owner")
-    scheduled_payments = relationship("ScheduledPayment", back_populates="user")
+    templates = relationship("PaymentTemplate", foreign_keys="PaymentTemplate.owner_id", back_populates="owner")
+    scheduled_payments = relationship("ScheduledPayment", foreign_keys="ScheduledPayment.user_id", back_populates="user")
     nft_receipts = relationship("NFTReceipt", back_populates="owner")
 
 class Tag(Base):
@@ -94,14 +99,17 @@ class PaymentTemplate(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     name = Column(String)
     description = Column(Text, nullable=True)
-    recipient_principal = Column(String)
+    recipient_principal = Column(String, index=True)
+    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # Resolved from recipient_principal
     amount = Column(Float, nullable=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    owner = relationship("User", back_populates="templates")
-    conditions = relationship("TemplateCondition", back_populates="template", cascade="all, delete-orphan")
+    owner = relationship("User", foreign_keys=[owner_id], back_populates="templates")
+    # Loaded with one IN query for all templates of a result, not one query per template
+    conditions = relationship("TemplateCondition", back_populates="template", cascade="all, delete-orphan",
+                              lazy="selectin")
 
 class TemplateCondition(Base):
     __tablename__ = "template_conditions"
@@ -128,8 +136,12 @@ class ScheduledPayment(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    recipient_principal = Column(String)
+    recipient_principal = Column(String, index=True)
     amount = Column(Float)
+    
+    # Recipient resolved from recipient_principal; flagged when no such user exists
+    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    recipient_unresolvable = Column(Boolean, default=False, nullable=False)
     description = Column(Text, nullable=True)
     
     # Scheduling details
@@ -143,11 +155,15 @@ class ScheduledPayment(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     last_processed = Column(DateTime(timezone=True), nullable=True)
-    next_payment_date = Column(Date, nullable=True)
+    next_payment_date = Column(Date, nullable=True, index=True)
     payments_made = Column(Integer, default=0)
     
+    # Processing lease, so concurrent schedulers never pay the same row twice
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    
     # Relationships
-    user = relationship("User", back_populates="scheduled_payments")
+    user = relationship("User", foreign_keys=[user_id], back_populates="scheduled_payments")
     transactions = relationship("Transaction", secondary="scheduled_payment_transactions")
 
 # Association table for scheduled payments and transactions
@@ -158,6 +174,14 @@ class ScheduledPaymentTransaction(Base):
     transaction_id = Column(Integer, ForeignKey("transactions.id"), primary_key=True)
     processed_at = Column(DateTime(timezone=True), server_default=func.now())
 
+# Change log read by the scheduler daemon to pick up new and updated schedules
+class ScheduledPaymentChange(Base):
+    __tablename__ = "scheduled_payment_changes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    scheduled_payment_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class NFTReceipt(Base):
     __tablename__ = "nft_receipts"
     
@@ -170,4 +194,64 @@ class NFTReceipt(Base):
     
     # Relationships
     transaction = relationship("Transaction", back_populates="nft_receipt")
-    owner = relationship("User", back_populates="nft_receipts") 
\ No newline at end of file
+    owner = relationship("User", back_populates="nft_receipts") 
+
+class AnalyticsSketch(Base):
+    __tablename__ = "analytics_sketches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL for platform-wide sketches
+    bucket = Column(Date, nullable=False)
+    kind = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # One row per sketch and day. NULLs never conflict in a unique index,
+        # so platform-wide rows get their own partial one.
+        Index("uq_analytics_sketches_user_kind_bucket", "user_id", "kind", "bucket", unique=True),
+        Index("uq_analytics_sketches_platform_kind_bucket", "kind", "bucket", unique=True,
+              sqlite_where=text("user_id IS NULL"), postgresql_where=text("user_id IS NULL")),
+    )
+
+# Inbox entries written by app.notifications from payment and schedule events
+class Notification(Base):
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    type = Column(String, nullable=False)
+    title = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    data = Column(JSON, nullable=True)
+    read = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # retention sweep
+
+    __table_args__ = (
+        Index("ix_notifications_user_created", "user_id", "created_at"),
+    )
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+# Background jobs run by app.jobs (scheduler runs, backfills, minting, exports)
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String, nullable=False, index=True)
+    status = Column(Enum(JobStatus), default=JobStatus.QUEUED, nullable=False, index=True)
+    params = Column(JSON, nullable=True)
+    progress = Column(JSON, nullable=True)  # counters reported by the job
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # refreshed with every progress update
@@ -0,0 +1,142 @@
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, func
+from sqlalchemy.orm import Session
+
+from app import events, models
+
+# Notifications older than this are deleted by sweep_notifications
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_SWEEP_BATCH = int(os.getenv("NOTIFICATION_SWEEP_BATCH", "5000"))
+
+# Notification types
+PAYMENT = "payment"
+
+
+def _payment_received(data: dict):
+    return PAYMENT, "New Payment Received", f"You have received {data['amount']} ICP from {data['sender_principal']}"
+
+
+def _schedule_executed(data: dict):
+    return PAYMENT, "Scheduled Payment Sent", f"Your scheduled payment of {data['amount']} ICP to {data['recipient_principal']} was sent"
+
+
+# Event type -> renderer of (type, title, message); other events are not stored
+_RENDERERS = {
+    events.PAYMENT_RECEIVED: _payment_received,
+    events.SCHEDULE_EXECUTED: _schedule_executed,
+}
+
+
+def _adjust_unread(db: Session, deltas: Dict[int, int]):
+    if deltas:
+        db.execute(
+            models.User.__table__.update().where(
+                models.User.id == bindparam("account_id")
+            ).values(unread_notifications=models.User.unread_notifications + bindparam("delta")),
+            [{"account_id": user_id, "delta": delta} for user_id, delta in deltas.items()]
+        )
+
+
+def record_notifications(db: Session, published: List[tuple]) -> int:
+    """Store inbox entries for (user_id, event type, data) events.
+
+    Rows are inserted and unread counters incremented with one executemany
+    statement each. Changes are added to the session; the caller commits
+    them together with the payments.
+    """
+    rows = []
+    for user_id, event_type, data in published:
+        render = _RENDERERS.get(event_type)
+        if render is None:
+            continue
+        notification_type, title, message = render(data)
+        rows.append({
+            "user_id": user_id,
+            "type": notification_type,
+            "title": title,
+            "message": message,
+            "data": data,
+            "read": False
+        })
+    if not rows:
+        return 0
+    db.execute(models.Notification.__table__.insert(), rows)
+    _adjust_unread(db, Counter(row["user_id"] for row in rows))
+    return len(rows)
+
+
+def get_notifications(db: Session, user_id: int, skip: int = 0, limit: int = 20):
+    """Newest first, read from the (user_id, created_at) index"""
+    n = models.Notification
+    return db.query(n).filter(n.user_id == user_id).order_by(
+        n.created_at.desc(), n.id.desc()
+    ).offset(skip).limit(limit).all()
+
+
+def get_unread_count(db: Session, user_id: int) -> int:
+    return db.query(models.User.unread_notifications).filter(models.User.id == user_id).scalar() or 0
+
+
+def mark_read(db: Session, user_id: int, notification_id: int) -> bool:
+    """Mark one notification read; False if the user has no such notification"""
+    n = models.Notification
+    updated = db.query(n).filter(
+        n.id == notification_id,
+        n.user_id == user_id,
+        n.read == False
+    ).update({n.read: True}, synchronize_session=False)
+    if not updated:
+        return db.query(n.id).filter(n.id == notification_id, n.user_id == user_id).first() is not None
+    _adjust_unread(db, {user_id: -1})
+    db.commit()
+    return True
+
+
+def mark_all_read(db: Session, user_id: int) -> int:
+    """One set-based UPDATE; the counter drops by exactly the rows it changed"""
+    n = models.Notification
+    updated = db.query(n).filter(n.user_id == user_id, n.read == False).update(
+        {n.read: True}, synchronize_session=False
+    )
+    if updated:
+        _adjust_unread(db, {user_id: -updated})
+    db.commit()
+    return updated
+
+
+def sweep_notifications(
+    db: Session,
+    retention_days: int = NOTIFICATION_RETENTION_DAYS,
+    batch_size: int = NOTIFICATION_SWEEP_BATCH,
+    on_batch: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
+    """Delete notifications older than the retention period in id-ordered batches.
+
+    Each batch is one short transaction: unread rows being deleted are
+    subtracted from their users' counters before the rows go, so counters
+    stay exact while inserts continue. on_batch receives each batch's counters.
+    """
+    n = models.Notification
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    stats = {"deleted": 0}
+    while True:
+        ids = [notification_id for (notification_id,) in db.query(n.id).filter(
+            n.created_at < cutoff
+        ).order_by(n.id).limit(batch_size)]
+        if not ids:
+            break
+        unread = dict(db.query(n.user_id, func.count(n.id)).filter(
+            n.id.in_(ids),
+            n.read == False
+        ).group_by(n.user_id))
+        db.query(n).filter(n.id.in_(ids)).delete(synchronize_session=False)
+        _adjust_unread(db, {user_id: -count for user_id, count in unread.items()})
+        db.commit()
+        stats["deleted"] += len(ids)
+        if on_batch:
+            on_batch({"deleted": len(ids)})
+    return stats
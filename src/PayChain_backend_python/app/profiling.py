@@ -0,0 +1,404 @@
+import contextvars
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger("profiling")
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() in ("1", "true", "yes")
+# N+1 alarm: log requests issuing more SQL statements than this; 0 disables
+PROFILING_QUERY_ALARM = int(os.getenv("PROFILING_QUERY_ALARM", "25"))
+
+# Slow-query log: statements slower than this many milliseconds are recorded; 0 disables
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Distinct statement fingerprints kept, least recently seen evicted first
+SLOW_QUERY_CAPACITY = int(os.getenv("SLOW_QUERY_CAPACITY", "200"))
+# Durations kept per fingerprint for the percentiles
+SLOW_QUERY_SAMPLES = 256
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Label for requests no route matched, so unknown paths cannot grow the label set
+UNMATCHED = "unmatched"
+
+
+class RequestProfile:
+    """SQL activity of one request, filled in by the engine hooks"""
+
+    __slots__ = ("queries", "db_seconds", "rows", "callers")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.callers = Counter()  # "module.function" that issued each statement
+
+
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("request_profile", default=None)
+
+
+class _CountingCursor:
+    """Wraps a DBAPI cursor to count the rows fetched through it.
+
+    Drivers disagree on rowcount for SELECT (SQLite always reports -1), so
+    returned rows are counted as SQLAlchemy fetches them.
+    """
+
+    __slots__ = ("_cursor", "_profile")
+
+    def __init__(self, cursor, profile: RequestProfile):
+        self._cursor = cursor
+        self._profile = profile
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._profile.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._profile.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._profile.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _caller() -> str:
+    # Nearest application frame below the SQLAlchemy stack, e.g. "crud.get_user"
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.") and module != __name__:
+            return f"{module[4:]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so executions differing only in values or IN-list length match"""
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _PLACEHOLDERS.sub("?", normalized)
+    normalized = _LITERALS.sub("?", normalized)
+    return _IN_LISTS.sub("(?, ...)", normalized)
+
+
+def _parameter_shape(parameters, executemany: bool):
+    # Types only: bound values may be personal data
+    if executemany:
+        return {"executemany": len(parameters), "row": _parameter_shape(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class _SlowQuery:
+    __slots__ = ("statement", "parameter_shape", "callers", "durations", "count", "total_seconds",
+                 "max_seconds", "last_seen", "plan")
+
+    def __init__(self, statement: str, parameter_shape):
+        self.statement = statement
+        self.parameter_shape = parameter_shape
+        self.callers = Counter()
+        self.durations = deque(maxlen=SLOW_QUERY_SAMPLES)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seen = None
+        self.plan = None
+
+
+class SlowQueryLog:
+    """Statements over `threshold_ms`, deduplicated by fingerprint.
+
+    Keeps at most `capacity` fingerprints (least recently seen evicted),
+    each with its calling functions, recent durations for p50/p99, and
+    the query plan captured the first time it was seen.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, capacity: int = SLOW_QUERY_CAPACITY):
+        self.threshold_ms = threshold_ms
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, _SlowQuery]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def record(self, conn, cursor, statement: str, parameters, executemany: bool, seconds: float):
+        key = fingerprint(statement)
+        caller = _caller()
+        with self._lock:
+            entry = self._entries.get(key)
+            is_new = entry is None
+            if is_new:
+                entry = self._entries[key] = _SlowQuery(statement[:2000], _parameter_shape(parameters, executemany))
+                if len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            entry.callers[caller] += 1
+            entry.durations.append(seconds)
+            entry.count += 1
+            entry.total_seconds += seconds
+            entry.max_seconds = max(entry.max_seconds, seconds)
+            entry.last_seen = datetime.utcnow()
+        if is_new:
+            entry.plan = self._explain(conn, cursor, statement, parameters, executemany)
+
+    def _explain(self, conn, cursor, statement: str, parameters, executemany: bool) -> Optional[List[str]]:
+        # EXPLAIN plans without executing, so it is safe for writes too
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute(prefix + statement, parameters)
+            return [str(row[-1]) if conn.dialect.name == "sqlite" else str(row[0]) for row in explain_cursor.fetchall()]
+        except Exception as e:
+            return [f"EXPLAIN failed: {str(e)}"]
+        finally:
+            explain_cursor.close()
+
+    def top(self, limit: int = 20, order_by: str = "total") -> List[dict]:
+        """Worst offenders by total time (or "p99", "max", "count")"""
+        with self._lock:
+            rows = []
+            for key, entry in self._entries.items():
+                durations = sorted(entry.durations)
+                rows.append({
+                    "fingerprint": key,
+                    "statement": entry.statement,
+                    "parameter_shape": entry.parameter_shape,
+                    "callers": dict(entry.callers.most_common(5)),
+                    "count": entry.count,
+                    "total_ms": round(entry.total_seconds * 1000, 3),
+                    "p50_ms": round(_percentile(durations, 0.50) * 1000, 3),
+                    "p99_ms": round(_percentile(durations, 0.99) * 1000, 3),
+                    "max_ms": round(entry.max_seconds * 1000, 3),
+                    "last_seen": entry.last_seen,
+                    "plan": entry.plan,
+                })
+        sort_key = {"total": "total_ms", "p99": "p99_ms", "max": "max_ms", "count": "count"}[order_by]
+        rows.sort(key=lambda row: row[sort_key], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+slow_queries = SlowQueryLog()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None or slow_queries.enabled:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = conn.info.get("profiling_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    if slow_queries.enabled and seconds * 1000 >= slow_queries.threshold_ms:
+        slow_queries.record(conn, cursor, statement, parameters, executemany, seconds)
+    if profile is None:
+        return
+    profile.db_seconds += seconds
+    profile.queries += 1
+    if cursor.description is not None:
+        if context is not None:
+            # The result SQLAlchemy builds next fetches from context.cursor
+            context.cursor = _CountingCursor(cursor, profile)
+    elif cursor.rowcount > 0:
+        profile.rows += cursor.rowcount
+    if PROFILING_QUERY_ALARM > 0:
+        profile.callers[_caller()] += 1
+
+
+def instrument(engine):
+    """Attach the statement counting hooks to an engine (once)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class _RouteMetrics:
+    __slots__ = ("latency", "queries", "response_bytes", "db_seconds", "rows", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.statuses = Counter()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Per-route request metrics of this process, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = defaultdict(_RouteMetrics)
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status_code: int, seconds: float,
+               profile: RequestProfile, response_bytes: int):
+        with self._lock:
+            metrics = self._routes[(method, route)]
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(profile.queries)
+            metrics.response_bytes.observe(response_bytes)
+            metrics.db_seconds += profile.db_seconds
+            metrics.rows += profile.rows
+            metrics.statuses[status_code] += 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        families = {
+            "latency": ("paychain_http_request_duration_seconds", "histogram", "Request latency by route"),
+            "queries": ("paychain_http_request_queries", "histogram", "SQL statements issued per request"),
+            "response_bytes": ("paychain_http_response_size_bytes", "histogram", "Response body size"),
+            "db_seconds": ("paychain_http_db_seconds_total", "counter", "Time spent executing SQL"),
+            "rows": ("paychain_http_db_rows_total", "counter", "Rows returned or affected by SQL statements"),
+            "statuses": ("paychain_http_requests_total", "counter", "Requests by route and status code"),
+        }
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+            for attribute, (name, kind, description) in families.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (method, route), metrics in routes:
+                    labels = f'method="{method}",route="{_escape(route)}"'
+                    value = getattr(metrics, attribute)
+                    if kind == "histogram":
+                        lines.extend(value.render(name, labels))
+                    elif attribute == "statuses":
+                        for status_code, count in sorted(value.items()):
+                            lines.append(f'{name}{{{labels},status="{status_code}"}} {count}')
+                    else:
+                        lines.append(f"{name}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def _route_template(scope) -> str:
+    # The router leaves the matched endpoint in the scope; map it back to its path
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return UNMATCHED
+    templates = getattr(app.state, "profiling_route_templates", None)
+    if templates is None:
+        templates = {getattr(route, "endpoint", None): route.path for route in app.routes}
+        app.state.profiling_route_templates = templates
+    return templates.get(endpoint, UNMATCHED)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware recording latency, SQL statements, DB time, rows and response size per route"""
+
+    def __init__(self, app, metrics: MetricsRegistry = registry):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        status_code = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            _current.reset(token)
+            route = _route_template(scope)
+            self.metrics.record(scope["method"], route, status_code, seconds, profile, response_bytes)
+            if PROFILING_QUERY_ALARM > 0 and profile.queries > PROFILING_QUERY_ALARM:
+                callers = ", ".join(f"{caller} ({count})" for caller, count in profile.callers.most_common(3))
+                logger.warning(
+                    f"N+1 alarm: {scope['method']} {route} issued {profile.queries} SQL statements "
+                    f"({profile.db_seconds * 1000:.1f} ms); top callers: {callers}"
+                )
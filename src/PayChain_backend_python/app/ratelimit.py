@@ -0,0 +1,222 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app import auth
+
+# Route classes, lowest priority first: under load, classes are shed in this order
+REPORTS = "reports"
+READS = "reads"
+AUTH = "auth"
+PAYMENTS = "payments"
+SHED_ORDER = (REPORTS, READS, AUTH)  # payments are never shed
+
+# "rate/burst": tokens added per second per client, and bucket capacity
+DEFAULT_LIMITS = {
+    PAYMENTS: "10/20",
+    READS: "20/40",
+    REPORTS: "2/10",
+    AUTH: "1/5",
+}
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+# Idle buckets are swept at most this often per shard
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", "30"))
+
+# Load shedding thresholds; 0 disables the corresponding signal
+SHED_LOOP_LAG_SECONDS = float(os.getenv("SHED_LOOP_LAG_SECONDS", "0.1"))
+SHED_POOL_WAIT_SECONDS = float(os.getenv("SHED_POOL_WAIT_SECONDS", "0.25"))
+SHED_PROBE_INTERVAL = float(os.getenv("SHED_PROBE_INTERVAL", "0.5"))
+
+EXEMPT_PATHS = ("/health", "/ready", "/metrics", "/docs", "/redoc", "/openapi.json")
+
+
+def _parse_limit(value: str) -> Tuple[float, float]:
+    rate, burst = value.split("/")
+    return float(rate), float(burst)
+
+
+def load_limits() -> Dict[str, Tuple[float, float]]:
+    # RATE_LIMIT_<CLASS>, e.g. RATE_LIMIT_REPORTS=2/10
+    return {
+        route_class: _parse_limit(os.getenv(f"RATE_LIMIT_{route_class.upper()}", default))
+        for route_class, default in DEFAULT_LIMITS.items()
+    }
+
+
+def classify(method: str, path: str) -> str:
+    if path.startswith("/login") or (path.rstrip("/") == "/users" and method == "POST"):
+        return AUTH
+    if path.startswith("/reports/") or path.startswith("/admin/analytics/") or path.endswith("/forecast"):
+        return REPORTS
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return READS
+    return PAYMENTS
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets", "last_sweep")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[tuple, list] = {}  # key -> [tokens, last refill time]
+        self.last_sweep = time.monotonic()
+
+
+class TokenBuckets:
+    """Token buckets per (client, route class), split across locked shards.
+
+    A bucket left idle long enough to refill completely is indistinguishable
+    from a new one, so sweeps drop it; memory stays O(active clients).
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], shards: int = RATE_LIMIT_SHARDS):
+        self.limits = limits
+        self.shards = [_Shard() for _ in range(max(1, shards))]
+
+    def __len__(self):
+        return sum(len(shard.buckets) for shard in self.shards)
+
+    def acquire(self, client: str, route_class: str, now: Optional[float] = None) -> float:
+        """Take one token; returns 0 if allowed, else seconds until one is available"""
+        rate, burst = self.limits[route_class]
+        if rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        key = (client, route_class)
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.lock:
+            if now - shard.last_sweep >= RATE_LIMIT_SWEEP_SECONDS:
+                self._sweep(shard, now)
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [burst, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def _sweep(self, shard: _Shard, now: float):
+        shard.last_sweep = now
+        for key in list(shard.buckets):
+            rate, burst = self.limits[key[1]]
+            tokens, last = shard.buckets[key]
+            if tokens + (now - last) * rate >= burst:
+                del shard.buckets[key]
+
+
+class LoadMonitor:
+    """Samples event-loop lag and threadpool wait to decide what to shed.
+
+    Pressure is the larger of the two measurements relative to its
+    threshold. At pressure >= 1 reports are shed, >= 2 reads as well,
+    >= 4 auth too; payments are always admitted.
+    """
+
+    def __init__(self):
+        self.loop_lag = 0.0
+        self.pool_wait = 0.0
+        self._task = None
+
+    @property
+    def pressure(self) -> float:
+        pressure = 0.0
+        if SHED_LOOP_LAG_SECONDS > 0:
+            pressure = max(pressure, self.loop_lag / SHED_LOOP_LAG_SECONDS)
+        if SHED_POOL_WAIT_SECONDS > 0:
+            pressure = max(pressure, self.pool_wait / SHED_POOL_WAIT_SECONDS)
+        return pressure
+
+    def should_shed(self, route_class: str) -> bool:
+        if route_class not in SHED_ORDER:
+            return False
+        return self.pressure >= 2 ** SHED_ORDER.index(route_class)
+
+    async def _probe(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(SHED_PROBE_INTERVAL)
+            self.loop_lag = max(0.0, time.monotonic() - started - SHED_PROBE_INTERVAL)
+
+            started = time.monotonic()
+            await run_in_threadpool(time.monotonic)
+            self.pool_wait = time.monotonic() - started
+
+    def start(self):
+        """Start probing on the running event loop (call from an async startup hook)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._probe())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+monitor = LoadMonitor()
+
+
+def _client_key(scope) -> str:
+    # Authenticated clients are limited per user, everyone else per IP
+    for name, value in scope.get("headers", []):
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            try:
+                email = auth._decode_token(value[7:].decode("latin-1")).get("sub")
+            except Exception:
+                email = None
+            if email:
+                return f"user:{email}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def _reject(send, status_code: int, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying per-client token buckets and load shedding"""
+
+    def __init__(self, app, buckets: Optional[TokenBuckets] = None, load_monitor: LoadMonitor = monitor):
+        self.app = app
+        # Not `buckets or ...`: an empty TokenBuckets has len() 0
+        self.buckets = buckets if buckets is not None else TokenBuckets(load_limits())
+        self.monitor = load_monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        route_class = classify(scope["method"], scope["path"])
+        if self.monitor.should_shed(route_class):
+            await _reject(send, 503, SHED_PROBE_INTERVAL, "Server is busy, please retry shortly")
+            return
+
+        retry_after = self.buckets.acquire(_client_key(scope), route_class)
+        if retry_after:
+            await _reject(send, 429, retry_after, "Too many requests")
+            return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,71 @@
+"""Readiness of this worker process.
+
+GET /health answers whenever the process serves requests (liveness). GET
+/ready answers 200 only after warm_up() has run and until the worker starts
+draining, so a load balancer routes new traffic to warm workers only and
+stops before a worker shuts down.
+"""
+import logging
+import threading
+import time
+
+from app.database import engine
+
+logger = logging.getLogger("readiness")
+
+
+class Readiness:
+    def __init__(self):
+        self.warmed_at = None
+        self.draining_since = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.warmed_at is not None and self.draining_since is None
+
+    def mark_warm(self):
+        with self._lock:
+            self.warmed_at = time.time()
+
+    def start_draining(self):
+        with self._lock:
+            if self.draining_since is None:
+                self.draining_since = time.time()
+
+    def status(self) -> dict:
+        if self.draining_since is not None:
+            status = "draining"
+        elif self.warmed_at is None:
+            status = "starting"
+        else:
+            status = "ready"
+        return {"status": status, "warmed_at": self.warmed_at, "draining_since": self.draining_since}
+
+
+# Shared per-process state
+state = Readiness()
+
+
+def warm_imports():
+    """Modules deferred to keep `import app.main` fast (see app.startup_profile).
+
+    The production launcher calls this before forking, so workers share them.
+    """
+    from app import analytics, auth, forecast, hashing  # noqa: F401
+    auth._jwt()
+    hashing.get_pwd_context()
+
+
+def warm_up():
+    """Called on startup, before the worker accepts traffic"""
+    from app import hashing
+
+    started = time.perf_counter()
+    warm_imports()
+    # Open a database connection (and fill the pool, where there is one)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    hashing.hasher.warm()
+    state.mark_warm()
+    logger.info(f"Worker warmed up in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,379 @@
+"""Template condition rule engine.
+
+A template matches a transaction when it is active, has at least one
+condition, and all of its conditions hold. Conditions compile to closures:
+
+    amount    equals / greater_than / less_than a number
+    category  equals / contains (case-insensitive)
+    tag       equals / contains: some tag of the transaction
+    time      equals "HH" or "HH:MM", greater_than / less_than "HH:MM",
+              contains a window "HH:MM-HH:MM" (may wrap midnight); UTC
+    metadata  "key=value": equals / contains (as text),
+              greater_than / less_than (as numbers); contains "key" alone
+              tests that the key is present
+
+Other combinations, frequency conditions (which depend on payment history)
+and unparsable values make the template invalid; it is reported and never
+matches.
+
+Each template is indexed by one anchor condition: category or tag equality
+in a hash, amount equality by cents, amount thresholds in sorted lists and
+time conditions in hour buckets. A transaction is checked against the
+templates its values select in those indexes, plus the templates with no
+indexable condition, rather than against every template.
+
+Rule sets are kept per owner and follow their template list: when the list
+changes only the templates whose rows changed are recompiled.
+"""
+import bisect
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.models import TemplateConditionOperator as Op, TemplateConditionType as Kind
+
+# Owners whose compiled rule sets are kept per process
+TEMPLATE_RULES_CACHE_SIZE = int(os.getenv("TEMPLATE_RULES_CACHE_SIZE", "10000"))
+
+_MINUTES_PER_DAY = 24 * 60
+
+
+class InvalidCondition(ValueError):
+    """A condition that cannot be evaluated"""
+
+
+class Candidate:
+    """A transaction normalized for matching"""
+
+    __slots__ = ("amount", "cents", "category", "tags", "metadata", "minute")
+
+    def __init__(self, amount: float, category: Optional[str] = None, tags: Iterable[str] = (),
+                 metadata: Optional[Dict[str, Any]] = None, timestamp: Optional[datetime] = None):
+        self.amount = amount
+        self.cents = round(amount * 100)
+        self.category = category.strip().lower() if category else None
+        self.tags = frozenset(tag.strip().lower() for tag in tags)
+        self.metadata = metadata or {}
+        timestamp = timestamp or datetime.utcnow()
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc)
+        self.minute = timestamp.hour * 60 + timestamp.minute
+
+
+def _minute_of_day(value: str) -> int:
+    try:
+        hours, _, minutes = value.strip().partition(":")
+        minute = int(hours) * 60 + int(minutes or 0)
+    except ValueError:
+        raise InvalidCondition(f"expected HH:MM, got {value!r}")
+    if not 0 <= minute < _MINUTES_PER_DAY:
+        raise InvalidCondition(f"time out of range: {value!r}")
+    return minute
+
+
+def _hours_between(start: int, end: int) -> frozenset:
+    """Hours overlapping the minutes [start, end], wrapping midnight when start > end"""
+    if start <= end:
+        return frozenset(range(start // 60, end // 60 + 1))
+    return _hours_between(start, _MINUTES_PER_DAY - 1) | _hours_between(0, end)
+
+
+def _number(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        raise InvalidCondition(f"expected a number, got {value!r}")
+
+
+def _metadata_number(metadata: dict, key: str) -> Optional[float]:
+    try:
+        return float(metadata[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# A compiled condition: (predicate, index key or None). Index keys are
+# ("category", text), ("tag", text), ("cents", int), ("above", amount),
+# ("below", amount) or ("hours", frozenset of hours).
+Compiled = Tuple[Callable[[Candidate], bool], Optional[tuple]]
+
+
+def _amount(op: Op, value: str) -> Compiled:
+    if op == Op.EQUALS:
+        cents = round(_number(value) * 100)
+        return (lambda tx: tx.cents == cents), ("cents", cents)
+    if op == Op.GREATER_THAN:
+        threshold = _number(value)
+        return (lambda tx: tx.amount > threshold), ("above", threshold)
+    if op == Op.LESS_THAN:
+        threshold = _number(value)
+        return (lambda tx: tx.amount < threshold), ("below", threshold)
+    raise InvalidCondition("amount conditions support equals, greater_than and less_than")
+
+
+def _category(op: Op, value: str) -> Compiled:
+    text = value.strip().lower()
+    if op == Op.EQUALS:
+        return (lambda tx: tx.category == text), ("category", text)
+    if op == Op.CONTAINS:
+        return (lambda tx: tx.category is not None and text in tx.category), None
+    raise InvalidCondition("category conditions support equals and contains")
+
+
+def _tag(op: Op, value: str) -> Compiled:
+    text = value.strip().lower()
+    if op == Op.EQUALS:
+        return (lambda tx: text in tx.tags), ("tag", text)
+    if op == Op.CONTAINS:
+        return (lambda tx: any(text in tag for tag in tx.tags)), None
+    raise InvalidCondition("tag conditions support equals and contains")
+
+
+def _time(op: Op, value: str) -> Compiled:
+    if op == Op.EQUALS:
+        if ":" not in value:
+            hour = _minute_of_day(value) // 60
+            return (lambda tx: tx.minute // 60 == hour), ("hours", frozenset([hour]))
+        minute = _minute_of_day(value)
+        return (lambda tx: tx.minute == minute), ("hours", frozenset([minute // 60]))
+    if op == Op.GREATER_THAN:
+        minute = _minute_of_day(value)
+        if minute == _MINUTES_PER_DAY - 1:
+            raise InvalidCondition("no time of day is later than 23:59")
+        return (lambda tx: tx.minute > minute), ("hours", _hours_between(minute + 1, _MINUTES_PER_DAY - 1))
+    if op == Op.LESS_THAN:
+        minute = _minute_of_day(value)
+        if minute == 0:
+            raise InvalidCondition("no time of day is earlier than 00:00")
+        return (lambda tx: tx.minute < minute), ("hours", _hours_between(0, minute - 1))
+    # contains: a window; the end minute is excluded
+    start, separator, end = value.partition("-")
+    if not separator:
+        raise InvalidCondition(f"expected a window HH:MM-HH:MM, got {value!r}")
+    start, end = _minute_of_day(start), _minute_of_day(end)
+    if start == end:
+        raise InvalidCondition(f"empty time window: {value!r}")
+    if start < end:
+        return (lambda tx: start <= tx.minute < end), ("hours", _hours_between(start, end - 1))
+    return (lambda tx: tx.minute >= start or tx.minute < end), ("hours", _hours_between(start, (end - 1) % _MINUTES_PER_DAY))
+
+
+def _metadata(op: Op, value: str) -> Compiled:
+    key, separator, expected = value.partition("=")
+    key = key.strip()
+    if not key:
+        raise InvalidCondition(f"expected key=value, got {value!r}")
+    if not separator:
+        if op != Op.CONTAINS:
+            raise InvalidCondition(f"expected key=value, got {value!r}")
+        return (lambda tx: key in tx.metadata), None
+    if op == Op.EQUALS:
+        return (lambda tx: key in tx.metadata and str(tx.metadata[key]) == expected), None
+    if op == Op.CONTAINS:
+        return (lambda tx: key in tx.metadata and expected in str(tx.metadata[key])), None
+    threshold = _number(expected)
+    if op == Op.GREATER_THAN:
+        def above(tx):
+            number = _metadata_number(tx.metadata, key)
+            return number is not None and number > threshold
+        return above, None
+
+    def below(tx):
+        number = _metadata_number(tx.metadata, key)
+        return number is not None and number < threshold
+    return below, None
+
+
+_COMPILERS = {
+    Kind.AMOUNT: _amount,
+    Kind.CATEGORY: _category,
+    Kind.TAG: _tag,
+    Kind.TIME: _time,
+    Kind.METADATA: _metadata,
+}
+
+# Most selective first: the first indexable condition of a template becomes its anchor
+_ANCHOR_ORDER = {"category": 0, "tag": 1, "cents": 2, "hours": 3, "above": 4, "below": 5}
+
+
+def compile_condition(condition_type, operator, value: str) -> Compiled:
+    kind, op = Kind(condition_type), Op(operator)
+    compiler = _COMPILERS.get(kind)
+    if compiler is None:
+        raise InvalidCondition(f"{kind.value} conditions are not evaluated per transaction")
+    return compiler(op, value or "")
+
+
+class CompiledTemplate:
+    __slots__ = ("id", "row", "predicates", "anchor", "error")
+
+    def __init__(self, row: dict):
+        self.id = row["id"]
+        self.row = row
+        self.predicates: Tuple[Callable[[Candidate], bool], ...] = ()
+        self.anchor: Optional[tuple] = None
+        self.error: Optional[str] = None
+        try:
+            compiled = [
+                compile_condition(c["condition_type"], c["operator"], c["value"]) for c in row["conditions"]
+            ]
+        except (InvalidCondition, ValueError) as e:
+            self.error = str(e)
+            return
+        self.predicates = tuple(predicate for predicate, _ in compiled)
+        keys = [key for _, key in compiled if key is not None]
+        if keys:
+            self.anchor = min(keys, key=lambda key: _ANCHOR_ORDER[key[0]])
+
+    def matches(self, tx: Candidate) -> bool:
+        return all(predicate(tx) for predicate in self.predicates)
+
+
+def _evaluable(row: dict) -> bool:
+    return bool(row["is_active"]) and bool(row["conditions"])
+
+
+class RuleSet:
+    """One owner's compiled templates and their discrimination indexes"""
+
+    def __init__(self):
+        self.templates: Dict[int, CompiledTemplate] = {}
+        self.source: Optional[list] = None
+        self._lock = threading.Lock()
+        self._category: Dict[str, Set[int]] = defaultdict(set)
+        self._tag: Dict[str, Set[int]] = defaultdict(set)
+        self._cents: Dict[int, Set[int]] = defaultdict(set)
+        # (threshold, template id), ascending
+        self._above: List[Tuple[float, int]] = []
+        self._below: List[Tuple[float, int]] = []
+        self._hours: List[Set[int]] = [set() for _ in range(24)]
+        self._unindexed: Set[int] = set()
+
+    def sync(self, rows: List[dict]) -> int:
+        """Follow the owner's template rows; returns how many templates were recompiled"""
+        with self._lock:
+            if rows is self.source:
+                return 0
+            current = {row["id"]: row for row in rows if _evaluable(row)}
+            for template_id in [tid for tid in self.templates if tid not in current]:
+                self._remove(template_id)
+            recompiled = 0
+            for template_id, row in current.items():
+                compiled = self.templates.get(template_id)
+                if compiled is not None and (compiled.row is row or compiled.row == row):
+                    continue
+                if compiled is not None:
+                    self._remove(template_id)
+                self._add(CompiledTemplate(row))
+                recompiled += 1
+            self.source = rows
+            return recompiled
+
+    def invalid(self) -> List[Tuple[int, str]]:
+        with self._lock:
+            return sorted((t.id, t.error) for t in self.templates.values() if t.error)
+
+    def match_many(self, transactions: List[Candidate]) -> Tuple[List[List[int]], int]:
+        """Matching template ids per transaction, and the number of templates checked"""
+        with self._lock:
+            results = []
+            checked = 0
+            for tx in transactions:
+                candidates = self._candidates(tx)
+                checked += len(candidates)
+                results.append(sorted(tid for tid in candidates if self.templates[tid].matches(tx)))
+            return results, checked
+
+    def match(self, tx: Candidate) -> List[int]:
+        return self.match_many([tx])[0][0]
+
+    # Called with the lock held
+    def _candidates(self, tx: Candidate) -> Set[int]:
+        candidates = set(self._unindexed)
+        if tx.category is not None:
+            candidates.update(self._category.get(tx.category, ()))
+        for tag in tx.tags:
+            candidates.update(self._tag.get(tag, ()))
+        candidates.update(self._cents.get(tx.cents, ()))
+        # amount > threshold: the thresholds below the amount
+        for _, template_id in self._above[:bisect.bisect_left(self._above, (tx.amount,))]:
+            candidates.add(template_id)
+        # amount < threshold: the thresholds above the amount
+        for _, template_id in self._below[bisect.bisect_right(self._below, (tx.amount, float("inf"))):]:
+            candidates.add(template_id)
+        candidates.update(self._hours[tx.minute // 60])
+        return candidates
+
+    def _add(self, compiled: CompiledTemplate):
+        self.templates[compiled.id] = compiled
+        if compiled.error:
+            return
+        anchor = compiled.anchor
+        if anchor is None:
+            self._unindexed.add(compiled.id)
+        elif anchor[0] == "category":
+            self._category[anchor[1]].add(compiled.id)
+        elif anchor[0] == "tag":
+            self._tag[anchor[1]].add(compiled.id)
+        elif anchor[0] == "cents":
+            self._cents[anchor[1]].add(compiled.id)
+        elif anchor[0] == "above":
+            bisect.insort(self._above, (anchor[1], compiled.id))
+        elif anchor[0] == "below":
+            bisect.insort(self._below, (anchor[1], compiled.id))
+        else:
+            for hour in anchor[1]:
+                self._hours[hour].add(compiled.id)
+
+    def _remove(self, template_id: int):
+        compiled = self.templates.pop(template_id)
+        if compiled.error:
+            return
+        anchor = compiled.anchor
+        if anchor is None:
+            self._unindexed.discard(template_id)
+        elif anchor[0] in ("category", "tag", "cents"):
+            index = {"category": self._category, "tag": self._tag, "cents": self._cents}[anchor[0]]
+            index[anchor[1]].discard(template_id)
+            if not index[anchor[1]]:
+                del index[anchor[1]]
+        elif anchor[0] in ("above", "below"):
+            entries = self._above if anchor[0] == "above" else self._below
+            del entries[bisect.bisect_left(entries, (anchor[1], template_id))]
+        else:
+            for hour in anchor[1]:
+                self._hours[hour].discard(template_id)
+
+
+class RuleEngine:
+    """Owner id -> RuleSet, least recently used first"""
+
+    def __init__(self, max_users: int = TEMPLATE_RULES_CACHE_SIZE):
+        self.max_users = max_users
+        self._sets: "OrderedDict[int, RuleSet]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rules_for(self, user_id: int, rows: List[dict]) -> RuleSet:
+        """The owner's rule set, synced to their current template rows"""
+        with self._lock:
+            rules = self._sets.get(user_id)
+            if rules is None:
+                rules = RuleSet()
+                if self.max_users > 0:
+                    self._sets[user_id] = rules
+                    if len(self._sets) > self.max_users:
+                        self._sets.popitem(last=False)
+            else:
+                self._sets.move_to_end(user_id)
+        rules.sync(rows)
+        return rules
+
+    def clear(self):
+        with self._lock:
+            self._sets.clear()
+
+
+# Shared per-process engine
+engine = RuleEngine()
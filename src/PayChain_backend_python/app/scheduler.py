@@ -0,0 +1,288 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from sqlalchemy import func
+
+from app import crud, models, sketches
+from app.database import SessionLocal
+
+logger = logging.getLogger("scheduled_payments")
+
+# Daemon configuration
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", "5"))
+SCHEDULER_METRICS_PORT = int(os.getenv("SCHEDULER_METRICS_PORT", "0"))
+# Processed change-log rows are deleted once they are this old
+SCHEDULER_CHANGE_RETENTION = timedelta(days=1)
+
+
+def _due_at(due_date: date) -> datetime:
+    # Schedules become due at local midnight, matching date.today() in the processor
+    return datetime.combine(due_date, datetime.min.time())
+
+
+class SchedulerDaemon:
+    """Process scheduled payments as they come due.
+
+    Active schedules are kept in a min-heap of (due date, id). The daemon
+    sleeps until the earliest entry is due, processes only those rows, and
+    re-pushes them with their new next_payment_date. New and updated
+    schedules are picked up from the scheduled_payment_changes log (and
+    immediately, via a crud listener, when running in the API process).
+    All state lives in the database, so a restart simply rebuilds the heap.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        chunk_size: int = crud.SCHEDULER_CHUNK_SIZE,
+        poll_seconds: float = SCHEDULER_POLL_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.poll_seconds = poll_seconds
+
+        self._heap = []
+        self._scheduled: Dict[int, date] = {}  # canonical due date per id; heap entries may be stale
+        self._pending_changes = set()
+        self._change_cursor = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        # Metrics
+        self.lag_seconds = 0.0
+        self.processed_total = 0
+        self.runs_total = 0
+        self.last_run_at: Optional[datetime] = None
+
+    # Heap maintenance
+    def _schedule(self, payment_id: int, due_date: Optional[date]):
+        if due_date is None:
+            self._scheduled.pop(payment_id, None)
+            return
+        if self._scheduled.get(payment_id) == due_date:
+            return
+        self._scheduled[payment_id] = due_date
+        heapq.heappush(self._heap, (due_date, payment_id))
+
+    def _peek(self):
+        # Drop entries superseded by a later _schedule call
+        while self._heap:
+            due_date, payment_id = self._heap[0]
+            if self._scheduled.get(payment_id) == due_date:
+                return due_date, payment_id
+            heapq.heappop(self._heap)
+        return None
+
+    @property
+    def heap_size(self) -> int:
+        return len(self._scheduled)
+
+    def load(self):
+        """Rebuild the heap from the database"""
+        db = self.session_factory()
+        try:
+            self._change_cursor = db.query(func.max(models.ScheduledPaymentChange.id)).scalar() or 0
+            rows = db.query(
+                models.ScheduledPayment.id,
+                models.ScheduledPayment.next_payment_date
+            ).filter(
+                models.ScheduledPayment.is_active == True,
+                models.ScheduledPayment.recipient_unresolvable == False,
+                models.ScheduledPayment.next_payment_date.isnot(None)
+            )
+            with self._lock:
+                self._heap = [(due_date, payment_id) for payment_id, due_date in rows]
+                heapq.heapify(self._heap)
+                self._scheduled = {payment_id: due_date for due_date, payment_id in self._heap}
+        finally:
+            db.close()
+        logger.info(f"Loaded {self.heap_size} active scheduled payments")
+
+    # Change notification
+    def notify(self, payment_id: int):
+        """crud listener: re-read this schedule before the next wait"""
+        with self._lock:
+            self._pending_changes.add(payment_id)
+        self._wake.set()
+
+    def _refresh(self, db, payment_ids, retry_date: Optional[date] = None):
+        rows = dict(db.query(
+            models.ScheduledPayment.id,
+            models.ScheduledPayment.next_payment_date
+        ).filter(
+            models.ScheduledPayment.id.in_(payment_ids),
+            models.ScheduledPayment.is_active == True,
+            models.ScheduledPayment.recipient_unresolvable == False
+        ))
+        with self._lock:
+            for payment_id in payment_ids:
+                due_date = rows.get(payment_id)
+                # Still due after processing (e.g. insufficient funds): retry tomorrow,
+                # the same cadence the daily cron job had
+                if due_date is not None and retry_date is not None and due_date < retry_date:
+                    due_date = retry_date
+                self._schedule(payment_id, due_date)
+
+    def _apply_changes(self, db):
+        changes = db.query(
+            models.ScheduledPaymentChange.id,
+            models.ScheduledPaymentChange.scheduled_payment_id
+        ).filter(
+            models.ScheduledPaymentChange.id > self._change_cursor
+        ).order_by(models.ScheduledPaymentChange.id).all()
+
+        with self._lock:
+            payment_ids = self._pending_changes | {payment_id for _, payment_id in changes}
+            self._pending_changes = set()
+        if changes:
+            self._change_cursor = changes[-1][0]
+        if payment_ids:
+            self._refresh(db, list(payment_ids))
+
+    def _prune_changes(self, db):
+        db.query(models.ScheduledPaymentChange).filter(
+            models.ScheduledPaymentChange.id <= self._change_cursor,
+            models.ScheduledPaymentChange.created_at < datetime.utcnow() - SCHEDULER_CHANGE_RETENTION
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    # Main loop
+    def _pop_due(self, today: date):
+        due_ids = []
+        oldest = None
+        with self._lock:
+            while True:
+                entry = self._peek()
+                if entry is None or entry[0] > today:
+                    break
+                due_date, payment_id = heapq.heappop(self._heap)
+                del self._scheduled[payment_id]
+                oldest = oldest or due_date
+                due_ids.append(payment_id)
+        return due_ids, oldest
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        """Apply pending changes and process everything due; returns payments made"""
+        now = now or datetime.now()
+        today = now.date()
+        db = self.session_factory()
+        try:
+            self._apply_changes(db)
+            due_ids, oldest = self._pop_due(today)
+            if not due_ids:
+                return 0
+
+            self.lag_seconds = max(0.0, (now - _due_at(oldest)).total_seconds())
+            stats = crud.process_scheduled_payment_ids(db, due_ids, today, self.chunk_size)
+            self._refresh(db, due_ids, retry_date=today + timedelta(days=1))
+
+            self.processed_total += stats["processed"]
+            self.runs_total += 1
+            self.last_run_at = now
+            logger.info(
+                f"Processed {stats['processed']} of {len(due_ids)} due payments "
+                f"(lag {self.lag_seconds:.1f}s, {self.heap_size} scheduled)"
+            )
+            return stats["processed"]
+        finally:
+            db.close()
+
+    def _seconds_until_due(self) -> float:
+        with self._lock:
+            entry = self._peek()
+        if entry is None:
+            return self.poll_seconds
+        wait = (_due_at(entry[0]) - datetime.now()).total_seconds()
+        return max(0.0, min(wait, self.poll_seconds))
+
+    def run(self):
+        """Run until stop() is called; safe to restart at any time"""
+        crud.add_schedule_change_listener(self.notify)
+        self.load()
+        last_prune = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                    if time.monotonic() - last_prune > 3600:
+                        db = self.session_factory()
+                        try:
+                            self._prune_changes(db)
+                            # Keeps analytics_sketches bounded to SKETCH_RETENTION_DAYS of buckets
+                            pruned = sketches.prune_sketches(db)
+                            if pruned["deleted"]:
+                                logger.info(f"Pruned {pruned['deleted']} expired analytics sketches")
+                        finally:
+                            db.close()
+                        last_prune = time.monotonic()
+                except Exception as e:
+                    logger.error(f"Scheduler iteration failed: {str(e)}")
+
+                self._wake.wait(self._seconds_until_due())
+                self._wake.clear()
+        finally:
+            crud.remove_schedule_change_listener(self.notify)
+            logger.info("Scheduler daemon stopped")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # Metrics
+    def current_lag_seconds(self) -> float:
+        """Seconds the oldest overdue schedule has been waiting (0 if none)"""
+        with self._lock:
+            entry = self._peek()
+        if entry is None:
+            return 0.0
+        return max(0.0, (datetime.now() - _due_at(entry[0])).total_seconds())
+
+    def metrics_text(self) -> str:
+        lines = [
+            "# HELP paychain_scheduler_lag_seconds Delay between due time and processing of the last run",
+            "# TYPE paychain_scheduler_lag_seconds gauge",
+            f"paychain_scheduler_lag_seconds {self.lag_seconds}",
+            "# HELP paychain_scheduler_overdue_seconds Age of the oldest schedule still waiting",
+            "# TYPE paychain_scheduler_overdue_seconds gauge",
+            f"paychain_scheduler_overdue_seconds {self.current_lag_seconds()}",
+            "# HELP paychain_scheduler_scheduled Active schedules tracked in the heap",
+            "# TYPE paychain_scheduler_scheduled gauge",
+            f"paychain_scheduler_scheduled {self.heap_size}",
+            "# HELP paychain_scheduler_processed_total Scheduled payments executed",
+            "# TYPE paychain_scheduler_processed_total counter",
+            f"paychain_scheduler_processed_total {self.processed_total}",
+            "# HELP paychain_scheduler_runs_total Processing runs with due schedules",
+            "# TYPE paychain_scheduler_runs_total counter",
+            f"paychain_scheduler_runs_total {self.runs_total}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(daemon: SchedulerDaemon, port: int = SCHEDULER_METRICS_PORT) -> ThreadingHTTPServer:
+    """Expose daemon metrics in Prometheus text format on a background thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = daemon.metrics_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
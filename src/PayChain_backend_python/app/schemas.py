@@ -130,11 +130,35 @@ class PaymentTemplate(PaymentTemplateBase):
     owner_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    recipient_id: Optional[int] = None
     conditions: List[TemplateCondition] = []
 
     class Config:
         orm_mode = True
 
+# Template evaluation schemas
+class TemplateEvaluationTransaction(BaseModel):
+    amount: float
+    category: Optional[str] = None
+    tags: List[str] = []
+    metadata: Dict[str, Any] = {}
+    # Defaults to now; time conditions compare the UTC time of day
+    timestamp: Optional[datetime] = None
+
+class TemplateEvaluationRequest(BaseModel):
+    transactions: List[TemplateEvaluationTransaction] = Field(..., min_items=1, max_items=1000)
+
+class InvalidTemplate(BaseModel):
+    template_id: int
+    detail: str
+
+class TemplateEvaluation(BaseModel):
+    # Matching template ids for each transaction, in request order
+    matches: List[List[int]]
+    templates: int
+    candidates_checked: int
+    invalid_templates: List[InvalidTemplate] = []
+
 # Scheduled payment frequency
 class ScheduledPaymentFrequency(str, Enum):
     ONCE = "once"
@@ -177,10 +201,27 @@ class ScheduledPayment(ScheduledPaymentBase):
     last_processed: Optional[datetime] = None
     next_payment_date: Optional[date] = None
     payments_made: int = 0
+    recipient_id: Optional[int] = None
+    recipient_unresolvable: bool = False
 
     class Config:
         orm_mode = True
 
+class ForecastDay(BaseModel):
+    date: date
+    outgoing: float
+    incoming: float
+    payment_count: int
+    balance: Optional[float] = None
+
+class CashFlowForecast(BaseModel):
+    start_date: date
+    end_date: date
+    starting_balance: Optional[float] = None
+    total_outgoing: float
+    total_incoming: float
+    series: List[ForecastDay]
+
 # NFT Receipt schemas
 class NFTReceiptBase(BaseModel):
     transaction_id: int
@@ -201,6 +242,55 @@ class NFTReceipt(NFTReceiptBase):
         # Configure field mappings for SQLAlchemy model to Pydantic schema
         fields = {'receipt_metadata': 'metadata'}
 
+# Notification schemas
+class Notification(BaseModel):
+    id: int
+    type: str
+    title: str
+    message: str
+    data: Optional[Dict[str, Any]] = None
+    read: bool
+    created_at: datetime
+    
+    class Config:
+        orm_mode = True
+
+class NotificationList(BaseModel):
+    items: List[Notification]
+    unread_count: int
+
+class UnreadCount(BaseModel):
+    count: int
+
+# Job schemas
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class JobCreate(BaseModel):
+    job_type: str
+    params: Dict[str, Any] = {}
+
+class Job(BaseModel):
+    id: int
+    job_type: str
+    status: JobStatus
+    params: Optional[Dict[str, Any]] = None
+    progress: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_by: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
 # Report schemas
 class TransactionSummary(BaseModel):
     total_sent: float
@@ -223,4 +313,14 @@ class SpendingByCategory(BaseModel):
     categories: List[CategorySpending]
     period: str
     start_date: datetime
-    end_date: datetime 
\ No newline at end of file
+    end_date: datetime 
+
+class CounterpartyStats(BaseModel):
+    distinct_counterparties: Optional[int] = None
+    unique_payers: int
+    payment_count: int
+    median_payment: Optional[float] = None
+    p95_payment: Optional[float] = None
+    approximate: bool
+    start_date: datetime
+    end_date: datetime
@@ -0,0 +1,194 @@
+"""Production launcher for the API.
+
+    python -m app.server
+
+A supervisor process imports the app once (workers are forked from it and
+share the loaded modules), applies pending migrations, binds the listening
+socket and forks WEB_CONCURRENCY uvicorn workers, restarting any that die.
+
+On SIGTERM each worker drains: GET /ready answers 503 for DRAIN_SECONDS while
+requests are still served, so the load balancer stops routing to it; then it
+stops accepting connections and waits up to GRACEFUL_TIMEOUT seconds for
+in-flight requests before running the shutdown handlers. run.py remains the
+single-process development server with auto-reload.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import signal
+import sys
+import time
+
+from app import migrations, readiness
+from app.database import engine
+
+logger = logging.getLogger("server")
+
+
+def _cpu_count() -> int:
+    try:
+        # Cores this process may run on (containers often get fewer than the host has)
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# One worker (event loop plus its threadpool) per core by default
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(_cpu_count())))
+# Event loop and HTTP parser: uvloop and httptools when installed
+SERVER_LOOP = os.getenv("SERVER_LOOP", "uvloop" if _installed("uvloop") else "asyncio")
+SERVER_HTTP = os.getenv("SERVER_HTTP", "httptools" if _installed("httptools") else "h11")
+# Longer than the usual 60s load balancer idle timeout, so the balancer closes idle connections first
+KEEPALIVE_SECONDS = int(os.getenv("KEEPALIVE_SECONDS", "65"))
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+DRAIN_SECONDS = float(os.getenv("DRAIN_SECONDS", "5"))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+
+# Worker exit status when the app's startup handlers fail; restarting would not help
+STARTUP_FAILURE = 3
+
+
+def _server_class():
+    import uvicorn
+
+    class DrainingServer(uvicorn.Server):
+        """uvicorn.Server that drains for DRAIN_SECONDS on SIGTERM before shutting down"""
+
+        def handle_exit(self, sig, frame):
+            if sig != signal.SIGTERM or not self.started or self.should_exit or readiness.state.draining_since:
+                return super().handle_exit(sig, frame)
+            readiness.state.start_draining()
+            logger.info(f"Worker {os.getpid()} draining for {DRAIN_SECONDS}s")
+            asyncio.get_running_loop().call_later(DRAIN_SECONDS, super().handle_exit, sig, frame)
+
+    return DrainingServer
+
+
+class Supervisor:
+    """Forks the workers and keeps WEB_CONCURRENCY of them running"""
+
+    def __init__(self, config, sock, workers: int):
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        self.children = set()
+        self.stopping_at = None
+        self.exit_code = 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+        # Worker process
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        code = 0
+        try:
+            server = _server_class()(self.config)
+            server.run(sockets=[self.sock])
+            if not server.started:
+                code = STARTUP_FAILURE
+        except Exception:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            code = 1
+        # Never return into the supervisor loop
+        sys.exit(code)
+
+    def stop(self, sig=signal.SIGTERM, frame=None):
+        if self.stopping_at is None:
+            self.stopping_at = time.monotonic()
+            logger.info(f"Stopping {len(self.children)} workers")
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info(f"Started {self.workers} workers on {self.config.host}:{self.config.port} "
+                    f"(loop={self.config.loop}, http={self.config.http})")
+
+        deadline = DRAIN_SECONDS + GRACEFUL_TIMEOUT + 5
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                if self.stopping_at is not None and time.monotonic() - self.stopping_at > deadline:
+                    logger.error(f"Killing {len(self.children)} workers that did not stop in {deadline}s")
+                    for child in self.children:
+                        os.kill(child, signal.SIGKILL)
+                time.sleep(0.2)
+                continue
+
+            self.children.discard(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping_at is not None:
+                continue
+            if code == STARTUP_FAILURE:
+                logger.error(f"Worker {pid} failed to start; stopping")
+                self.exit_code = STARTUP_FAILURE
+                self.stop()
+                continue
+            logger.warning(f"Worker {pid} exited with status {code}; restarting")
+            time.sleep(1)
+            self.spawn()
+        return self.exit_code
+
+
+def _check_hashing_processes():
+    from app import hashing
+    total = WEB_CONCURRENCY * hashing.HASHING_WORKERS
+    if total > _cpu_count():
+        logger.warning(
+            f"{WEB_CONCURRENCY} workers x HASHING_WORKERS={hashing.HASHING_WORKERS} run up to {total} "
+            f"bcrypt processes on {_cpu_count()} cores; logins will compete with requests for CPU"
+        )
+
+
+def main():
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Read by app.hashing, imported below, to size each worker's hashing pool
+    os.environ["WEB_CONCURRENCY"] = str(WEB_CONCURRENCY)
+
+    config = uvicorn.Config(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        loop=SERVER_LOOP,
+        http=SERVER_HTTP,
+        workers=WEB_CONCURRENCY,
+        backlog=BACKLOG,
+        timeout_keep_alive=KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        proxy_headers=True,
+        log_level=LOG_LEVEL
+    )
+    # Preload: import the app and the deferred modules once, before forking
+    config.load()
+    readiness.warm_imports()
+    _check_hashing_processes()
+    # Migrate once here rather than racing in every worker
+    migrations.ensure_schema(engine)
+    # Workers must not inherit the supervisor's database connections
+    engine.dispose()
+
+    sock = config.bind_socket()
+    sys.exit(Supervisor(config, sock, WEB_CONCURRENCY).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+import atexit
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+
+logger = logging.getLogger("sketches")
+
+# Sketch kinds stored in the analytics_sketches table
+COUNTERPARTIES = "counterparties"  # HyperLogLog of the other side of each payment
+PAYERS = "payers"                  # HyperLogLog of senders paying the account
+AMOUNTS = "amounts"                # DDSketch of payment sizes
+
+# Error bounds (see ANALYTICS_GUIDE.md):
+# - HyperLogLog with precision 10 uses at most 1 KiB per sketch and has a
+#   standard error of 1.04 / sqrt(2**10) ~= 3.25% on distinct counts.
+# - DDSketch with alpha 0.01 returns quantiles within 1% relative error of
+#   the exact value at the requested rank, using at most 2048 buckets.
+HLL_PRECISION = 10
+DDSKETCH_ALPHA = 0.01
+DDSKETCH_MAX_BUCKETS = 2048
+
+# Daily buckets older than this are deleted by prune_sketches, which the
+# scheduler daemon runs hourly (also the prune_sketches job type)
+SKETCH_RETENTION_DAYS = int(os.getenv("SKETCH_RETENTION_DAYS", "400"))
+SKETCH_PRUNE_BATCH = int(os.getenv("SKETCH_PRUNE_BATCH", "5000"))
+
+# Seconds platform-wide updates are buffered per process before being stored
+SKETCH_FLUSH_SECONDS = float(os.getenv("SKETCH_FLUSH_SECONDS", "10"))
+
+# Session.info key of the platform-wide updates of the current transaction
+_STAGED = "sketches_staged"
+
+
+def _hash64(value) -> int:
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch with 2**precision one-byte registers."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value) -> None:
+        hashed = _hash64(value)
+        width = 64 - self.precision
+        index = hashed >> width
+        # Position of the leftmost 1-bit in the remaining bits
+        rank = width - (hashed & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Small-range correction: linear counting while registers are sparse
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        nonzero = [(i, r) for i, r in enumerate(self.registers) if r]
+        # Sparse encoding (3 bytes per set register) while it is smaller
+        if len(nonzero) * 3 < len(self.registers):
+            body = b"".join(struct.pack(">HB", i, r) for i, r in nonzero)
+            return struct.pack(">BB", 1, self.precision) + body
+        return struct.pack(">BB", 0, self.precision) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        sparse, precision = struct.unpack_from(">BB", data)
+        sketch = cls(precision)
+        if sparse:
+            for offset in range(2, len(data), 3):
+                index, rank = struct.unpack_from(">HB", data, offset)
+                sketch.registers[index] = rank
+        else:
+            sketch.registers = bytearray(data[2:])
+        return sketch
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative-error guarantees.
+
+    Values are counted in logarithmic buckets of ratio gamma = (1+a)/(1-a),
+    so any quantile is reported within a relative error of `alpha`. When
+    more than max_buckets are in use the lowest buckets are collapsed, which
+    keeps memory bounded and only affects the far low tail.
+    """
+
+    def __init__(self, alpha: float = DDSKETCH_ALPHA, max_buckets: int = DDSKETCH_MAX_BUCKETS):
+        self.alpha = alpha
+        self.max_buckets = max_buckets
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, weight: int = 1) -> None:
+        self.count += weight
+        if value <= 0:
+            self.zero_count += weight
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + weight
+        if len(self.bins) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_buckets
+        folded = sum(self.bins.pop(k) for k in keys[:excess])
+        target = keys[excess]
+        self.bins[target] += folded
+
+    def merge(self, other: "DDSketch") -> None:
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge DDSketch sketches with different accuracy")
+        for key, weight in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + weight
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.bins) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_bytes(self) -> bytes:
+        keys = array("i", sorted(self.bins))
+        weights = array("I", (self.bins[k] for k in keys))
+        header = struct.pack(">dIII", self.alpha, self.max_buckets, self.zero_count, len(keys))
+        return header + keys.tobytes() + weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDSketch":
+        alpha, max_buckets, zero_count, size = struct.unpack_from(">dIII", data)
+        offset = struct.calcsize(">dIII")
+        keys = array("i")
+        keys.frombytes(data[offset:offset + size * keys.itemsize])
+        offset += size * keys.itemsize
+        weights = array("I")
+        weights.frombytes(data[offset:offset + size * weights.itemsize])
+
+        sketch = cls(alpha, max_buckets)
+        sketch.bins = dict(zip(keys, weights))
+        sketch.zero_count = zero_count
+        sketch.count = zero_count + sum(weights)
+        return sketch
+
+
+SKETCH_TYPES = {
+    COUNTERPARTIES: HyperLogLog,
+    PAYERS: HyperLogLog,
+    AMOUNTS: DDSketch,
+}
+
+
+def _sketch_filter(query, user_id: Optional[int]):
+    if user_id is None:
+        return query.filter(models.AnalyticsSketch.user_id.is_(None))
+    return query.filter(models.AnalyticsSketch.user_id == user_id)
+
+
+def _select_rows(db: Session, keys) -> Dict[Tuple[Optional[int], str, date], models.AnalyticsSketch]:
+    """Rows of (user_id, kind, bucket) keys, locked until the transaction ends"""
+    sketch = models.AnalyticsSketch
+    user_ids = {user_id for user_id, _, _ in keys if user_id is not None}
+    owner = sketch.user_id.in_(list(user_ids))
+    if any(user_id is None for user_id, _, _ in keys):
+        owner = owner | sketch.user_id.is_(None)
+    rows = db.query(sketch).filter(
+        owner,
+        sketch.kind.in_(list({kind for _, kind, _ in keys})),
+        sketch.bucket.in_(list({bucket for _, _, bucket in keys}))
+    ).order_by(sketch.id).with_for_update()
+    return {(row.user_id, row.kind, row.bucket): row for row in rows if (row.user_id, row.kind, row.bucket) in keys}
+
+
+def _insert_missing(db: Session, keys):
+    """Insert empty sketch rows, skipping any another transaction inserted first"""
+    table = models.AnalyticsSketch.__table__
+    values = [
+        {"user_id": user_id, "kind": kind, "bucket": bucket, "data": SKETCH_TYPES[kind]().to_bytes()}
+        for user_id, kind, bucket in sorted(keys, key=lambda key: (key[0] or 0, key[1], key[2]))
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            insert = sqlite_insert
+        else:
+            # Not imported at startup on SQLite deployments
+            from sqlalchemy.dialects.postgresql import insert
+        db.execute(insert(table).values(values).on_conflict_do_nothing())
+        return
+    for row in values:
+        try:
+            with db.begin_nested():
+                db.execute(table.insert().values(**row))
+        except IntegrityError:
+            pass
+
+
+def _merge_into_rows(db: Session, deltas) -> None:
+    """Merge {(user_id, kind, bucket): sketch} into the stored rows.
+
+    Rows are updated in place under a row lock (unique per key), so
+    concurrent writers merge one after another instead of overwriting.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        # FOR UPDATE is ignored; writing first takes SQLite's write lock before the rows are read
+        _insert_missing(db, deltas.keys())
+        rows = _select_rows(db, deltas.keys())
+    else:
+        rows = _select_rows(db, deltas.keys())
+        missing = set(deltas) - set(rows)
+        if missing:
+            _insert_missing(db, missing)
+            rows.update(_select_rows(db, missing))
+    for key, delta in deltas.items():
+        row = rows[key]
+        sketch = SKETCH_TYPES[key[1]].from_bytes(row.data)
+        sketch.merge(delta)
+        row.data = sketch.to_bytes()
+
+
+class PlatformSketchBuffer:
+    """Platform-wide sketch updates committed in this process but not yet stored.
+
+    Every payment changes the same platform-wide rows, so writing them in the
+    payment's own transaction would make all payments wait on those rows.
+    Committed updates are merged here instead, and flush() writes them in one
+    short transaction: every SKETCH_FLUSH_SECONDS from a background thread,
+    at exit, and before platform-wide stats are read in this process
+    (0 flushes after every commit).
+    """
+
+    def __init__(self, interval: float = SKETCH_FLUSH_SECONDS):
+        self.interval = interval
+        # (kind, bucket) -> sketch of the updates not yet stored
+        self._pending: Dict[Tuple[str, date], object] = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, updates: Dict[Tuple[str, date], object]):
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use, or a forked worker: the parent stores what it buffered
+                self._pending = {}
+                self._pid = os.getpid()
+                if self.interval > 0:
+                    threading.Thread(target=self._run, name="sketch-flush", daemon=True).start()
+            for key, sketch in updates.items():
+                if key in self._pending:
+                    self._pending[key].merge(sketch)
+                else:
+                    self._pending[key] = sketch
+        if self.interval <= 0:
+            self.flush()
+
+    def _run(self):
+        atexit.register(self.flush)
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """Store the buffered updates; returns the number of sketch rows written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            db = SessionLocal()
+            try:
+                _merge_into_rows(db, {(None, kind, bucket): sketch for (kind, bucket), sketch in pending.items()})
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Could not store platform-wide sketches, retrying later: {e}")
+                with self._lock:
+                    for key, sketch in pending.items():
+                        if key in self._pending:
+                            sketch.merge(self._pending[key])
+                        self._pending[key] = sketch
+                return 0
+            finally:
+                db.close()
+            return len(pending)
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+
+
+# Shared per-process buffer
+platform_buffer = PlatformSketchBuffer()
+
+
+def record_transactions(db: Session, payments, timestamp: Optional[datetime] = None):
+    """Fold (sender_id, recipient_id, amount) payments into the daily sketches.
+
+    Per-user rows are merged in the session's transaction; the caller commits
+    them together with the transactions. Platform-wide updates go to
+    platform_buffer once that transaction commits.
+    """
+    if not payments:
+        return
+    bucket = (timestamp or datetime.utcnow()).date()
+
+    # (user_id, kind) -> values to add; user_id None is the platform-wide sketch
+    updates = defaultdict(list)
+    for sender_id, recipient_id, amount in payments:
+        updates[(sender_id, COUNTERPARTIES)].append(recipient_id)
+        updates[(sender_id, AMOUNTS)].append(amount)
+        updates[(recipient_id, COUNTERPARTIES)].append(sender_id)
+        updates[(recipient_id, PAYERS)].append(sender_id)
+        if recipient_id != sender_id:
+            updates[(recipient_id, AMOUNTS)].append(amount)
+        updates[(None, PAYERS)].append(sender_id)
+        updates[(None, AMOUNTS)].append(amount)
+
+    deltas = {}
+    for (user_id, kind), values in updates.items():
+        sketch = SKETCH_TYPES[kind]()
+        for value in values:
+            sketch.add(value)
+        deltas[(user_id, kind, bucket)] = sketch
+
+    staged = db.info.setdefault(_STAGED, {})
+    for user_id, kind, bucket in [key for key in deltas if key[0] is None]:
+        sketch = deltas.pop((user_id, kind, bucket))
+        if (kind, bucket) in staged:
+            staged[(kind, bucket)].merge(sketch)
+        else:
+            staged[(kind, bucket)] = sketch
+    _merge_into_rows(db, deltas)
+
+
+def record_transaction(db: Session, sender_id: int, recipient_id: int, amount: float, timestamp: Optional[datetime] = None):
+    """Fold one payment into the per-user and global daily sketches"""
+    record_transactions(db, [(sender_id, recipient_id, amount)], timestamp)
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_committed_sketches(session: Session):
+    staged = session.info.pop(_STAGED, None)
+    if staged:
+        platform_buffer.add(staged)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_staged_sketches(session: Session):
+    session.info.pop(_STAGED, None)
+
+
+def merge_sketches(db: Session, user_id: Optional[int], kind: str, start_date: date, end_date: date):
+    """Merge the daily buckets of one sketch kind over [start_date, end_date]"""
+    query = db.query(models.AnalyticsSketch.data).filter(
+        models.AnalyticsSketch.kind == kind,
+        models.AnalyticsSketch.bucket >= start_date,
+        models.AnalyticsSketch.bucket <= end_date
+    )
+    merged = SKETCH_TYPES[kind]()
+    for (data,) in _sketch_filter(query, user_id):
+        merged.merge(SKETCH_TYPES[kind].from_bytes(data))
+    return merged
+
+
+def get_approx_counterparty_stats(db: Session, user_id: Optional[int], start_date: datetime, end_date: datetime):
+    """Counterparty and payment-size statistics answered from the sketches"""
+    if user_id is None:
+        # Include what this process has buffered
+        platform_buffer.flush()
+    first_day, last_day = start_date.date(), end_date.date()
+    amounts = merge_sketches(db, user_id, AMOUNTS, first_day, last_day)
+
+    distinct_counterparties = None
+    if user_id is not None:
+        distinct_counterparties = merge_sketches(db, user_id, COUNTERPARTIES, first_day, last_day).count()
+
+    return {
+        "distinct_counterparties": distinct_counterparties,
+        "unique_payers": merge_sketches(db, user_id, PAYERS, first_day, last_day).count(),
+        "payment_count": amounts.count,
+        "median_payment": amounts.quantile(0.5),
+        "p95_payment": amounts.quantile(0.95),
+        "approximate": True,
+        "start_date": start_date,
+        "end_date": end_date
+    }
+
+
+def prune_sketches(
+    db: Session,
+    retention_days: int = SKETCH_RETENTION_DAYS,
+    batch_size: int = SKETCH_PRUNE_BATCH,
+    on_batch: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
+    """Delete daily buckets older than the retention period in id-ordered batches.
+
+    Each batch is one short transaction. on_batch receives each batch's counters.
+    """
+    sketch = models.AnalyticsSketch
+    cutoff = date.today() - timedelta(days=retention_days)
+    stats = {"deleted": 0}
+    while True:
+        ids = [sketch_id for (sketch_id,) in db.query(sketch.id).filter(
+            sketch.bucket < cutoff
+        ).order_by(sketch.id).limit(batch_size)]
+        if not ids:
+            break
+        db.query(sketch).filter(sketch.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        stats["deleted"] += len(ids)
+        if on_batch:
+            on_batch({"deleted": len(ids)})
+    return stats
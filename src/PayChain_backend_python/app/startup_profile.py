@@ -0,0 +1,116 @@
+"""Import-time profile of the API worker.
+
+Runs `python -X importtime -c "import app.main"` in fresh interpreters and
+reports where worker startup time goes, per module and per top-level package:
+
+    python -m app.startup_profile                 # table of the slowest imports
+    python -m app.startup_profile --json          # machine-readable report
+    python -m app.startup_profile --budget 1.5    # exit 1 if the median import exceeds 1.5s
+
+./paychain-startup-profile takes the same arguments. The test suite enforces
+STARTUP_BUDGET_SECONDS (tests/test_services/test_startup.py).
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+TARGET = "app.main"
+# Median seconds `import app.main` may take in a fresh interpreter
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5"))
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _run_once(target: str) -> Dict[str, dict]:
+    """module -> {self_us, cumulative_us, depth} for one cold import of target"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=root, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": len(indent) // 2
+            }
+    return modules
+
+
+def profile(target: str = TARGET, runs: int = 5) -> dict:
+    """Median per-module import times over several cold starts"""
+    samples = [_run_once(target) for _ in range(runs)]
+    totals = [sample[target]["cumulative_us"] for sample in samples]
+
+    modules = {}
+    for name in samples[0]:
+        values = [sample[name] for sample in samples if name in sample]
+        modules[name] = {
+            "self_ms": round(statistics.median(v["self_us"] for v in values) / 1000, 2),
+            "cumulative_ms": round(statistics.median(v["cumulative_us"] for v in values) / 1000, 2),
+            "depth": values[0]["depth"]
+        }
+
+    # Self time summed by top-level package, only for modules target pulled in
+    packages: Dict[str, float] = {}
+    for name, module in modules.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + module["self_ms"]
+
+    return {
+        "target": target,
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "total_seconds": round(statistics.median(totals) / 1e6, 3),
+        "max_seconds": round(max(totals) / 1e6, 3),
+        "packages": dict(sorted(((k, round(v, 2)) for k, v in packages.items()), key=lambda kv: -kv[1])),
+        "modules": modules
+    }
+
+
+def _print_table(report: dict, top: int):
+    print(f"import {report['target']}: {report['total_seconds']:.3f}s median of {report['runs']} runs "
+          f"(max {report['max_seconds']:.3f}s)")
+    print(f"\n{'package':40} {'self ms':>10}")
+    for package, self_ms in list(report["packages"].items())[:top]:
+        print(f"{package:40} {self_ms:10.1f}")
+    print(f"\n{'module':60} {'self ms':>10} {'cumul. ms':>10}")
+    ranked: List[tuple] = sorted(report["modules"].items(), key=lambda kv: -kv[1]["self_ms"])
+    for name, module in ranked[:top]:
+        print(f"{name:60} {module['self_ms']:10.1f} {module['cumulative_ms']:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time of the API worker per module")
+    parser.add_argument("--target", default=TARGET, help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Cold imports to take the median of")
+    parser.add_argument("--top", type=int, default=25, help="Rows per table")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    parser.add_argument("--budget", type=float, help="Exit 1 if the median import takes longer (seconds)")
+    args = parser.parse_args()
+
+    report = profile(args.target, args.runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_table(report, args.top)
+
+    if args.budget is not None and report["total_seconds"] > args.budget:
+        print(f"Startup budget exceeded: import {args.target} took {report['total_seconds']:.3f}s, "
+              f"budget {args.budget:.3f}s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Per-request overhead of auth.get_current_user, with and without its caches.
+
+Creates one user in a fresh SQLite file and resolves the same bearer token
+repeatedly:
+
+    python benchmarks/auth_benchmark.py --iterations 20000
+
+"uncached" clears the token and user caches before every call, which is the
+cost of the original jwt.decode + SELECT path; "cached" is the steady state
+of a client reusing its token.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def _measure(auth, token, db, iterations: int, clear: bool) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if clear:
+            auth.clear_auth_caches()
+        await auth.get_current_user(token, db)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark get_current_user")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="paychain-auth-bench-"), "auth.db")
+    # Must be set before app.database is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    from app import auth, models
+    from app.database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add(models.User(email="bench@example.com", principal_id="bench", hashed_password="!"))
+        db.commit()
+        token = auth.create_access_token(data={"sub": "bench@example.com"})
+
+        uncached = asyncio.run(_measure(auth, token, db, args.iterations, clear=True))
+        auth.clear_auth_caches()
+        cached = asyncio.run(_measure(auth, token, db, args.iterations, clear=False))
+    finally:
+        db.close()
+        os.remove(db_path)
+
+    print(json.dumps({
+        "benchmark": "get_current_user",
+        "iterations": args.iterations,
+        "uncached_us": round(uncached * 1e6, 1),
+        "cached_us": round(cached * 1e6, 1),
+        "speedup": round(uncached / cached, 1) if cached else None
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Scaling microbenchmarks for app.crud functions.
+
+Grows one SQLite database through increasing transaction counts and, at each
+size, times the crud functions behind the hot endpoints, counts the SQL
+statements they issue and measures their peak Python allocations:
+
+    python benchmarks/crud_benchmark.py --sizes 1000,100000,10000000 --output crud.json
+
+The user population is fixed (--users), so per-user history grows with the
+table, as it does in production. Each function gets a scaling curve and the
+slope of log(time) against log(size); functions whose slope exceeds
+--superlinear are flagged, and the script exits with status 1.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATEGORIES = ["Food", "Rent", "Travel", "Utilities", "Shopping"]
+INSERT_BATCH = 10000
+# One due scheduled payment per this many transactions
+TRANSACTIONS_PER_SCHEDULE = 100
+# Transactions are spread over this many days before now
+HISTORY_DAYS = 365
+# The user every per-user function is measured for
+BENCH_USER = 1
+
+
+class Dataset:
+    """The benchmark database, grown in place from one size to the next"""
+
+    def __init__(self, engine, users: int, seed: int):
+        from app import models
+
+        self.engine = engine
+        self.users = users
+        self.rng = random.Random(seed)
+        self.transactions = 0
+        self.schedules = 0
+        self.now = datetime.utcnow()
+
+        models.Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(models.User.__table__.insert(), [
+                {
+                    "id": user_id,
+                    "email": f"user{user_id}@example.com",
+                    "principal_id": f"principal-{user_id}",
+                    "hashed_password": "!",
+                    "is_active": True,
+                    "balance": 1e12
+                }
+                for user_id in range(1, users + 1)
+            ])
+            conn.execute(models.PaymentTemplate.__table__.insert(), {
+                "id": 1, "owner_id": BENCH_USER, "name": "Rent", "recipient_principal": "principal-2",
+                "recipient_id": 2, "amount": 500.0, "is_active": True
+            })
+
+    def grow_to(self, transactions: int):
+        from app import models
+
+        with self.engine.begin() as conn:
+            rows = []
+            for _ in range(self.transactions, transactions):
+                sender = self.rng.randint(1, self.users)
+                recipient = self.rng.randint(1, self.users - 1)
+                rows.append({
+                    "sender_id": sender,
+                    "recipient_id": recipient if recipient < sender else recipient + 1,
+                    "amount": round(self.rng.lognormvariate(3, 1), 2),
+                    "description": "Seeded payment",
+                    "status": models.TransactionStatus.COMPLETED.name,
+                    "timestamp": self.now - timedelta(seconds=self.rng.randint(0, HISTORY_DAYS * 86400)),
+                    "category": self.rng.choice(CATEGORIES)
+                })
+                if len(rows) >= INSERT_BATCH:
+                    conn.execute(models.Transaction.__table__.insert(), rows)
+                    rows = []
+            if rows:
+                conn.execute(models.Transaction.__table__.insert(), rows)
+
+            schedules = transactions // TRANSACTIONS_PER_SCHEDULE
+            rows = []
+            for _ in range(self.schedules, schedules):
+                payer = self.rng.randint(1, self.users)
+                recipient = payer % self.users + 1
+                rows.append({
+                    "user_id": payer,
+                    "recipient_principal": f"principal-{recipient}",
+                    "recipient_id": recipient,
+                    "recipient_unresolvable": False,
+                    "amount": 10.0,
+                    "start_date": date.today(),
+                    "frequency": models.ScheduledPaymentFrequency.MONTHLY.name,
+                    "is_active": True,
+                    "next_payment_date": date.today(),
+                    "payments_made": 0
+                })
+                if len(rows) >= INSERT_BATCH:
+                    conn.execute(models.ScheduledPayment.__table__.insert(), rows)
+                    rows = []
+            if rows:
+                conn.execute(models.ScheduledPayment.__table__.insert(), rows)
+        self.transactions = transactions
+        self.schedules = schedules
+
+    def reset_schedules(self):
+        """Make every scheduled payment due again"""
+        from app import models
+
+        with self.engine.begin() as conn:
+            conn.execute(models.ScheduledPayment.__table__.update().values(
+                next_payment_date=date.today(), is_active=True, payments_made=0,
+                lease_owner=None, lease_expires_at=None
+            ))
+
+    def unreceipted_transactions(self, count: int):
+        """Ids of the newest payments that have no NFT receipt yet"""
+        from app import models
+
+        t, r = models.Transaction.__table__, models.NFTReceipt.__table__
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(
+                t.select().with_only_columns(t.c.id).where(
+                    ~t.c.id.in_(r.select().with_only_columns(r.c.transaction_id))
+                ).order_by(t.c.id.desc()).limit(count)
+            )]
+
+
+def _cases(dataset: Dataset, repeat: int):
+    """name -> (setup, call); setup runs untimed before each call and returns its argument"""
+    from app import crud, schemas
+    from app.database import SessionLocal
+
+    since = datetime.utcnow() - timedelta(days=HISTORY_DAYS)
+    receipt_ids = []
+
+    def next_receipt():
+        if not receipt_ids:
+            receipt_ids.extend(dataset.unreceipted_transactions(repeat * 2 + 2))
+        return receipt_ids.pop()
+
+    return {
+        "create_transaction": (None, lambda db, _: crud.create_transaction(
+            db, schemas.TransactionCreate(recipient_principal="principal-2", amount=1.0, category="Food"),
+            BENCH_USER
+        )),
+        "get_user_transactions": (None, lambda db, _: crud.get_user_transactions(db, BENCH_USER)),
+        "generate_transaction_report": (None, lambda db, _: crud.generate_transaction_report(
+            db, BENCH_USER, start_date=since
+        )),
+        "get_spending_by_category": (None, lambda db, _: crud.get_spending_by_category(
+            db, BENCH_USER, start_date=since
+        )),
+        "process_scheduled_payments": (dataset.reset_schedules, lambda db, _: crud.process_scheduled_payments(
+            db, date.today(), workers=1, session_factory=SessionLocal
+        )),
+        "create_nft_receipt": (next_receipt, lambda db, transaction_id: crud.create_nft_receipt(
+            db, transaction_id, BENCH_USER
+        )),
+        "update_payment_template": (None, lambda db, _: crud.update_payment_template(
+            db, 1, schemas.PaymentTemplateUpdate(
+                amount=round(random.uniform(100, 900), 2),
+                conditions=[
+                    {"condition_type": "amount", "operator": "less_than", "value": "1000"},
+                    {"condition_type": "category", "operator": "equals", "value": "Rent"}
+                ]
+            )
+        )),
+    }
+
+
+def _measure(setup, call, repeat: int, counters: dict) -> dict:
+    from app.database import SessionLocal
+
+    def run_once():
+        argument = setup() if setup else None
+        db = SessionLocal()
+        try:
+            statements = counters["statements"]
+            started = time.perf_counter()
+            call(db, argument)
+            return time.perf_counter() - started, counters["statements"] - statements
+        finally:
+            db.close()
+
+    timings = []
+    statements = 0
+    for _ in range(repeat):
+        seconds, statements = run_once()
+        timings.append(seconds)
+
+    # Separate run: tracemalloc slows everything it traces
+    tracemalloc.start()
+    try:
+        run_once()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": round(statistics.median(timings), 6),
+        "min_seconds": round(min(timings), 6),
+        "statements": statements,
+        "alloc_peak_kb": round(peak / 1024, 1)
+    }
+
+
+def _slope(points) -> float:
+    """Least-squares slope of log(value) against log(size)"""
+    xs = [math.log(size) for size, value in points if value > 0]
+    ys = [math.log(value) for size, value in points if value > 0]
+    if len(xs) < 2:
+        return 0.0
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(args) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="paychain-crud-bench-"), "bench.db")
+    # Must be set before app.database is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    from sqlalchemy import event
+    from app import sketches
+    from app.database import engine
+
+    counters = {"statements": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        counters["statements"] += 1
+
+    sizes = sorted(args.sizes)
+    dataset = Dataset(engine, args.users, args.seed)
+    curves = {}
+    generate_seconds = 0.0
+    try:
+        for size in sizes:
+            started = time.perf_counter()
+            dataset.grow_to(size)
+            generate_seconds += time.perf_counter() - started
+            for name, (setup, call) in _cases(dataset, args.repeat).items():
+                if args.functions and name not in args.functions:
+                    continue
+                point = _measure(setup, call, args.repeat, counters)
+                curves.setdefault(name, []).append({"transactions": size, **point})
+                print(
+                    f"{name:30} {size:>10} rows  {point['seconds'] * 1000:10.2f} ms"
+                    f"  {point['statements']:6} statements  {point['alloc_peak_kb']:10.1f} KiB",
+                    file=sys.stderr
+                )
+    finally:
+        # Buffered platform-wide sketches, before the database is removed
+        sketches.platform_buffer.flush()
+        if not args.keep:
+            os.remove(db_path)
+
+    functions = {}
+    for name, points in curves.items():
+        time_slope = _slope([(p["transactions"], p["seconds"]) for p in points])
+        functions[name] = {
+            "time_slope": round(time_slope, 2),
+            "statements_slope": round(_slope([(p["transactions"], p["statements"]) for p in points]), 2),
+            "superlinear": time_slope > args.superlinear,
+            "points": points
+        }
+
+    return {
+        "benchmark": "crud_scaling",
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "parameters": {
+            "sizes": sizes,
+            "users": args.users,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "superlinear": args.superlinear
+        },
+        "generate_seconds": round(generate_seconds, 3),
+        "functions": functions,
+        "superlinear": sorted(name for name, result in functions.items() if result["superlinear"])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crud functions across dataset sizes")
+    parser.add_argument("--sizes", type=lambda v: [int(s) for s in v.split(",")],
+                        default=[1000, 100000, 10000000], help="Comma-separated transaction counts")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per function and size")
+    parser.add_argument("--functions", type=lambda v: v.split(","), help="Only these functions")
+    parser.add_argument("--superlinear", type=float, default=1.2,
+                        help="Flag functions whose log-log time slope exceeds this")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated database")
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+
+    result = run_benchmark(args)
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+    for name in result["superlinear"]:
+        print(f"SUPERLINEAR {name}: time slope {result['functions'][name]['time_slope']}", file=sys.stderr)
+    if result["superlinear"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+"""HTTP load test for app.main:app with a regression check against a baseline.
+
+Seeds users, transactions, templates and scheduled payments into a fresh
+SQLite file, serves the app in-process (ASGI transport) or under uvicorn on
+localhost, and drives a weighted mix of API calls from concurrent virtual
+users for a fixed duration:
+
+    python benchmarks/load_test.py --duration 30 --concurrency 20 --output load.json
+    python benchmarks/load_test.py --mode uvicorn --workers 2 --baseline load.json
+
+The report has throughput and p50/p95/p99 latency per operation. Latency of
+failing requests would not measure the operation, so any operation with
+errors fails the run (exit status 1); --exclude drops operations from the
+mix. With --baseline, operations whose p95 grew by more than --threshold
+(and overall throughput falling by more than it) are listed and the script
+exits with status 1, as it does for a baseline that recorded errors.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+PASSWORD = "benchmark-password"
+CATEGORIES = ["Food", "Rent", "Travel", "Utilities", "Shopping"]
+INSERT_BATCH = 10000
+
+# Relative weight of each operation in the mix
+WORKLOAD_MIX = {
+    "login": 2,
+    "create_payment": 10,
+    "list_transactions": 15,
+    "list_transactions_filtered": 10,
+    "balance": 15,
+    "transaction_summary": 6,
+    "spending_categories": 6,
+    "list_templates": 10,
+    "create_template": 3,
+    "list_scheduled_payments": 10,
+    "create_scheduled_payment": 3,
+}
+# Operations with fewer samples than this in the baseline are not compared
+MIN_SAMPLES = 20
+
+
+def _seed(users: int, transactions_per_user: int, seed: int):
+    """Populate the database named by DATABASE_URL"""
+    from app import models
+    from app.database import engine
+    from app.hashing import pwd_context
+
+    rng = random.Random(seed)
+    models.Base.metadata.create_all(bind=engine)
+    # Every user shares one password, so it is hashed once
+    hashed_password = pwd_context.hash(PASSWORD)
+    now = datetime.utcnow()
+
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {
+                "id": user_id,
+                "email": f"user{user_id}@example.com",
+                "principal_id": f"principal-{user_id}",
+                "hashed_password": hashed_password,
+                "is_active": True,
+                # Enough that payments never run out during a run
+                "balance": 1e9
+            }
+            for user_id in range(1, users + 1)
+        ])
+
+        rows = []
+        for transaction_id in range(1, users * transactions_per_user + 1):
+            sender = rng.randint(1, users)
+            recipient = rng.randint(1, users - 1)
+            rows.append({
+                "id": transaction_id,
+                "sender_id": sender,
+                "recipient_id": recipient if recipient < sender else recipient + 1,
+                "amount": round(rng.lognormvariate(3, 1), 2),
+                "description": f"Seeded payment {transaction_id}",
+                "status": models.TransactionStatus.COMPLETED.name,
+                "timestamp": now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+                "category": rng.choice(CATEGORIES),
+                "transaction_metadata": json.dumps({"seeded": True})
+            })
+            if len(rows) >= INSERT_BATCH:
+                conn.execute(models.Transaction.__table__.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(models.Transaction.__table__.insert(), rows)
+
+        conn.execute(models.PaymentTemplate.__table__.insert(), [
+            {
+                "owner_id": user_id,
+                "name": f"Template {i}",
+                "recipient_principal": f"principal-{user_id % users + 1}",
+                "recipient_id": user_id % users + 1,
+                "amount": 25.0,
+                "is_active": True
+            }
+            for user_id in range(1, users + 1) for i in range(3)
+        ])
+        conn.execute(models.ScheduledPayment.__table__.insert(), [
+            {
+                "user_id": user_id,
+                "recipient_principal": f"principal-{user_id % users + 1}",
+                "recipient_id": user_id % users + 1,
+                "recipient_unresolvable": False,
+                "amount": 50.0,
+                "description": "Seeded schedule",
+                "start_date": date.today(),
+                "frequency": models.ScheduledPaymentFrequency.MONTHLY.name,
+                "is_active": True,
+                # Not due, so a scheduler run cannot interfere with the load
+                "next_payment_date": date.today() + timedelta(days=30),
+                "payments_made": 0
+            }
+            for user_id in range(1, users + 1) for _ in range(2)
+        ])
+
+
+class VirtualUser:
+    def __init__(self, user_id: int, users: int, rng: random.Random):
+        self.user_id = user_id
+        self.users = users
+        self.rng = rng
+        self.email = f"user{user_id}@example.com"
+        self.headers = {}
+
+    def other_principal(self) -> str:
+        other = self.rng.randint(1, self.users - 1)
+        return f"principal-{other if other < self.user_id else other + 1}"
+
+    async def login(self, client: httpx.AsyncClient) -> httpx.Response:
+        response = await client.post("/login/", json={"email": self.email, "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+
+async def _create_payment(client, vu):
+    return await client.post("/transactions/", headers=vu.headers, json={
+        "recipient_principal": vu.other_principal(),
+        "amount": round(vu.rng.uniform(1, 50), 2),
+        "description": "Load test payment",
+        "category": vu.rng.choice(CATEGORIES),
+        "metadata": {"source": "load_test"}
+    })
+
+
+async def _list_transactions_filtered(client, vu):
+    start_date = datetime.utcnow() - timedelta(days=vu.rng.choice([7, 30, 90]))
+    return await client.get("/transactions/", headers=vu.headers, params={
+        "start_date": start_date.isoformat(),
+        "skip": vu.rng.choice([0, 20, 40]),
+        "limit": 20
+    })
+
+
+async def _create_template(client, vu):
+    return await client.post("/templates/", headers=vu.headers, json={
+        "name": "Load test template",
+        "recipient_principal": vu.other_principal(),
+        "amount": 10.0,
+        "conditions": [{"condition_type": "amount", "operator": "less_than", "value": "100"}]
+    })
+
+
+async def _create_scheduled_payment(client, vu):
+    return await client.post("/scheduled-payments/", headers=vu.headers, json={
+        "recipient_principal": vu.other_principal(),
+        "amount": 10.0,
+        "start_date": (date.today() + timedelta(days=30)).isoformat(),
+        "frequency": "monthly"
+    })
+
+
+OPERATIONS = {
+    "login": lambda client, vu: vu.login(client),
+    "create_payment": _create_payment,
+    "list_transactions": lambda client, vu: client.get("/transactions/", headers=vu.headers),
+    "list_transactions_filtered": _list_transactions_filtered,
+    "balance": lambda client, vu: client.get("/balance/", headers=vu.headers),
+    "transaction_summary": lambda client, vu: client.get(
+        "/reports/transaction-summary/", headers=vu.headers,
+        params={"period": vu.rng.choice(["week", "month", "year"])}
+    ),
+    "spending_categories": lambda client, vu: client.get(
+        "/reports/spending-categories/", headers=vu.headers,
+        params={"period": vu.rng.choice(["week", "month", "year"])}
+    ),
+    "list_templates": lambda client, vu: client.get("/templates/", headers=vu.headers),
+    "create_template": _create_template,
+    "list_scheduled_payments": lambda client, vu: client.get("/scheduled-payments/", headers=vu.headers),
+    "create_scheduled_payment": _create_scheduled_payment,
+}
+
+
+class OperationStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, seconds: float, status):
+        self.latencies.append(seconds)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors += 1
+
+    def summary(self, duration: float) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(latencies), 4) if latencies else 0.0,
+            "throughput_rps": round(len(latencies) / duration, 1),
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p95_ms": _percentile_ms(latencies, 95),
+            "p99_ms": _percentile_ms(latencies, 99),
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+            "statuses": self.statuses
+        }
+
+
+def _percentile_ms(ordered, percentile: float):
+    if not ordered:
+        return None
+    # Nearest rank
+    index = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+    return round(ordered[index] * 1000, 2)
+
+
+async def _virtual_user(client, vu, mix: dict, stats, measure_from: float, deadline: float):
+    names = list(mix)
+    weights = list(mix.values())
+    while time.perf_counter() < deadline:
+        name = vu.rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = (await OPERATIONS[name](client, vu)).status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        if started >= measure_from:
+            stats[name].record(time.perf_counter() - started, status)
+
+
+async def _drive(client, args) -> dict:
+    rng = random.Random(args.seed)
+    virtual_users = [
+        VirtualUser(rng.randint(1, args.users), args.users, random.Random(rng.random()))
+        for _ in range(args.concurrency)
+    ]
+    for vu in virtual_users:
+        response = await vu.login(client)
+        if response.status_code != 200:
+            raise RuntimeError(f"Login failed with {response.status_code}: {response.text}")
+
+    mix = {name: weight for name, weight in WORKLOAD_MIX.items() if name not in args.exclude}
+    stats = {name: OperationStats() for name in mix}
+    measure_from = time.perf_counter() + args.warmup
+    deadline = measure_from + args.duration
+    await asyncio.gather(*[
+        _virtual_user(client, vu, mix, stats, measure_from, deadline) for vu in virtual_users
+    ])
+    duration = time.perf_counter() - measure_from
+
+    total = sum(len(s.latencies) for s in stats.values())
+    return {
+        "duration_seconds": round(duration, 2),
+        "requests": total,
+        "errors": sum(s.errors for s in stats.values()),
+        "throughput_rps": round(total / duration, 1),
+        "operations": {name: s.summary(duration) for name, s in stats.items()}
+    }
+
+
+async def _run_inprocess(args) -> dict:
+    from app import sketches
+    from app.main import app
+
+    await app.router.startup()
+    try:
+        # Unhandled errors count as 500 responses, as they would over the network
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            return await _drive(client, args)
+    finally:
+        await app.router.shutdown()
+        # Before the database is removed
+        sketches.platform_buffer.flush()
+
+
+async def _run_uvicorn(args, env: dict) -> dict:
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(args.workers), "--log-level", "warning"
+        ],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        async with httpx.AsyncClient(
+            base_url=base_url,
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency)
+        ) as client:
+            ready_by = time.monotonic() + 30
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > ready_by:
+                    raise RuntimeError(f"Server at {base_url} did not become ready")
+                await asyncio.sleep(0.2)
+            return await _drive(client, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def failed_operations(report: dict) -> list:
+    """Operations of a report that had errors, as messages"""
+    return [
+        f"{name}: {op['errors']} of {op['requests']} requests failed {op['statuses']}"
+        for name, op in report["operations"].items() if op["errors"]
+    ]
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """Regressions of `result` against `baseline`, as messages.
+
+    A baseline with errors is rejected rather than compared: its latencies
+    time the error path.
+    """
+    regressions = [f"baseline {message}; record it again" for message in failed_operations(baseline)]
+    if regressions:
+        return regressions
+    if result["throughput_rps"] < baseline["throughput_rps"] * (1 - threshold):
+        regressions.append(
+            f"throughput: {result['throughput_rps']} req/s vs {baseline['throughput_rps']} req/s"
+        )
+    for name, before in baseline["operations"].items():
+        after = result["operations"].get(name)
+        if after is None or not after["requests"] or before["requests"] < MIN_SAMPLES:
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {after['p95_ms']} ms vs {before['p95_ms']} ms")
+    return regressions
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(args) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="paychain-load-test-"), "bench.db")
+    # Must be set before app.database is imported, here and in the server
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+    seed_started = time.perf_counter()
+    _seed(args.users, args.transactions_per_user, args.seed)
+    seed_seconds = time.perf_counter() - seed_started
+
+    try:
+        if args.mode == "uvicorn":
+            result = asyncio.run(_run_uvicorn(args, dict(os.environ)))
+        else:
+            result = asyncio.run(_run_inprocess(args))
+    finally:
+        if not args.keep:
+            os.remove(db_path)
+
+    return {
+        "benchmark": "http_load",
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "parameters": {
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "uvicorn" else None,
+            "users": args.users,
+            "transactions_per_user": args.transactions_per_user,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "rate_limit": args.rate_limit,
+            "excluded": sorted(args.exclude)
+        },
+        "seed_seconds": round(seed_seconds, 3),
+        **result
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP API")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--transactions-per-user", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before the run")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep rate limiting enabled")
+    parser.add_argument("--exclude", default="",
+                        help="Comma-separated operations to leave out of the mix, e.g. create_payment")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", help="Compare against this earlier report")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative regression before failing")
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated database")
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+    args.exclude = {name for name in args.exclude.split(",") if name}
+    unknown = args.exclude - set(WORKLOAD_MIX)
+    if unknown:
+        parser.error(f"Unknown operations in --exclude: {', '.join(sorted(unknown))}")
+    if args.exclude == set(WORKLOAD_MIX):
+        parser.error("--exclude leaves no operations to run")
+
+    result = run_benchmark(args)
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+    errors = failed_operations(result)
+    for message in errors:
+        print(f"ERROR {message}", file=sys.stderr)
+    if errors:
+        print("Latencies of failing operations are not comparable; fix them or pass --exclude", file=sys.stderr)
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != result["parameters"]:
+            print(f"Warning: {args.baseline} was recorded with different parameters", file=sys.stderr)
+        regressions = compare(result, baseline, args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
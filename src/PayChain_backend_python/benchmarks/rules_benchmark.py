@@ -0,0 +1,174 @@
+"""Template condition matching throughput: indexed rule sets vs. checking every template.
+
+Generates one owner's --templates template rows (as crud.get_user_template_rows
+returns them) with a realistic mix of conditions, compiles them with
+app.rules and matches --transactions synthetic transactions:
+
+    python benchmarks/rules_benchmark.py --templates 5000 --transactions 5000 --output rules.json
+
+"indexed" is RuleSet.match_many, which checks only the candidate templates
+its indexes select; "scan" evaluates every compiled template against every
+transaction. Both must return the same matches, otherwise the script exits
+with status 1. The report also times the initial compile and an incremental
+sync after --churn of the templates changed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Merchant categories and tags, so that each rule selects a small share of traffic
+CATEGORIES = [f"category{i}" for i in range(100)]
+TAGS = [f"tag{i}" for i in range(200)]
+AMOUNTS = [5, 10, 20, 50, 100, 250, 500, 1000, 2500]
+
+
+def _condition(rng: random.Random, kind: str) -> dict:
+    from app.models import TemplateConditionOperator as Op, TemplateConditionType as Kind
+
+    if kind == "category":
+        return {"condition_type": Kind.CATEGORY, "operator": Op.EQUALS, "value": rng.choice(CATEGORIES)}
+    if kind == "tag":
+        return {"condition_type": Kind.TAG, "operator": Op.EQUALS, "value": rng.choice(TAGS)}
+    if kind == "amount":
+        operator = rng.choice([Op.GREATER_THAN, Op.LESS_THAN, Op.EQUALS])
+        return {"condition_type": Kind.AMOUNT, "operator": operator, "value": str(rng.choice(AMOUNTS))}
+    if kind == "time":
+        start = rng.randrange(24)
+        window = f"{start:02d}:00-{(start + rng.randint(1, 4)) % 24:02d}:00"
+        return {"condition_type": Kind.TIME, "operator": Op.CONTAINS, "value": window}
+    return {"condition_type": Kind.METADATA, "operator": Op.EQUALS, "value": f"channel={rng.choice(['web', 'pos', 'atm'])}"}
+
+
+def _template(rng: random.Random, template_id: int) -> dict:
+    # Most rules key on a category or tag, refined by amount, time or metadata
+    first = rng.choices(["category", "tag", "amount", "time", "metadata"], weights=[45, 30, 15, 7, 3])[0]
+    kinds = [first] + rng.sample(["amount", "time", "metadata"], rng.randint(0, 2))
+    return {
+        "id": template_id,
+        "owner_id": 1,
+        "name": f"Rule {template_id}",
+        "is_active": rng.random() < 0.9,
+        "conditions": [_condition(rng, kind) for kind in kinds]
+    }
+
+
+def _transactions(rng: random.Random, count: int):
+    from app import rules
+
+    now = datetime.utcnow()
+    return [
+        rules.Candidate(
+            amount=round(rng.lognormvariate(3.5, 1.2), 2),
+            category=rng.choice(CATEGORIES),
+            tags=rng.sample(TAGS, rng.randint(0, 3)),
+            metadata={"channel": rng.choice(["web", "pos", "atm"])},
+            timestamp=now - timedelta(minutes=rng.randrange(7 * 24 * 60))
+        )
+        for _ in range(count)
+    ]
+
+
+def _scan(rule_set, transactions):
+    compiled = [template for template in rule_set.templates.values() if not template.error]
+    return [sorted(template.id for template in compiled if template.matches(tx)) for tx in transactions]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(args) -> dict:
+    from app import rules
+
+    rng = random.Random(args.seed)
+    rows = [_template(rng, template_id) for template_id in range(1, args.templates + 1)]
+    transactions = _transactions(rng, args.transactions)
+
+    rule_set = rules.RuleSet()
+    started = time.perf_counter()
+    rule_set.sync(rows)
+    compile_seconds = time.perf_counter() - started
+    print(f"compiled {len(rule_set.templates)} templates in {compile_seconds:.3f}s", file=sys.stderr)
+
+    # A new list with --churn of the rows replaced, as the list cache publishes after writes
+    changed = list(rows)
+    for index in rng.sample(range(len(changed)), max(1, int(len(changed) * args.churn))):
+        changed[index] = _template(rng, changed[index]["id"])
+    started = time.perf_counter()
+    recompiled = rule_set.sync(changed)
+    sync_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    indexed, checked = rule_set.match_many(transactions)
+    indexed_seconds = time.perf_counter() - started
+    print(f"indexed: {indexed_seconds:.3f}s", file=sys.stderr)
+
+    started = time.perf_counter()
+    scanned = _scan(rule_set, transactions)
+    scan_seconds = time.perf_counter() - started
+    print(f"scan: {scan_seconds:.3f}s", file=sys.stderr)
+
+    return {
+        "benchmark": "template_rules",
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "parameters": {
+            "templates": args.templates,
+            "transactions": args.transactions,
+            "churn": args.churn,
+            "seed": args.seed
+        },
+        "compile_ms": round(compile_seconds * 1000, 1),
+        "incremental_sync": {"recompiled": recompiled, "ms": round(sync_seconds * 1000, 1)},
+        "indexed": {
+            "seconds": round(indexed_seconds, 3),
+            "transactions_per_second": round(args.transactions / indexed_seconds),
+            "candidates_per_transaction": round(checked / args.transactions, 1)
+        },
+        "scan": {
+            "seconds": round(scan_seconds, 3),
+            "transactions_per_second": round(args.transactions / scan_seconds),
+            "candidates_per_transaction": len([t for t in rule_set.templates.values() if not t.error])
+        },
+        "speedup": round(scan_seconds / indexed_seconds, 1),
+        "matches_per_transaction": round(sum(len(m) for m in indexed) / args.transactions, 2),
+        "consistent": indexed == scanned
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark template condition matching")
+    parser.add_argument("--templates", type=int, default=5000)
+    parser.add_argument("--transactions", type=int, default=5000)
+    parser.add_argument("--churn", type=float, default=0.01, help="Fraction of templates changed before matching")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+    if not result["consistent"]:
+        print("MISMATCH: indexed matches differ from scanning every template", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
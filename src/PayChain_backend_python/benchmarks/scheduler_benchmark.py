@@ -0,0 +1,211 @@
+"""Month-end scale benchmark for crud.process_scheduled_payments.
+
+Generates a synthetic population of users and scheduled payments in a fresh
+SQLite file, runs the processor once and prints a JSON report:
+
+    python benchmarks/scheduler_benchmark.py --schedules 1000000 --output result.json
+
+The report contains wall time, schedules/sec, statements and commits issued,
+peak RSS and the processor's own counters, so results from different
+versions can be compared.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Share of each frequency among generated schedules
+FREQUENCY_MIX = {
+    "monthly": 0.45,
+    "weekly": 0.15,
+    "biweekly": 0.10,
+    "once": 0.10,
+    "quarterly": 0.08,
+    "yearly": 0.07,
+    "daily": 0.05,
+}
+INSERT_BATCH = 10000
+
+
+def _generate(users: int, schedules: int, seed: int, today: date, low_balance_share: float):
+    """Populate the database named by DATABASE_URL (runs in a child process)"""
+    from app import models
+    from app.database import engine
+
+    rng = random.Random(seed)
+    models.Base.metadata.create_all(bind=engine)
+    frequencies = list(FREQUENCY_MIX)
+    weights = list(FREQUENCY_MIX.values())
+
+    with engine.begin() as conn:
+        rows = []
+        for user_id in range(1, users + 1):
+            low_balance = rng.random() < low_balance_share
+            rows.append({
+                "id": user_id,
+                "email": f"user{user_id}@example.com",
+                "principal_id": f"principal-{user_id}",
+                "hashed_password": "!",
+                "is_active": True,
+                "balance": rng.uniform(0, 20) if low_balance else rng.uniform(1000, 100000)
+            })
+            if len(rows) >= INSERT_BATCH:
+                conn.execute(models.User.__table__.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(models.User.__table__.insert(), rows)
+
+        rows = []
+        for _ in range(schedules):
+            frequency = rng.choices(frequencies, weights)[0]
+            start_date = today - timedelta(days=rng.randint(0, 400))
+            end_date = None
+            if rng.random() < 0.2:
+                # Some end dates have already passed and get deactivated
+                end_date = today + timedelta(days=rng.randint(-30, 365))
+            max_payments = None
+            payments_made = rng.randint(0, 12)
+            if rng.random() < 0.25:
+                max_payments = rng.randint(1, 24)
+                payments_made = min(payments_made, max_payments)
+            # About 1% of recipients do not exist and are flagged, as
+            # crud.create_scheduled_payment would
+            recipient = rng.randint(1, int(users * 1.01) + 1)
+            rows.append({
+                "user_id": rng.randint(1, users),
+                "recipient_principal": f"principal-{recipient}",
+                "recipient_id": recipient if recipient <= users else None,
+                "recipient_unresolvable": recipient > users,
+                "amount": round(rng.lognormvariate(3, 1), 2),
+                "description": f"Synthetic {frequency} payment",
+                "start_date": start_date,
+                "frequency": models.ScheduledPaymentFrequency(frequency),
+                "end_date": end_date,
+                "max_payments": max_payments,
+                "is_active": True,
+                "next_payment_date": today - timedelta(days=rng.randint(0, 3)),
+                "payments_made": payments_made
+            })
+            if len(rows) >= INSERT_BATCH:
+                conn.execute(models.ScheduledPayment.__table__.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(models.ScheduledPayment.__table__.insert(), rows)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(args) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="paychain-scheduler-bench-"), "bench.db")
+    # Must be set before app.database is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    today = date.today()
+
+    generate_started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    generator = context.Process(
+        target=_generate,
+        args=(args.users, args.schedules, args.seed, today, args.low_balance_share)
+    )
+    generator.start()
+    generator.join()
+    if generator.exitcode != 0:
+        raise RuntimeError("Data generation failed")
+    generate_seconds = time.perf_counter() - generate_started
+
+    from sqlalchemy import event
+    from app import crud, sketches
+    from app.database import SessionLocal, engine
+
+    counters = {"statements": 0, "commits": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        counters["statements"] += 1
+
+    @event.listens_for(engine, "commit")
+    def count_commit(conn):
+        counters["commits"] += 1
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        stats = crud.process_scheduled_payments(
+            db,
+            today,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            session_factory=SessionLocal
+        )
+        wall_seconds = time.perf_counter() - started
+    finally:
+        db.close()
+        # Buffered platform-wide sketches, before the database is removed
+        sketches.platform_buffer.flush()
+
+    if not args.keep:
+        os.remove(db_path)
+
+    return {
+        "benchmark": "scheduled_payments",
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "parameters": {
+            "users": args.users,
+            "schedules": args.schedules,
+            "chunk_size": args.chunk_size,
+            "workers": args.workers,
+            "seed": args.seed,
+            "low_balance_share": args.low_balance_share
+        },
+        "generate_seconds": round(generate_seconds, 3),
+        "wall_seconds": round(wall_seconds, 3),
+        "schedules_per_second": round(stats["due"] / wall_seconds, 1) if wall_seconds else None,
+        "statements": counters["statements"],
+        "commits": counters["commits"],
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "processor": stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scheduled payment processing")
+    parser.add_argument("--schedules", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--low-balance-share", type=float, default=0.1,
+                        help="Share of users whose balance cannot cover their schedules")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated database")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Exactly-once check for lease-based scheduled payment claiming.
+
+Runs several scheduler processes against one SQLite file at the same time,
+plus a "crashing" process that claims chunks and exits without processing
+them, then verifies that every due schedule was paid exactly once and that
+no money was created or lost.
+
+    python benchmarks/scheduler_contention.py --schedules 2000 --processes 4
+
+Prints the result as JSON and exits with status 1 if any schedule was paid
+twice or not at all. tests/test_services/test_scheduler_contention.py runs
+it as part of the test suite.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _setup(db_path: str, users: int, schedules: int, seed: int):
+    from app import models
+    from app.database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rng = random.Random(seed)
+        db.bulk_insert_mappings(models.User, [
+            {
+                "id": user_id,
+                "email": f"user{user_id}@example.com",
+                "principal_id": f"principal-{user_id}",
+                "hashed_password": "!",
+                "balance": 1_000_000.0
+            }
+            for user_id in range(1, users + 1)
+        ])
+        db.bulk_insert_mappings(models.ScheduledPayment, [
+            {
+                "user_id": rng.randint(1, users),
+                "recipient_principal": f"principal-{rng.randint(1, users)}",
+                "amount": float(rng.randint(1, 100)),
+                "description": "contention",
+                "start_date": date.today(),
+                "frequency": models.ScheduledPaymentFrequency.ONCE,
+                "next_payment_date": date.today(),
+                "is_active": True,
+                "payments_made": 0
+            }
+            for _ in range(schedules)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _run_scheduler(chunk_size: int, timeout: float):
+    from sqlalchemy.exc import OperationalError
+    from app import crud
+    from app.database import SessionLocal
+
+    # Keep going until nothing due is left; lock timeouts just mean "retry"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        db = SessionLocal()
+        try:
+            crud.process_scheduled_payments(db, date.today(), chunk_size=chunk_size)
+            remaining = crud._due_scheduled_payments_query(db, date.today()).count()
+        except OperationalError:
+            db.rollback()
+            remaining = 1
+        finally:
+            db.close()
+        if not remaining:
+            return
+        time.sleep(0.05)
+
+
+def _crash_after_claim(chunk_size: int):
+    from app import crud
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    crud.claim_scheduled_payments(db, crud.new_lease_owner(), date.today(), chunk_size)
+    os._exit(0)
+
+
+def _verify(users: int):
+    from sqlalchemy import func
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        paid = dict(db.query(
+            models.ScheduledPaymentTransaction.scheduled_payment_id,
+            func.count()
+        ).group_by(models.ScheduledPaymentTransaction.scheduled_payment_id))
+        schedule_ids = [payment_id for (payment_id,) in db.query(models.ScheduledPayment.id)]
+        duplicated = [payment_id for payment_id in schedule_ids if paid.get(payment_id, 0) > 1]
+        missing = [payment_id for payment_id in schedule_ids if paid.get(payment_id, 0) == 0]
+        total_balance = db.query(func.sum(models.User.balance)).scalar()
+        return {
+            "schedules": len(schedule_ids),
+            "transactions": db.query(models.Transaction).count(),
+            "duplicated": len(duplicated),
+            "missing": len(missing),
+            "balance_conserved": abs(total_balance - users * 1_000_000.0) < 1e-6
+        }
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--schedules", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--lease-seconds", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds each scheduler keeps retrying")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="paychain-contention-"), "contention.db")
+    # Must be set before app.database is imported in this or any child process
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["SCHEDULER_LEASE_SECONDS"] = str(args.lease_seconds)
+
+    _setup(db_path, args.users, args.schedules, args.seed)
+
+    context = multiprocessing.get_context("spawn")
+    crasher = context.Process(target=_crash_after_claim, args=(args.chunk_size,))
+    crasher.start()
+    crasher.join()
+
+    started = time.time()
+    processes = [
+        context.Process(target=_run_scheduler, args=(args.chunk_size, args.timeout))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    result = _verify(args.users)
+    result["processes"] = args.processes
+    result["seconds"] = round(time.time() - started, 2)
+    print(json.dumps(result))
+
+    ok = not result["duplicated"] and not result["missing"] and result["balance_conserved"]
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""List endpoint serialization: pydantic orm_mode path vs. projected rows + orjson.
+
+Creates one user with --rows transactions, templates, scheduled payments and
+NFT receipts in a fresh SQLite file and times producing the JSON body of
+each list endpoint both ways:
+
+    python benchmarks/serialization_benchmark.py --rows 5000
+
+"pydantic" loads ORM objects, validates them through the response schema,
+runs jsonable_encoder and json.dumps, as FastAPI does for a response_model.
+Transactions and receipts cannot go through from_orm (the schemas read
+`metadata` from the model), so they are validated from the ORM attributes
+instead, which still runs parse_metadata per transaction. "fast" is the
+crud *_rows projection rendered by app.fastjson.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _populate(db, rows: int):
+    from app import models
+
+    rng = random.Random(1)
+    db.add_all([
+        models.User(id=1, email="bench@example.com", principal_id="bench", hashed_password="!"),
+        models.User(id=2, email="other@example.com", principal_id="other", hashed_password="!"),
+    ])
+    tags = [models.Tag(id=i, name=f"tag{i}") for i in range(1, 6)]
+    db.add_all(tags)
+    db.flush()
+
+    now = datetime.utcnow()
+    db.execute(models.Transaction.__table__.insert(), [
+        {
+            "id": i,
+            "sender_id": 1 if i % 2 else 2,
+            "recipient_id": 2 if i % 2 else 1,
+            "amount": round(rng.uniform(1, 500), 2),
+            "description": f"Payment {i}",
+            "status": models.TransactionStatus.COMPLETED.name,
+            "timestamp": now - timedelta(minutes=i),
+            "category": rng.choice(["Food", "Rent", "Travel"]),
+            "transaction_metadata": json.dumps({"order": i, "note": "benchmark", "items": [1, 2, 3]})
+        }
+        for i in range(1, rows + 1)
+    ])
+    db.execute(models.transaction_tags.insert(), [
+        {"transaction_id": i, "tag_id": rng.randint(1, 5)} for i in range(1, rows + 1)
+    ])
+    db.execute(models.NFTReceipt.__table__.insert(), [
+        {
+            "transaction_id": i,
+            "owner_id": 1,
+            "image_url": f"https://picsum.photos/200/300?random={i}",
+            "receipt_metadata": {"amount": 1.0, "sender": "other", "recipient": "bench", "blockHeight": 1000000 + i}
+        }
+        for i in range(1, rows + 1)
+    ])
+    db.execute(models.PaymentTemplate.__table__.insert(), [
+        {"id": i, "owner_id": 1, "name": f"Template {i}", "recipient_principal": "other", "recipient_id": 2, "amount": 10.0, "is_active": True}
+        for i in range(1, rows + 1)
+    ])
+    db.execute(models.TemplateCondition.__table__.insert(), [
+        {"template_id": i, "condition_type": models.TemplateConditionType.AMOUNT.name,
+         "operator": models.TemplateConditionOperator.LESS_THAN.name, "value": "100"}
+        for i in range(1, rows + 1)
+    ])
+    db.execute(models.ScheduledPayment.__table__.insert(), [
+        {
+            "user_id": 1, "recipient_principal": "other", "recipient_id": 2, "amount": 25.0,
+            "description": "Weekly", "start_date": date.today(), "frequency": models.ScheduledPaymentFrequency.WEEKLY.name,
+            "is_active": True, "next_payment_date": date.today(), "payments_made": 0, "recipient_unresolvable": False
+        }
+        for _ in range(rows)
+    ])
+    db.commit()
+
+
+def _pydantic_body(items, schema) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    return json.dumps(jsonable_encoder([schema.from_orm(item) for item in items])).encode("utf-8")
+
+
+def _pydantic_transactions_body(db, rows: int) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    from app import crud, schemas
+
+    transactions = crud.get_user_transactions(db, user_id=1, limit=rows)
+    validated = [
+        schemas.Transaction(
+            id=tx.id, sender_id=tx.sender_id, recipient_id=tx.recipient_id, amount=tx.amount,
+            description=tx.description, metadata=tx.transaction_metadata, status=tx.status,
+            timestamp=tx.timestamp, updated_at=tx.updated_at, category=tx.category,
+            tags=[tag.name for tag in tx.tags], sender_principal=tx.sender_principal,
+            recipient_principal=tx.recipient_principal
+        )
+        for tx in transactions
+    ]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def _pydantic_receipts_body(db) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    from app import crud, schemas
+
+    # Like transactions, NFTReceipt.from_orm would read `metadata` from the model
+    validated = [
+        schemas.NFTReceipt(
+            id=receipt.id, transaction_id=receipt.transaction_id, owner_id=receipt.owner_id,
+            image_url=receipt.image_url, metadata=receipt.receipt_metadata, created_at=receipt.created_at
+        )
+        for receipt in crud.get_user_nft_receipts(db, 1)
+    ]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def _time(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list endpoint serialization")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="paychain-serialization-bench-"), "bench.db")
+    # Must be set before app.database is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    from app import crud, models, schemas, sketches
+    from app.database import SessionLocal, engine
+    from app.fastjson import dumps_rows
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        _populate(db, args.rows)
+        endpoints = {
+            "/transactions/": (
+                lambda: _pydantic_transactions_body(db, args.rows),
+                lambda: dumps_rows(crud.get_user_transaction_rows(db, user_id=1, limit=args.rows))
+            ),
+            "/templates/": (
+                lambda: _pydantic_body(crud.get_user_templates(db, 1), schemas.PaymentTemplate),
+                lambda: dumps_rows(crud.get_user_template_rows(db, 1))
+            ),
+            "/scheduled-payments/": (
+                lambda: _pydantic_body(crud.get_user_scheduled_payments(db, 1), schemas.ScheduledPayment),
+                lambda: dumps_rows(crud.get_user_scheduled_payment_rows(db, 1))
+            ),
+            "/nft-receipts/": (
+                lambda: _pydantic_receipts_body(db),
+                lambda: dumps_rows(crud.get_user_nft_receipt_rows(db, 1))
+            ),
+        }
+
+        results = {}
+        for path, (pydantic_fn, fast_fn) in endpoints.items():
+            db.expire_all()
+            pydantic_seconds, pydantic_bytes = _time(pydantic_fn, args.repeat)
+            db.expire_all()
+            fast_seconds, fast_bytes = _time(fast_fn, args.repeat)
+            results[path] = {
+                "pydantic_ms": round(pydantic_seconds * 1000, 1),
+                "fast_ms": round(fast_seconds * 1000, 1),
+                "speedup": round(pydantic_seconds / fast_seconds, 1),
+                "bytes": fast_bytes
+            }
+    finally:
+        db.close()
+        # Buffered platform-wide sketches, before the database is removed
+        sketches.platform_buffer.flush()
+        os.remove(db_path)
+
+    print(json.dumps({"benchmark": "list_serialization", "rows": args.rows, "endpoints": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
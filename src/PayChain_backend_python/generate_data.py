@@ -0,0 +1,287 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger("generate_data")
+
+# Load environment variables
+load_dotenv()
+
+from app import migrations, models
+from app.database import engine
+from app.hashing import pwd_context
+
+# Rows per executemany call, and per commit
+INSERT_BATCH = 10000
+COMMIT_ROWS = 500000
+AMOUNT_TABLE = 4096
+
+CATEGORIES = ["Food", "Rent", "Travel", "Utilities", "Shopping", "Entertainment", "Health", "Transfer"]
+FREQUENCIES = [f.name for f in models.ScheduledPaymentFrequency]
+CONDITION_TYPES = [t.name for t in models.TemplateConditionType]
+CONDITION_OPERATORS = [o.name for o in models.TemplateConditionOperator]
+
+# Tables loaded here; their indexes are dropped for the load and rebuilt after
+TABLES = [
+    models.User.__table__,
+    models.Transaction.__table__,
+    models.Tag.__table__,
+    models.transaction_tags,
+    models.NFTReceipt.__table__,
+    models.PaymentTemplate.__table__,
+    models.TemplateCondition.__table__,
+    models.ScheduledPayment.__table__,
+]
+
+
+class Loader:
+    """executemany inserts over one connection, committed every COMMIT_ROWS rows"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.counts = {}
+        self._uncommitted = 0
+        self._transaction = conn.begin()
+        placeholders = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+        if conn.dialect.paramstyle not in placeholders:
+            raise ValueError(f"Unsupported DB-API paramstyle: {conn.dialect.paramstyle}")
+        self._placeholder = placeholders[conn.dialect.paramstyle]
+
+    def insert(self, table, columns, rows: list):
+        """Insert positional rows; the statement is rendered once, not compiled per row"""
+        if not rows:
+            return
+        self.conn.exec_driver_sql(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join([self._placeholder] * len(columns))})",
+            rows
+        )
+        self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+        self._uncommitted += len(rows)
+        if self._uncommitted >= COMMIT_ROWS:
+            self._transaction.commit()
+            self._transaction = self.conn.begin()
+            self._uncommitted = 0
+
+    def finish(self):
+        self._transaction.commit()
+
+
+class PowerLaw:
+    """Draws ids 1..n with P(rank k) proportional to 1 / k**exponent (Zipf).
+
+    Ranks are mapped through a seeded permutation, so the most active ids
+    are spread over the id range instead of being the lowest ones.
+    """
+
+    def __init__(self, n: int, exponent: float, rng: random.Random):
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(1.0 / k ** exponent for k in range(1, n + 1)))
+        self.ids = list(range(1, n + 1))
+        rng.shuffle(self.ids)
+
+    def draw(self, k: int) -> list:
+        return self.rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+
+def _chunks(count: int):
+    """(first id, size) of INSERT_BATCH-sized id ranges covering 1..count"""
+    for first in range(1, count + 1, INSERT_BATCH):
+        yield first, min(INSERT_BATCH, count - first + 1)
+
+
+def _distinct(payers: list, recipients: list, users: int) -> list:
+    """Recipients, with self-payments redirected to the next user"""
+    return [r if r != p else p % users + 1 for p, r in zip(payers, recipients)]
+
+
+def _load_users(loader, rng, args, start, span, hashed_password):
+    columns = ("id", "email", "principal_id", "hashed_password", "is_active", "created_at",
+               "balance", "data_version", "unread_notifications")
+    random_, gauss = rng.random, rng.gauss
+    for first, size in _chunks(args.users):
+        loader.insert(models.User.__table__, columns, [
+            (
+                user_id, f"user{user_id}@example.com", f"principal-{user_id}", hashed_password, True,
+                start + timedelta(seconds=random_() * span), round(math.exp(7 + 1.5 * gauss(0, 1)), 2), 0, 0
+            )
+            for user_id in range(first, first + size)
+        ])
+
+
+def _load_payments(loader, rng, args, start, span, senders: PowerLaw, recipients: PowerLaw):
+    """Transactions with their tags and NFT receipts"""
+    loader.insert(models.Tag.__table__, ("id", "name"), [(i, f"tag-{i}") for i in range(1, args.tags + 1)])
+    tags = PowerLaw(args.tags, args.skew, rng) if args.tags else None
+    tx_columns = ("id", "sender_id", "recipient_id", "amount", "description", "status", "timestamp", "category")
+    receipt_columns = ("transaction_id", "owner_id", "image_url", "receipt_metadata", "created_at")
+    random_ = rng.random
+    # Amounts come from a precomputed lognormal table: drawing one per row costs more than the insert
+    amounts = [round(rng.lognormvariate(3, 1.2), 2) for _ in range(AMOUNT_TABLE)]
+    categories = len(CATEGORIES)
+
+    for first, size in _chunks(args.transactions):
+        payers = senders.draw(size)
+        payees = _distinct(payers, recipients.draw(size), args.users)
+        transactions = [
+            (
+                tx_id, sender, recipient, amounts[int(random_() * AMOUNT_TABLE)], "Payment",
+                "COMPLETED" if random_() < 0.97 else "FAILED",
+                start + timedelta(seconds=random_() * span), CATEGORIES[int(random_() * categories)]
+            )
+            for tx_id, sender, recipient in zip(range(first, first + size), payers, payees)
+        ]
+        loader.insert(models.Transaction.__table__, tx_columns, transactions)
+
+        if tags:
+            tagged = [tx_id for tx_id in range(first, first + size) if random_() < args.tag_share]
+            links = set(zip(tagged, tags.draw(len(tagged))))
+            # About a quarter of tagged transactions get a second tag
+            links.update(zip(tagged[::4], tags.draw(len(tagged[::4]))))
+            loader.insert(models.transaction_tags, ("transaction_id", "tag_id"), sorted(links))
+
+        loader.insert(models.NFTReceipt.__table__, receipt_columns, [
+            (
+                tx_id, sender, f"https://picsum.photos/200/300?random={tx_id}",
+                json.dumps({
+                    "amount": amount,
+                    "timestamp": timestamp.timestamp(),
+                    "sender": f"principal-{sender}",
+                    "recipient": f"principal-{recipient}",
+                    "blockHeight": 1000000 + tx_id,
+                    "confirmations": 15 + tx_id % 30
+                }),
+                timestamp
+            )
+            for tx_id, sender, recipient, amount, _, _, timestamp, _ in transactions
+            if random_() < args.receipt_share
+        ])
+
+
+def _load_templates(loader, rng, args, start, span, senders: PowerLaw, recipients: PowerLaw):
+    template_columns = ("id", "owner_id", "name", "recipient_principal", "recipient_id", "amount", "is_active",
+                        "created_at")
+    condition_columns = ("template_id", "condition_type", "operator", "value")
+    for first, size in _chunks(int(args.users * args.templates_per_user)):
+        owners = senders.draw(size)
+        payees = _distinct(owners, recipients.draw(size), args.users)
+        loader.insert(models.PaymentTemplate.__table__, template_columns, [
+            (template_id, owner, f"Template {template_id}", f"principal-{recipient}", recipient,
+             round(rng.lognormvariate(4, 1), 2), True, start + timedelta(seconds=rng.random() * span))
+            for template_id, owner, recipient in zip(range(first, first + size), owners, payees)
+        ])
+        loader.insert(models.TemplateCondition.__table__, condition_columns, [
+            (template_id, rng.choice(CONDITION_TYPES), rng.choice(CONDITION_OPERATORS), str(rng.randint(1, 500)))
+            for template_id in range(first, first + size)
+        ])
+
+
+def _load_schedules(loader, rng, args, senders: PowerLaw, recipients: PowerLaw):
+    columns = ("id", "user_id", "recipient_principal", "recipient_id", "recipient_unresolvable", "amount",
+               "description", "start_date", "frequency", "is_active", "next_payment_date", "payments_made",
+               "created_at")
+    today = args.end_date
+    for first, size in _chunks(int(args.users * args.schedules_per_user)):
+        payers = senders.draw(size)
+        payees = _distinct(payers, recipients.draw(size), args.users)
+        loader.insert(models.ScheduledPayment.__table__, columns, [
+            (
+                schedule_id, payer, f"principal-{recipient}", recipient, False, round(rng.lognormvariate(4, 1), 2),
+                "Generated schedule", today - timedelta(days=rng.randint(0, args.days)), rng.choice(FREQUENCIES),
+                True, today + timedelta(days=rng.randint(1, 30)), rng.randint(0, 12),
+                datetime.combine(today, datetime.min.time())
+            )
+            for schedule_id, payer, recipient in zip(range(first, first + size), payers, payees)
+        ])
+
+
+def generate(args):
+    """Load the synthetic dataset into an empty database; returns rows per table"""
+    rng = random.Random(args.seed)
+    end = datetime.combine(args.end_date, datetime.min.time())
+    start = end - timedelta(days=args.days)
+    span = (end - start).total_seconds()
+
+    # One hash for every account: hashing millions of passwords would take days
+    hashed_password = pwd_context.hash(args.password)
+
+    migrations.migrate(engine)
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("SELECT COUNT(*) FROM users").scalar():
+            raise SystemExit("Database already has users; point DATABASE_URL at an empty database")
+        if conn.dialect.name == "sqlite":
+            # A failed load is simply regenerated, so durability is not needed while loading
+            conn.exec_driver_sql("PRAGMA synchronous = OFF")
+            conn.exec_driver_sql("PRAGMA cache_size = -262144")
+
+        indexes = [index for table in TABLES for index in table.indexes]
+        for index in indexes:
+            index.drop(conn)
+
+        started = time.perf_counter()
+        loader = Loader(conn)
+        senders = PowerLaw(args.users, args.skew, rng)
+        recipients = PowerLaw(args.users, args.skew, rng)
+        _load_users(loader, rng, args, start, span, hashed_password)
+        _load_payments(loader, rng, args, start, span, senders, recipients)
+        _load_templates(loader, rng, args, start, span, senders, recipients)
+        _load_schedules(loader, rng, args, senders, recipients)
+        loader.finish()
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with conn.begin():
+            for index in indexes:
+                index.create(conn)
+        index_seconds = time.perf_counter() - started
+
+    rows = sum(loader.counts.values())
+    for table, count in loader.counts.items():
+        logger.info(f"  {table}: {count} rows")
+    logger.info(
+        f"Loaded {rows} rows in {load_seconds:.1f}s ({rows / load_seconds:,.0f} rows/sec), "
+        f"rebuilt {len(indexes)} indexes in {index_seconds:.1f}s"
+    )
+    return loader.counts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a large synthetic dataset into DATABASE_URL")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--tag-share", type=float, default=0.3, help="Share of transactions with tags")
+    parser.add_argument("--receipt-share", type=float, default=0.2, help="Share of transactions with NFT receipts")
+    parser.add_argument("--templates-per-user", type=float, default=0.5)
+    parser.add_argument("--schedules-per-user", type=float, default=0.5)
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="Zipf exponent of sender/recipient activity (0 is uniform)")
+    parser.add_argument("--days", type=int, default=365, help="Transactions are spread over this many days")
+    parser.add_argument("--end-date", type=lambda v: datetime.strptime(v, "%Y-%m-%d").date(),
+                        default=datetime.utcnow().date(), help="Last day of generated history (YYYY-MM-DD)")
+    parser.add_argument("--password", default="password123", help="Password of every generated user")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+    return args
+
+
+if __name__ == "__main__":
+    generate(parse_args())
@@ -5,12 +5,12 @@ from sqlalchemy.orm import Session
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import models, schemas, crud
+from app import models, schemas, crud, migrations
 from app.database import engine, SessionLocal
 from app.auth import get_password_hash
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Create or upgrade the database schema
+migrations.migrate(engine)
 
 def init_db():
     db = SessionLocal()
@@ -40,17 +40,19 @@ def init_db():
             }
         ]
         
+        # Users share passwords; hash each one once
+        password_hashes = {password: get_password_hash(password) for password in {u["password"] for u in users}}
+        
         created_users = []
         for user_data in users:
             user = models.User(
                 email=user_data["email"],
                 principal_id=user_data["principal_id"],
-                hashed_password=get_password_hash(user_data["password"]),
+                hashed_password=password_hashes[user_data["password"]],
                 balance=1000.0  # Start with 1000 balance
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            db.flush()
             created_users.append(user)
             print(f"Created user: {user.email} with principal: {user.principal_id}")
         
@@ -82,8 +84,7 @@ def init_db():
         for tx_data in transactions:
             tx = models.Transaction(**tx_data)
             db.add(tx)
-            db.commit()
-            db.refresh(tx)
+            db.flush()
             print(f"Created transaction: {tx.id} amount: {tx.amount} {tx.description}")
         
         # Create sample payment templates
@@ -109,8 +110,7 @@ def init_db():
         for template_data in templates:
             template = models.PaymentTemplate(**template_data)
             db.add(template)
-            db.commit()
-            db.refresh(template)
+            db.flush()
             
             # Add a condition to the template
             condition = models.TemplateCondition(
@@ -120,9 +120,10 @@ def init_db():
                 value="9"  # 9 AM
             )
             db.add(condition)
-            db.commit()
             print(f"Created template: {template.name} with amount: {template.amount}")
         
+        # Everything above goes in as one transaction
+        db.commit()
         print("Database initialized successfully!")
     except Exception as e:
         print(f"Error initializing database: {e}")
@@ -1,4 +1,6 @@
+import argparse
 import os
+import signal
 import sys
 from datetime import date
 import logging
@@ -22,28 +24,34 @@ logger = logging.getLogger("scheduled_payments")
 # Load environment variables
 load_dotenv()
 
-from app import crud
+from app import crud, scheduler
 from app.database import SessionLocal
 
-def process_payments():
+def process_payments(chunk_size=crud.SCHEDULER_CHUNK_SIZE, workers=crud.SCHEDULER_WORKERS):
     """Process all scheduled payments that are due today"""
     logger.info("Starting scheduled payment processing...")
     
     db = SessionLocal()
     try:
         today = date.today()
-        logger.info(f"Processing payments due on or before {today}")
+        logger.info(f"Processing payments due on or before {today} (chunk size {chunk_size}, {workers} workers)")
         
         # Process all payments due today or earlier
-        processed_payments = crud.process_scheduled_payments(db, today)
+        stats = crud.process_scheduled_payments(
+            db,
+            today,
+            chunk_size=chunk_size,
+            workers=workers,
+            session_factory=SessionLocal
+        )
         
-        logger.info(f"Processed {len(processed_payments)} payments")
-        
-        # Log details about processed payments
-        for payment in processed_payments:
-            logger.info(f"Payment ID: {payment.id}, User ID: {payment.user_id}, Amount: {payment.amount}, Recipient: {payment.recipient_principal}")
+        logger.info(
+            f"Processed {stats['processed']} of {stats['due']} due payments "
+            f"(deactivated: {stats['deactivated']}, missing recipient: {stats['missing_recipient']}, "
+            f"insufficient funds: {stats['insufficient_funds']}, failed: {stats['failed']})"
+        )
             
-        return len(processed_payments)
+        return stats["processed"]
     except Exception as e:
         logger.error(f"Error processing scheduled payments: {str(e)}")
         db.rollback()
@@ -51,6 +59,64 @@ def process_payments():
     finally:
         db.close()
 
+def resolve_recipients(batch_size=crud.SCHEDULER_CHUNK_SIZE):
+    """Pin recipient ids on schedules and templates that only have a principal"""
+    logger.info("Resolving scheduled payment and template recipients...")
+    
+    db = SessionLocal()
+    try:
+        stats = crud.resolve_payment_recipients(db, batch_size=batch_size)
+        logger.info(f"Resolved {stats['resolved']} recipients, {stats['unresolvable']} schedules unresolvable")
+        return stats["resolved"]
+    except Exception as e:
+        logger.error(f"Error resolving recipients: {str(e)}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+def run_daemon(chunk_size=crud.SCHEDULER_CHUNK_SIZE, poll_seconds=scheduler.SCHEDULER_POLL_SECONDS,
+               metrics_port=scheduler.SCHEDULER_METRICS_PORT):
+    """Process payments as they come due until SIGTERM/SIGINT"""
+    daemon = scheduler.SchedulerDaemon(chunk_size=chunk_size, poll_seconds=poll_seconds)
+    
+    def shutdown(signum, frame):
+        logger.info(f"Received signal {signum}, finishing current work...")
+        daemon.stop()
+    
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    
+    if metrics_port:
+        scheduler.serve_metrics(daemon, metrics_port)
+        logger.info(f"Serving scheduler metrics on port {metrics_port}")
+    
+    logger.info("Starting scheduler daemon...")
+    daemon.run()
+    return daemon.processed_total
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process due scheduled payments")
+    parser.add_argument("--chunk-size", type=int, default=crud.SCHEDULER_CHUNK_SIZE,
+                        help="Number of schedules claimed and committed together")
+    parser.add_argument("--workers", type=int, default=crud.SCHEDULER_WORKERS,
+                        help="Number of worker threads; schedules are partitioned by payer")
+    parser.add_argument("--resolve-recipients", action="store_true",
+                        help="Pin recipient ids on legacy schedules and templates, then exit")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and process schedules as they come due")
+    parser.add_argument("--poll-interval", type=float, default=scheduler.SCHEDULER_POLL_SECONDS,
+                        help="Daemon mode: seconds between checks for new or updated schedules")
+    parser.add_argument("--metrics-port", type=int, default=scheduler.SCHEDULER_METRICS_PORT,
+                        help="Daemon mode: serve Prometheus metrics on this port (0 disables)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    count = process_payments()
-    sys.exit(0 if count >= 0 else 1) 
\ No newline at end of file
+    args = parse_args()
+    if args.resolve_recipients:
+        count = resolve_recipients(args.chunk_size)
+    elif args.daemon:
+        count = run_daemon(args.chunk_size, args.poll_interval, args.metrics_port)
+    else:
+        count = process_payments(chunk_size=args.chunk_size, workers=args.workers)
+    sys.exit(0 if count >= 0 else 1)
@@ -8,7 +8,7 @@ if __name__ == "__main__":
     # Get port from environment variable or use default
     port = int(os.getenv("PORT", "8000"))
     
-    # Run the application
+    # Development server with auto-reload; production uses `python -m app.server`
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
@@ -42,17 +42,19 @@ def seed_data():
             }
         ]
         
+        # Users share passwords; hash each one once
+        password_hashes = {password: get_password_hash(password) for password in {u["password"] for u in users}}
+        
         created_users = []
         for user_data in users:
             user = User(
                 email=user_data["email"],
                 principal_id=user_data["principal_id"],
-                hashed_password=get_password_hash(user_data["password"]),
+                hashed_password=password_hashes[user_data["password"]],
                 balance=1000.0  # Start with 1000 balance
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            db.flush()
             created_users.append(user)
             print(f"Created user: {user.email} with principal: {user.principal_id}")
         
@@ -84,8 +86,7 @@ def seed_data():
         for tx_data in transactions:
             tx = Transaction(**tx_data)
             db.add(tx)
-            db.commit()
-            db.refresh(tx)
+            db.flush()
             print(f"Created transaction: {tx.id} amount: {tx.amount} {tx.description}")
             
             # Generate NFT receipt for each transaction
@@ -106,7 +107,6 @@ def seed_data():
                 receipt_metadata=receipt_metadata
             )
             db.add(receipt)
-            db.commit()
             print(f"Created NFT receipt for transaction {tx.id}")
         
         # Create sample payment templates
@@ -132,8 +132,7 @@ def seed_data():
         for template_data in templates:
             template = PaymentTemplate(**template_data)
             db.add(template)
-            db.commit()
-            db.refresh(template)
+            db.flush()
             
             # Add a condition to the template
             condition = TemplateCondition(
@@ -143,7 +142,6 @@ def seed_data():
                 value="9"  # 9 AM
             )
             db.add(condition)
-            db.commit()
             print(f"Created template: {template.name} with amount: {template.amount}")
             
         # Create sample scheduled payments
@@ -174,10 +172,10 @@ def seed_data():
         for payment_data in scheduled_payments:
             payment = ScheduledPayment(**payment_data)
             db.add(payment)
-            db.commit()
-            db.refresh(payment)
             print(f"Created scheduled payment: {payment.amount} {payment.description} frequency: {payment.frequency}")
         
+        # Everything above goes in as one transaction
+        db.commit()
         print("Database seeded successfully!")
     except Exception as e:
         print(f"Error seeding database: {e}")
@@ -0,0 +1,70 @@
+"""Test configuration.
+
+The environment is set before app is imported: tests run against their own
+SQLite file and analytics snapshot directory, with fast password hashing,
+rate limiting off and platform-wide sketches stored only when a test flushes them.
+"""
+import os
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="paychain-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ["ANALYTICS_SNAPSHOT_DIR"] = os.path.join(TEST_DIR, "analytics_snapshot")
+os.environ["HASHING_WORKERS"] = "0"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["SKETCH_FLUSH_SECONDS"] = "3600"
+
+import pytest
+from sqlalchemy import MetaData
+
+from app import auth, crud, listcache, migrations, schemas, sketches
+from app.database import SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    """Session on an empty database migrated to the current schema"""
+    existing = MetaData()
+    existing.reflect(bind=engine)
+    existing.drop_all(bind=engine)
+    migrations.migrate(engine)
+    listcache.cache.clear()
+    sketches.platform_buffer.clear()
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    """HTTP client for the app; startup hooks (warm-up, jobs, event hub) are not run"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    auth.clear_auth_caches()
+    return TestClient(app)
+
+
+@pytest.fixture
+def login(client):
+    """login(name) signs up `name` through the API and returns its auth headers"""
+    def login(name: str, domain: str = "example.com") -> dict:
+        credentials = {"email": f"{name}@{domain}", "password": "password123"}
+        client.post("/users/", json={**credentials, "principal_id": name})
+        token = client.post("/login/", json=credentials).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return login
+
+
+@pytest.fixture
+def make_user(db):
+    """make_user(name) creates a user with principal `name` and the default balance"""
+    def make(name: str):
+        return crud.create_user(
+            db, schemas.UserCreate(email=f"{name}@example.com", password="password123", principal_id=name),
+            hashed_password="!"
+        )
+    return make
@@ -0,0 +1,148 @@
+import os
+import subprocess
+import sys
+import threading
+from datetime import datetime
+
+from app import analytics, models
+from app.analytics import TransactionSnapshot
+from app.database import SessionLocal
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DAY = datetime(2025, 3, 10, 12)
+
+
+def _add_transactions(db, count: int, amount: float = 10.0, category: str = "Food"):
+    db.add_all([
+        models.Transaction(sender_id=1, recipient_id=2, amount=amount, category=category, timestamp=DAY)
+        for _ in range(count)
+    ])
+    db.commit()
+
+
+def _generations(directory: str):
+    return sorted(entry for entry in os.listdir(directory) if entry.startswith("gen-"))
+
+
+def test_refresh_appends_to_the_published_columns(db, tmp_path):
+    snapshot = TransactionSnapshot(str(tmp_path))
+    _add_transactions(db, 5)
+    assert snapshot.refresh(db) == 5
+    generation = snapshot.generation
+    amount_file = os.path.join(tmp_path, generation, "amount.bin")
+    inode = os.stat(amount_file).st_ino
+
+    _add_transactions(db, 3, amount=20.0, category="Rent")
+    assert snapshot.refresh(db) == 3
+    # Same files, extended in place
+    assert snapshot.generation == generation
+    assert os.stat(amount_file).st_ino == inode
+    assert os.path.getsize(amount_file) == 8 * 8
+    assert snapshot.category_share(DAY, DAY)["total_volume"] == 110.0
+
+    # Another worker maps what was published
+    reader = TransactionSnapshot(str(tmp_path))
+    assert reader.load()
+    assert reader.row_count == 8
+    assert reader.daily_volume(DAY, DAY)[0]["transaction_count"] == 8
+
+
+def test_refresh_ignores_rows_past_the_published_count(db, tmp_path):
+    snapshot = TransactionSnapshot(str(tmp_path))
+    _add_transactions(db, 2)
+    snapshot.refresh(db)
+    # Left by a refresh that failed before publishing
+    with open(os.path.join(tmp_path, snapshot.generation, "amount.bin"), "ab") as f:
+        f.write(b"\xff" * 24)
+
+    _add_transactions(db, 1, amount=5.0)
+    snapshot.refresh(db)
+    reader = TransactionSnapshot(str(tmp_path))
+    reader.load()
+    assert list(reader.columns["amount"]) == [10.0, 10.0, 5.0]
+
+
+def test_workers_share_one_generation(db, tmp_path):
+    # A generation no longer named by meta.json, e.g. from an older version
+    os.makedirs(os.path.join(tmp_path, "gen-0-stale"))
+    _add_transactions(db, 50)
+
+    workers = [TransactionSnapshot(str(tmp_path)) for _ in range(4)]
+    errors = []
+
+    def refresh(snapshot):
+        session = SessionLocal()
+        try:
+            for _ in range(5):
+                snapshot.refresh(session)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=refresh, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    assert len(_generations(tmp_path)) == 1
+    for worker in workers:
+        worker.load()
+        assert worker.row_count == 50
+        assert sorted(worker.columns["id"]) == list(range(1, 51))
+
+
+def test_workers_share_one_generation_without_fcntl(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, "fcntl", None)
+    test_workers_share_one_generation(db, tmp_path)
+    # Released after every refresh
+    assert not os.path.exists(os.path.join(tmp_path, ".lock"))
+
+
+def test_imports_without_fcntl():
+    completed = subprocess.run(
+        [sys.executable, "-c", "import sys; sys.modules['fcntl'] = None; import app.analytics"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    assert completed.returncode == 0, completed.stderr
+
+
+def test_load_swaps_the_whole_state(db, tmp_path):
+    writer = TransactionSnapshot(str(tmp_path))
+    reader = TransactionSnapshot(str(tmp_path))
+    _add_transactions(db, 2)
+    writer.refresh(db)
+    reader.load()
+    before = reader.state
+
+    _add_transactions(db, 3, amount=7.0, category="Rent")
+    writer.refresh(db)
+    assert reader.load()
+    # The old state is untouched, so a query holding it stays consistent
+    assert before.row_count == 2 and before.categories == ["Food"]
+    assert reader.state.categories == ["Food", "Rent"]
+
+    errors = []
+    done = threading.Event()
+
+    def query():
+        while not done.is_set():
+            try:
+                share = reader.category_share(DAY, DAY)
+                assert sum(c["amount"] for c in share["categories"]) == share["total_volume"]
+            except Exception as e:
+                errors.append(e)
+                return
+
+    thread = threading.Thread(target=query)
+    thread.start()
+    for round_number in range(20):
+        _add_transactions(db, 1, amount=1.0, category=f"New {round_number}")
+        writer.refresh(db)
+        reader.load()
+    done.set()
+    thread.join()
+    assert not errors
+    assert len(reader.category_share(DAY, DAY)["categories"]) == 22
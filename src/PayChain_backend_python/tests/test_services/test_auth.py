@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from passlib.hash import bcrypt
+from sqlalchemy import event
+
+from app import auth, crud, hashing, models, schemas
+from app.database import engine
+
+
+def _busy(*args, **kwargs):
+    raise hashing.HashingBusy()
+
+
+def test_saturated_hashing_pool_returns_503(client, make_user, monkeypatch):
+    make_user("alice")
+    monkeypatch.setattr(auth.hasher, "hash", _busy)
+    monkeypatch.setattr(auth.hasher, "verify_and_update", _busy)
+
+    for path, body in (
+        ("/users/", {"email": "bob@example.com", "password": "password123", "principal_id": "bob"}),
+        ("/login/", {"email": "alice@example.com", "password": "password123"}),
+    ):
+        response = client.post(path, json=body)
+        assert response.status_code == 503, path
+        assert response.headers["Retry-After"] == "1"
+
+
+def test_signup_and_login_queries_run_off_the_event_loop(client, make_user, monkeypatch):
+    make_user("alice")
+    get_user_by_email = crud.get_user_by_email
+    def off_loop(*args, **kwargs):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return get_user_by_email(*args, **kwargs)
+    monkeypatch.setattr(crud, "get_user_by_email", off_loop)
+
+    response = client.post("/users/", json={"email": "bob@example.com", "password": "password123", "principal_id": "bob"})
+    assert response.status_code == 200
+
+
+def test_signup_then_login(client):
+    response = client.post("/users/", json={"email": "bob@example.com", "password": "password123", "principal_id": "bob"})
+    assert response.status_code == 200
+    assert client.post("/login/", json={"email": "bob@example.com", "password": "password123"}).status_code == 200
+    assert client.post("/login/", json={"email": "bob@example.com", "password": "wrong-password"}).status_code == 401
+
+
+def test_placeholder_account_cannot_log_in_and_is_not_hashed(client, make_user, monkeypatch):
+    # make_user stores UNUSABLE_PASSWORD, like placeholder recipients
+    make_user("placeholder")
+    monkeypatch.setattr(hashing, "_verify_and_update", _busy)
+
+    response = client.post("/login/", json={"email": "placeholder@example.com", "password": "!"})
+    assert response.status_code == 401
+
+
+def test_login_upgrades_outdated_hash(client, db):
+    outdated = bcrypt.using(rounds=hashing.BCRYPT_ROUNDS + 1).hash("password123")
+    user = crud.create_user(
+        db, schemas.UserCreate(email="carol@example.com", password="password123", principal_id="carol"),
+        hashed_password=outdated
+    )
+
+    assert client.post("/login/", json={"email": "carol@example.com", "password": "password123"}).status_code == 200
+    db.expire_all()
+    upgraded = db.query(models.User.hashed_password).filter_by(id=user.id).scalar()
+    assert upgraded != outdated
+    assert bcrypt.from_string(upgraded).rounds == hashing.BCRYPT_ROUNDS
+    assert hashing.hasher.verify_and_update("password123", upgraded) == (True, None)
+
+
+def _user_lookups(fn) -> int:
+    """Users looked up by email while fn runs"""
+    lookups = []
+    def record(conn, cursor, statement, *args):
+        if statement.startswith("SELECT users.") and "WHERE users.email = " in statement:
+            lookups.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return len(lookups)
+
+
+def test_authenticated_requests_reuse_the_cached_user(client, login):
+    headers = login("alice")
+    assert _user_lookups(lambda: client.get("/balance/", headers=headers)) == 1
+    assert _user_lookups(lambda: client.get("/balance/", headers=headers)) == 0
+
+
+def test_update_user_invalidates_the_cached_user(client, login):
+    headers = login("alice")
+    assert client.get("/users/me/", headers=headers).status_code == 200
+
+    # Profile fields leave the cached user in place
+    assert client.put("/users/me/", headers=headers, json={"full_name": "Alice"}).status_code == 200
+    assert "alice@example.com" in auth._user_cache
+
+    assert client.put("/users/me/", headers=headers, json={"password": "another-password"}).status_code == 200
+    assert "alice@example.com" not in auth._user_cache
+
+    # A token for the old email stops working at once, not after AUTH_USER_CACHE_TTL
+    assert client.get("/users/me/", headers=headers).status_code == 200
+    assert client.put("/users/me/", headers=headers, json={"email": "alice@example.org"}).status_code == 200
+    assert client.get("/users/me/", headers=headers).status_code == 401
+    response = client.post("/login/", json={"email": "alice@example.org", "password": "another-password"})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("web_concurrency, expected", [(None, 4), ("1", 4), ("4", 2), ("8", 1), ("32", 1)])
+def test_hashing_pool_is_shared_out_between_api_workers(monkeypatch, web_concurrency, expected):
+    monkeypatch.setattr(hashing.os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    if web_concurrency is None:
+        monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    else:
+        monkeypatch.setenv("WEB_CONCURRENCY", web_concurrency)
+    assert hashing._default_workers() == expected
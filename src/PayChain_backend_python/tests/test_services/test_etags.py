@@ -0,0 +1,57 @@
+from app import crud, schemas
+
+
+def _pay(db, payer_principal: str, recipient_principal: str, amount: float):
+    payer = crud.get_user_by_principal(db, payer_principal)
+    crud.create_transaction(db, schemas.TransactionCreate(
+        recipient_principal=recipient_principal, amount=amount, description="payment", category="Food"
+    ), user_id=payer.id)
+
+
+def test_matching_tag_returns_304_until_a_write(client, login, db):
+    headers = login("alice")
+    login("bob")
+    first = client.get("/balance/", headers=headers)
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"') and first.headers["Cache-Control"] == "private, no-cache"
+
+    for if_none_match in (etag, etag[2:], f'"other", {etag}', "*"):
+        response = client.get("/balance/", headers={**headers, "If-None-Match": if_none_match})
+        assert response.status_code == 304, if_none_match
+        assert response.content == b"" and response.headers["ETag"] == etag
+    assert client.get("/balance/", headers={**headers, "If-None-Match": '"other"'}).status_code == 200
+
+    # A payment from someone else is a write touching alice's data
+    _pay(db, "bob", "alice", 5.0)
+    response = client.get("/balance/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == {"balance": 1005.0}
+    assert response.headers["ETag"] != etag
+
+    # Resources of one user share the data version
+    etag = client.get("/templates/", headers=headers).headers["ETag"]
+    response = client.post("/templates/", headers=headers, json={"name": "Rent", "recipient_principal": "bob"})
+    assert response.status_code == 200
+    response = client.get("/templates/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and [row["name"] for row in response.json()] == ["Rent"]
+
+
+def test_each_page_has_its_own_tag(client, login, db):
+    headers = login("alice")
+    login("bob")
+    for amount in (1.0, 2.0, 3.0):
+        _pay(db, "bob", "alice", amount)
+
+    page_one = client.get("/transactions/?skip=0&limit=2", headers=headers)
+    page_two = client.get("/transactions/?skip=2&limit=2", headers=headers)
+    assert page_one.headers["ETag"] != page_two.headers["ETag"]
+
+    # Page 2 revalidated with page 1's tag is not a match
+    response = client.get("/transactions/?skip=2&limit=2", headers={**headers, "If-None-Match": page_one.headers["ETag"]})
+    assert response.status_code == 200
+    assert [row["amount"] for row in response.json()] == [row["amount"] for row in page_two.json()]
+    assert len(response.json()) == 1
+
+    # Parameter order does not matter
+    response = client.get("/transactions/?limit=2&skip=0", headers={**headers, "If-None-Match": page_one.headers["ETag"]})
+    assert response.status_code == 304
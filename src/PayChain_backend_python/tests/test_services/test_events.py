@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import events
+
+
+def test_full_queue_drops_the_consumer_without_blocking_publishers():
+    hub = events.EventHub(events.Broker())
+
+    async def scenario():
+        slow = hub.subscribe(1, maxsize=3)
+        other = hub.subscribe(2, maxsize=3)
+        # Publishers run on other threads and must never wait for consumers
+        publisher = threading.Thread(target=lambda: [hub.publish(1, events.BALANCE_CHANGED, {"n": n}) for n in range(5)])
+        publisher.start()
+        publisher.join(timeout=1)
+        assert not publisher.is_alive()
+        hub.publish(2, events.PAYMENT_RECEIVED, {"amount": 5})
+        await asyncio.sleep(0.05)
+
+        # The buffered events are still delivered, then the consumer learns it was dropped
+        assert [(await slow.get(timeout=1))["data"]["n"] for _ in range(3)] == [0, 1, 2]
+        with pytest.raises(events.ConsumerDropped):
+            await slow.get(timeout=1)
+        assert slow.dropped
+        # Other users' connections are unaffected
+        assert (await other.get(timeout=1))["type"] == events.PAYMENT_RECEIVED
+        assert hub.connections() == 1
+        other.close()
+
+    asyncio.run(scenario())
+    assert hub.connections() == 0
+
+
+def test_websocket_receives_published_events(client, login):
+    headers = login("alice")
+    token = headers["Authorization"][7:]
+    with client.websocket_connect(f"/events/ws?token={token}") as websocket:
+        deadline = time.monotonic() + 5
+        while events.hub.connections() == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        user_id = client.get("/users/me/", headers=headers).json()["id"]
+        events.hub.publish(user_id, events.PAYMENT_RECEIVED, {"amount": 12.5})
+        message = websocket.receive_json()
+    assert message["type"] == events.PAYMENT_RECEIVED and message["data"] == {"amount": 12.5}
+    # Closing the socket releases the subscription without waiting for a heartbeat
+    assert events.hub.connections() == 0
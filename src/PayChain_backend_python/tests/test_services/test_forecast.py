@@ -0,0 +1,69 @@
+import random
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from app import crud, forecast, schemas
+from app.models import ScheduledPaymentFrequency as Frequency
+
+START = date(2024, 1, 15)
+
+
+def _occurrences_one_by_one(payment, start_date: date, end_date: date):
+    """Step each schedule the way the processor does"""
+    occurrences = []
+    current = max(payment.next_payment_date, start_date)
+    last = min(payment.end_date or end_date, end_date)
+    remaining = payment.max_payments - payment.payments_made if payment.max_payments else None
+    while current is not None and current <= last and (remaining is None or len(occurrences) < remaining):
+        occurrences.append(current)
+        current = crud.calculate_next_payment_date(current, payment.frequency)
+    return occurrences
+
+
+def test_bulk_expansion_matches_stepping_each_schedule():
+    rng = random.Random(7)
+    # Month ends and a leap day, where calendar steps clamp
+    anchors = [date(2024, 1, 31), date(2024, 2, 29), date(2023, 12, 30), START, date(2024, 3, 1)]
+    payments = [
+        SimpleNamespace(
+            frequency=rng.choice(list(Frequency)),
+            next_payment_date=rng.choice(anchors) + timedelta(days=rng.choice([0, 0, 3, 40])),
+            end_date=rng.choice([None, date(2024, 6, 30), date(2025, 2, 28)]),
+            max_payments=rng.choice([None, 1, 4]),
+            payments_made=rng.choice([0, 1])
+        )
+        for _ in range(300)
+    ]
+    end_date = START + timedelta(days=499)
+
+    owners, dates = forecast.expand_occurrences(payments, START, end_date)
+    expanded = sorted(zip(owners.tolist(), dates.astype(object).tolist()))
+    expected = sorted(
+        (index, occurrence)
+        for index, payment in enumerate(payments)
+        for occurrence in _occurrences_one_by_one(payment, START, end_date)
+    )
+    assert expanded == expected
+
+
+def test_forecast_endpoint_projects_the_balance(client, login, db):
+    headers = login("payer")
+    login("payee")
+    payer, payee = crud.get_user_by_principal(db, "payer"), crud.get_user_by_principal(db, "payee")
+    today = date.today()
+    for amount, frequency in ((100.0, Frequency.WEEKLY), (50.0, Frequency.ONCE)):
+        crud.create_scheduled_payment(db, schemas.ScheduledPaymentCreate(
+            recipient_principal="payee", amount=amount, start_date=today, frequency=frequency
+        ), user_id=payer.id)
+
+    response = client.get("/scheduled-payments/forecast?days=14", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["starting_balance"] == payer.balance
+    assert body["total_outgoing"] == 250.0
+    assert [day["payment_count"] for day in body["series"]][:8] == [2, 0, 0, 0, 0, 0, 0, 1]
+    assert body["series"][-1]["balance"] == payer.balance - 250.0
+
+    # The recipient sees the same schedules as incoming
+    payee_forecast = forecast.forecast_cash_flow(db, payee, 14, today)
+    assert payee_forecast["total_incoming"] == 250.0 and payee_forecast["total_outgoing"] == 0.0
@@ -0,0 +1,62 @@
+import logging
+
+import pytest
+from pydantic import ValidationError
+
+from app import jobs, models
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def admin(client, login):
+    yield login("root", domain="admin.com")
+    jobs.manager.shutdown(wait=True)
+
+
+def test_unknown_and_invalid_params_are_rejected(client, admin, db):
+    for params in ({"worker": 2}, {"workers": 0}, {"chunk_size": "lots"}, {"current_date": "tomorrow"}):
+        response = client.post("/admin/jobs/", headers=admin, json={
+            "job_type": "process_scheduled_payments", "params": params
+        })
+        assert response.status_code == 422, params
+        assert response.json()["detail"][0]["loc"][:2] == ["body", "params"]
+
+    response = client.post("/admin/jobs/", headers=admin, json={"job_type": "refresh_analytics_snapshot", "params": {"x": 1}})
+    assert response.status_code == 422
+    assert db.query(models.Job).count() == 0
+
+
+def test_params_are_stored_validated_and_workers_clamped(client, admin, db):
+    response = client.post("/admin/jobs/", headers=admin, json={
+        "job_type": "process_scheduled_payments",
+        "params": {"current_date": "2025-03-10", "chunk_size": "50", "workers": 10 ** 6}
+    })
+    assert response.status_code == 200
+    assert response.json()["params"] == {"current_date": "2025-03-10", "chunk_size": 50, "workers": jobs.JOB_MAX_WORKERS}
+
+    jobs.manager.shutdown(wait=True)
+    job = db.query(models.Job).one()
+    db.refresh(job)
+    assert job.status == models.JobStatus.SUCCEEDED, job.error
+
+
+def test_failure_is_logged_and_stored(db, caplog):
+    manager = jobs.JobManager(SessionLocal)
+
+    class Params(jobs.JobParams):
+        reason: str
+
+    @manager.register("fails", params=Params)
+    def fails(ctx, reason):
+        raise RuntimeError(reason)
+
+    with pytest.raises(ValidationError):
+        manager.submit(db, "fails", {})
+    job = manager.submit(db, "fails", {"reason": "disk full"})
+    with caplog.at_level(logging.ERROR, logger="jobs"):
+        manager.shutdown(wait=True)
+
+    db.refresh(job)
+    assert job.status == models.JobStatus.FAILED
+    assert job.error == "disk full"
+    assert caplog.records[0].exc_info[0] is RuntimeError
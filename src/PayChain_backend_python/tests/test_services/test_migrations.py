@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from app import migrations, models
+
+
+def _engine(tmp_path, name: str = "migrations.db"):
+    return create_engine(f"sqlite:///{tmp_path / name}", connect_args={"check_same_thread": False})
+
+
+def _versions(engine):
+    with engine.connect() as conn:
+        return [row.version for row in conn.execute(migrations.schema_version.select().order_by("version"))]
+
+
+def test_migrate_applies_each_version_once(tmp_path):
+    engine = _engine(tmp_path)
+    every_version = [number for number, _, _ in migrations.MIGRATIONS]
+    assert migrations.migrate(engine) == every_version
+    assert migrations.migrate(engine) == []
+    assert _versions(engine) == every_version
+
+    # Startup against a current schema is only the version check
+    migrations.ensure_schema(engine, auto_migrate=False)
+
+
+def test_concurrent_workers_migrate_once(tmp_path):
+    engine = _engine(tmp_path)
+    applied, errors = [], []
+
+    def migrate():
+        try:
+            applied.append(migrations.migrate(engine))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=migrate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sorted(map(len, applied)) == [0, 0, 0, len(migrations.MIGRATIONS)]
+    assert len(_versions(engine)) == len(migrations.MIGRATIONS)
+
+
+def test_database_created_before_versioning_is_adopted(tmp_path):
+    engine = _engine(tmp_path)
+    # Tables as create_all made them, without a schema_version table
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE users DROP COLUMN unread_notifications")
+
+    with pytest.raises(migrations.SchemaOutOfDate):
+        migrations.ensure_schema(engine, auto_migrate=False)
+    migrations.ensure_schema(engine, auto_migrate=True)
+    assert "unread_notifications" in {column["name"] for column in inspect(engine).get_columns("users")}
+    with engine.connect() as conn:
+        assert migrations.current_version(conn) == migrations.LATEST_VERSION
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from app import crud, models, notifications, schemas
+
+
+def _pay(db, payer, recipient_principal: str, amount: float):
+    crud.create_transaction(db, schemas.TransactionCreate(
+        recipient_principal=recipient_principal, amount=amount, description="payment", category="Food"
+    ), user_id=payer.id)
+
+
+def _unread_rows(db, user) -> int:
+    return db.query(models.Notification).filter_by(user_id=user.id, read=False).count()
+
+
+def test_unread_counter_follows_mark_read_and_read_all(client, login, db):
+    headers = login("alice")
+    login("bob")
+    alice, bob = crud.get_user_by_principal(db, "alice"), crud.get_user_by_principal(db, "bob")
+    for amount in (1.0, 2.0, 3.0):
+        _pay(db, bob, "alice", amount)
+    _pay(db, alice, "bob", 4.0)
+
+    def unread_count():
+        count = client.get("/notifications/unread-count", headers=headers).json()["count"]
+        assert count == _unread_rows(db, alice)
+        return count
+
+    inbox = client.get("/notifications/", headers=headers).json()
+    assert inbox["unread_count"] == 3 == unread_count()
+    newest = inbox["items"][0]["id"]
+
+    # Marking the same notification twice counts once
+    for _ in range(2):
+        assert client.put(f"/notifications/{newest}/read", headers=headers).status_code == 200
+        assert unread_count() == 2
+    # Someone else's notification
+    bobs = db.query(models.Notification.id).filter_by(user_id=bob.id).scalar()
+    assert client.put(f"/notifications/{bobs}/read", headers=headers).status_code == 404
+    assert unread_count() == 2
+
+    assert client.put("/notifications/read-all", headers=headers).json() == {"success": True, "updated": 2}
+    assert unread_count() == 0
+    assert client.put("/notifications/read-all", headers=headers).json()["updated"] == 0
+    assert unread_count() == 0
+
+    _pay(db, bob, "alice", 5.0)
+    assert unread_count() == 1
+    assert notifications.get_unread_count(db, bob.id) == _unread_rows(db, bob) == 1
+
+
+def test_sweep_subtracts_unread_rows_it_deletes(db, make_user):
+    alice, bob = make_user("alice"), make_user("bob")
+    for amount in (1.0, 2.0, 3.0):
+        _pay(db, bob, "alice", amount)
+    rows = db.query(models.Notification).filter_by(user_id=alice.id).order_by(models.Notification.id).all()
+    notifications.mark_read(db, alice.id, rows[0].id)
+    # The read one and one unread one are past retention
+    for row in rows[:2]:
+        row.created_at = datetime.utcnow() - timedelta(days=notifications.NOTIFICATION_RETENTION_DAYS + 1)
+    db.commit()
+
+    assert notifications.sweep_notifications(db, batch_size=1) == {"deleted": 2}
+    assert notifications.get_unread_count(db, alice.id) == _unread_rows(db, alice) == 1
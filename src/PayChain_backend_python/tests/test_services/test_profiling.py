@@ -0,0 +1,93 @@
+import logging
+
+from sqlalchemy import text
+
+from app import crud, profiling
+
+
+def _samples(text: str) -> dict:
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+
+def test_metrics_are_recorded_per_route_template(client):
+    profiling.registry.reset()
+    for _ in range(2):
+        assert client.get("/health").status_code == 200
+    assert client.get("/templates/7").status_code == 401
+    assert client.get("/no-such-page").status_code == 404
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = _samples(response.text)
+    assert samples['paychain_http_requests_total{method="GET",route="/health",status="200"}'] == "2"
+    # Path parameters and unknown paths do not create new label values
+    assert samples['paychain_http_requests_total{method="GET",route="/templates/{template_id}",status="401"}'] == "1"
+    assert samples['paychain_http_requests_total{method="GET",route="unmatched",status="404"}'] == "1"
+    assert samples['paychain_http_request_duration_seconds_count{method="GET",route="/health"}'] == "2"
+    assert samples['paychain_http_request_queries_bucket{method="GET",route="/health",le="0"}'] == "2"
+    assert int(samples['paychain_http_response_size_bytes_bucket{method="GET",route="/health",le="256"}']) == 2
+
+
+def test_query_alarm_names_the_route_and_callers(client, login, monkeypatch, caplog):
+    headers = login("payer")
+    profiling.registry.reset()
+    monkeypatch.setattr(profiling, "PROFILING_QUERY_ALARM", 1)
+
+    with caplog.at_level(logging.WARNING, logger="profiling"):
+        assert client.get("/users/me/", headers=headers).status_code == 200
+        assert client.get("/health").status_code == 200
+    alarms = [record.getMessage() for record in caplog.records if record.name == "profiling"]
+    assert len(alarms) == 1
+    assert alarms[0].startswith("N+1 alarm: GET /users/me/ issued ")
+    assert "crud.get_user" in alarms[0]
+
+    samples = _samples(client.get("/metrics").text)
+    queries = samples['paychain_http_request_queries_sum{method="GET",route="/users/me/"}']
+    assert float(queries) >= 2
+
+
+def test_fingerprint_ignores_values_and_in_list_length():
+    statements = [
+        "SELECT * FROM users WHERE id IN (?, ?, ?) AND email = 'a@example.com' AND balance > 10",
+        "SELECT *  FROM users\n WHERE id IN (?,?) AND email = 'o''brien@example.com' AND balance > 2.5",
+    ]
+    assert {profiling.fingerprint(statement) for statement in statements} == {
+        "SELECT * FROM users WHERE id IN (?, ...) AND email = ? AND balance > ?"
+    }
+    assert profiling.fingerprint("SELECT * FROM t WHERE a = %(a)s") == profiling.fingerprint("SELECT * FROM t WHERE a = %s")
+
+
+def test_slow_queries_are_grouped_with_callers_and_a_plan(db, make_user, monkeypatch):
+    log = profiling.SlowQueryLog(threshold_ms=1e-6, capacity=3)
+    monkeypatch.setattr(profiling, "slow_queries", log)
+    users = [make_user(name) for name in ("alice", "bob", "carol")]
+    log.reset()
+
+    for user in users:
+        crud.get_user(db, user.id)
+    [entry] = [row for row in log.top() if row["callers"] == {"crud.get_user": 3}]
+    assert entry["count"] == 3
+    assert entry["p50_ms"] <= entry["p99_ms"] <= entry["max_ms"]
+    # Types of the bound values only, never the values
+    assert entry["parameter_shape"] == ["int", "int", "int"]
+    # Captured once, from EXPLAIN QUERY PLAN on SQLite
+    assert entry["plan"] == ["SEARCH users USING INTEGER PRIMARY KEY (rowid=?)"]
+
+    # Least recently seen fingerprints are evicted past the capacity
+    for statement in ("SELECT 1", "SELECT 1, 2", "SELECT 1, 2, 3"):
+        db.execute(text(statement))
+    assert entry["fingerprint"] not in {row["fingerprint"] for row in log.top()}
+    assert len(log.top()) == 3
+    assert [row["count"] for row in log.top(order_by="count")] == [1, 1, 1]
+
+
+def test_slow_query_endpoint_is_admin_only(client, login, monkeypatch):
+    monkeypatch.setattr(profiling, "slow_queries", profiling.SlowQueryLog(threshold_ms=1e-6))
+    assert client.get("/admin/slow-queries", headers=login("alice")).status_code == 403
+
+    response = client.get("/admin/slow-queries?order_by=count&limit=5", headers=login("root", domain="admin.com"))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["enabled"] and 0 < len(body["queries"]) <= 5
+    counts = [row["count"] for row in body["queries"]]
+    assert counts == sorted(counts, reverse=True)
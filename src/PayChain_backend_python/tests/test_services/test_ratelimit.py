@@ -0,0 +1,88 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import auth, ratelimit
+
+LIMITS = {
+    ratelimit.PAYMENTS: (10.0, 20.0),
+    ratelimit.READS: (10.0, 20.0),
+    ratelimit.REPORTS: (0.5, 2.0),
+    ratelimit.AUTH: (1.0, 5.0),
+}
+PATHS = {
+    ratelimit.REPORTS: ("GET", "/reports/summary/"),
+    ratelimit.READS: ("GET", "/transactions/"),
+    ratelimit.AUTH: ("POST", "/login/"),
+    ratelimit.PAYMENTS: ("POST", "/transactions/"),
+}
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    """(client, monitor) for a bare app behind the middleware"""
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "SHED_LOOP_LAG_SECONDS", 0.1)
+    monkeypatch.setattr(ratelimit, "SHED_POOL_WAIT_SECONDS", 0)
+    app = FastAPI()
+
+    @app.api_route("/{path:path}", methods=["GET", "POST"])
+    def anything(path: str):
+        return {"path": path}
+
+    monitor = ratelimit.LoadMonitor()
+    app.add_middleware(ratelimit.RateLimitMiddleware, buckets=ratelimit.TokenBuckets(LIMITS), load_monitor=monitor)
+    return TestClient(app), monitor
+
+
+def test_bucket_refills_at_its_rate():
+    buckets = ratelimit.TokenBuckets(LIMITS)
+    assert [buckets.acquire("a", ratelimit.REPORTS, now=100.0) for _ in range(2)] == [0.0, 0.0]
+    assert buckets.acquire("a", ratelimit.REPORTS, now=100.0) == 2.0
+    assert buckets.acquire("a", ratelimit.REPORTS, now=101.0) == 1.0
+    assert buckets.acquire("a", ratelimit.REPORTS, now=103.0) == 0.0
+    # Other clients and route classes have their own buckets
+    assert buckets.acquire("b", ratelimit.REPORTS, now=103.0) == 0.0
+    assert buckets.acquire("a", ratelimit.READS, now=103.0) == 0.0
+
+
+def test_exhausted_bucket_returns_429_with_retry_after(limited):
+    client, _ = limited
+    alice = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'alice@example.com'})}"}
+    bob = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'bob@example.com'})}"}
+
+    assert [client.get("/reports/summary/", headers=alice).status_code for _ in range(2)] == [200, 200]
+    response = client.get("/reports/summary/", headers=alice)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    # Limited per user, per route class; health checks are exempt
+    assert client.get("/reports/summary/", headers=bob).status_code == 200
+    assert client.get("/transactions/", headers=alice).status_code == 200
+    assert all(client.get("/health").status_code == 200 for _ in range(5))
+
+
+def test_shedding_order_follows_pressure(limited):
+    client, monitor = limited
+
+    def admitted():
+        return {
+            route_class
+            for route_class, (method, path) in PATHS.items()
+            if client.request(method, path).status_code != 503
+        }
+
+    everything = set(PATHS)
+    expected = [
+        (0.0, everything),
+        (0.1, everything - {ratelimit.REPORTS}),
+        (0.2, {ratelimit.AUTH, ratelimit.PAYMENTS}),
+        (0.4, {ratelimit.PAYMENTS}),
+        (10.0, {ratelimit.PAYMENTS}),
+    ]
+    for loop_lag, classes in expected:
+        monitor.loop_lag = loop_lag
+        assert admitted() == classes, loop_lag
+
+    monitor.loop_lag = 1.0
+    response = client.get("/transactions/")
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
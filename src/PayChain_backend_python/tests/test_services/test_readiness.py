@@ -0,0 +1,45 @@
+import asyncio
+import signal
+
+import pytest
+
+from app import readiness, server
+
+
+@pytest.fixture
+def state(monkeypatch):
+    state = readiness.Readiness()
+    monkeypatch.setattr(readiness, "state", state)
+    return state
+
+
+def test_ready_only_between_warm_up_and_draining(client, state):
+    response = client.get("/ready")
+    assert response.status_code == 503 and response.json()["status"] == "starting"
+
+    readiness.warm_up()
+    assert client.get("/ready").json()["status"] == "ready"
+    assert client.get("/ready").status_code == 200
+
+    state.start_draining()
+    response = client.get("/ready")
+    assert response.status_code == 503 and response.json()["status"] == "draining"
+    # Still serving requests while the load balancer catches up
+    assert client.get("/health").status_code == 200
+
+
+def test_sigterm_drains_before_the_server_exits(state, monkeypatch):
+    import uvicorn
+    monkeypatch.setattr(server, "DRAIN_SECONDS", 0.05)
+    worker = server._server_class()(uvicorn.Config("app.main:app"))
+    state.mark_warm()
+
+    async def scenario():
+        worker.started = True
+        worker.handle_exit(signal.SIGTERM, None)
+        assert state.status()["status"] == "draining"
+        assert not worker.should_exit
+        await asyncio.sleep(0.2)
+        assert worker.should_exit
+
+    asyncio.run(scenario())
@@ -0,0 +1,202 @@
+import random
+from datetime import datetime
+
+from app import rules
+from app.models import TemplateConditionOperator as Op, TemplateConditionType as Kind
+
+AMOUNTS = [0.5, 5, 9.99, 10, 10.01, 20, 50, 100, 250.5]
+CATEGORIES = ["food", "rent", "travel"]
+TAGS = ["a", "b", "c", "ab"]
+TIMES = ["00:00", "00:01", "01:30", "02:00", "11:59", "12:00", "21:59", "22:00", "23:30", "23:59"]
+
+
+def _condition(rng: random.Random) -> dict:
+    kind = rng.choice(list(Kind))
+    if kind == Kind.AMOUNT:
+        op = rng.choice([Op.EQUALS, Op.GREATER_THAN, Op.LESS_THAN])
+        value = str(rng.choice(AMOUNTS))
+    elif kind == Kind.CATEGORY:
+        op, value = rng.choice([Op.EQUALS, Op.CONTAINS]), rng.choice(CATEGORIES + ["OO", "Rent "])
+    elif kind == Kind.TAG:
+        op, value = rng.choice([Op.EQUALS, Op.CONTAINS]), rng.choice(TAGS)
+    elif kind == Kind.TIME:
+        op = rng.choice(list(Op))
+        if op == Op.CONTAINS:
+            # Windows that wrap midnight as often as not
+            value = f"{rng.choice(TIMES)}-{rng.choice(TIMES)}"
+        elif op == Op.EQUALS and rng.random() < 0.5:
+            value = str(rng.randrange(24))
+        else:
+            value = rng.choice(TIMES)
+    elif kind == Kind.METADATA:
+        op = rng.choice(list(Op))
+        value = rng.choice(["channel=web", "channel", "score=5", "score=x"])
+    else:
+        # Frequency conditions make the template invalid
+        op, value = Op.GREATER_THAN, "3"
+    return {"condition_type": kind, "operator": op, "value": value}
+
+
+def _row(rng: random.Random, template_id: int) -> dict:
+    return {
+        "id": template_id,
+        "is_active": rng.random() < 0.9,
+        "conditions": [_condition(rng) for _ in range(rng.randint(0, 3))]
+    }
+
+
+def _transactions(rng: random.Random, count: int):
+    return [
+        rules.Candidate(
+            amount=rng.choice(AMOUNTS + [round(rng.uniform(0, 300), 2)]),
+            category=rng.choice(CATEGORIES + [None, "Food"]),
+            tags=rng.sample(TAGS, rng.randint(0, 2)),
+            metadata=rng.choice([{}, {"channel": "web"}, {"channel": "pos", "score": "7"}, {"score": 3}]),
+            timestamp=datetime(2025, 3, 10, *map(int, rng.choice(TIMES).split(":")))
+        )
+        for _ in range(count)
+    ]
+
+
+def _brute_force(rows, transactions):
+    """Every active template with conditions checked against every transaction"""
+    compiled = [rules.CompiledTemplate(row) for row in rows if row["is_active"] and row["conditions"]]
+    valid = [template for template in compiled if not template.error]
+    matches = [sorted(template.id for template in valid if template.matches(tx)) for tx in transactions]
+    return matches, sorted((template.id, template.error) for template in compiled if template.error)
+
+
+def _assert_same_as_brute_force(rule_set, rows, transactions):
+    expected, invalid = _brute_force(rows, transactions)
+    assert rule_set.match_many(transactions)[0] == expected
+    assert rule_set.invalid() == invalid
+
+
+def test_indexed_matching_equals_brute_force():
+    rng = random.Random(3)
+    rows = [_row(rng, template_id) for template_id in range(1, 801)]
+    transactions = _transactions(rng, 500)
+    rule_set = rules.RuleSet()
+    rule_set.sync(rows)
+
+    _assert_same_as_brute_force(rule_set, rows, transactions)
+    matches, checked = rule_set.match_many(transactions)
+    assert any(matches)
+    # The indexes narrow the search
+    assert checked < len(rule_set.templates) * len(transactions)
+
+
+def test_sync_recompiles_only_changed_templates():
+    rng = random.Random(5)
+    rows = [_row(rng, template_id) for template_id in range(1, 301)]
+    transactions = _transactions(rng, 300)
+    rule_set = rules.RuleSet()
+    rule_set.sync(rows)
+
+    for round_ in range(5):
+        rows = [dict(row) for row in rows]
+        edited = set()
+        for index in rng.sample(range(len(rows)), 40):
+            rows[index] = _row(rng, rows[index]["id"])
+            edited.add(rows[index]["id"])
+        removed = {row["id"] for row in rng.sample(rows, 20)} - edited
+        rows = [row for row in rows if row["id"] not in removed]
+        added = [_row(rng, 1000 + 50 * round_ + i) for i in range(10)]
+        rows += added
+
+        evaluable = {row["id"] for row in rows if row["is_active"] and row["conditions"]}
+        changed = [tid for tid in evaluable if tid in edited or tid >= 1000 + 50 * round_]
+        assert rule_set.sync(rows) <= len(changed)
+        assert set(rule_set.templates) == evaluable
+        _assert_same_as_brute_force(rule_set, rows, transactions)
+
+    # Nothing stale is left in the indexes once every template is gone
+    rule_set.sync([])
+    assert rule_set.templates == {}
+    assert not rule_set._above and not rule_set._below and not rule_set._unindexed
+    assert not rule_set._category and not rule_set._tag and not rule_set._cents
+    assert not any(rule_set._hours)
+
+
+def _template(template_id: int, *conditions) -> dict:
+    return {
+        "id": template_id,
+        "is_active": True,
+        "conditions": [{"condition_type": kind, "operator": op, "value": value} for kind, op, value in conditions]
+    }
+
+
+def test_amount_threshold_bounds():
+    rule_set = rules.RuleSet()
+    rule_set.sync([
+        _template(1, (Kind.AMOUNT, Op.GREATER_THAN, "10")),
+        _template(2, (Kind.AMOUNT, Op.LESS_THAN, "10")),
+        _template(3, (Kind.AMOUNT, Op.EQUALS, "10")),
+    ])
+    assert [rule_set.match(rules.Candidate(amount)) for amount in (9.99, 10, 10.01)] == [[2], [3], [1]]
+
+
+def test_time_window_wrapping_midnight():
+    rule_set = rules.RuleSet()
+    rule_set.sync([_template(1, (Kind.TIME, Op.CONTAINS, "22:00-02:00"))])
+    at = lambda hour, minute: rules.Candidate(10, timestamp=datetime(2025, 3, 10, hour, minute))
+    assert [rule_set.match(at(*time)) for time in ((21, 59), (22, 0), (23, 30), (1, 59), (2, 0))] == [
+        [], [1], [1], [1], []
+    ]
+
+
+def test_anchor_is_most_selective_condition():
+    template = rules.CompiledTemplate(_template(
+        1, (Kind.AMOUNT, Op.GREATER_THAN, "5"), (Kind.TIME, Op.CONTAINS, "09:00-17:00"), (Kind.TAG, Op.EQUALS, "Rent")
+    ))
+    assert template.anchor == ("tag", "rent")
+    assert rules.CompiledTemplate(_template(2, (Kind.METADATA, Op.CONTAINS, "channel"))).anchor is None
+
+
+def test_invalid_templates_are_reported_and_never_match():
+    rule_set = rules.RuleSet()
+    rule_set.sync([
+        _template(1, (Kind.FREQUENCY, Op.GREATER_THAN, "3")),
+        _template(2, (Kind.AMOUNT, Op.GREATER_THAN, "ten")),
+        _template(3, (Kind.TIME, Op.CONTAINS, "10:00-10:00")),
+        _template(4, (Kind.AMOUNT, Op.GREATER_THAN, "1")),
+    ])
+    assert [template_id for template_id, _ in rule_set.invalid()] == [1, 2, 3]
+    assert rule_set.match(rules.Candidate(50, timestamp=datetime(2025, 3, 10, 10, 0))) == [4]
+
+
+def test_evaluate_endpoint_follows_template_edits(client, login):
+    headers = login("owner")
+
+    def create(name, conditions, is_active=True):
+        response = client.post("/templates/", headers=headers, json={
+            "name": name, "recipient_principal": "shop", "amount": 10.0, "is_active": is_active,
+            "conditions": [{"condition_type": kind, "operator": op, "value": value} for kind, op, value in conditions]
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    def evaluate(*transactions):
+        response = client.post("/templates/evaluate", headers=headers, json={"transactions": list(transactions)})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    groceries = create("Groceries", [("category", "equals", "food"), ("amount", "less_than", "100")])
+    large = create("Large", [("amount", "greater_than", "500")])
+    invalid = create("Broken", [("frequency", "greater_than", "3")])
+    small_food = {"amount": 20, "category": "Food"}
+    big_rent = {"amount": 900, "category": "rent"}
+
+    result = evaluate(small_food, big_rent)
+    assert result["matches"] == [[groceries], [large]]
+    assert result["invalid_templates"] == [{"template_id": invalid, "detail": result["invalid_templates"][0]["detail"]}]
+
+    # Edited conditions are recompiled; deactivated templates drop out
+    response = client.put(f"/templates/{groceries}", headers=headers, json={
+        "conditions": [{"condition_type": "category", "operator": "equals", "value": "rent"}]
+    })
+    assert response.status_code == 200, response.text
+    assert client.put(f"/templates/{large}", headers=headers, json={"is_active": False}).status_code == 200
+    result = evaluate(small_food, big_rent)
+    assert result["matches"] == [[], [groceries]]
+    assert result["templates"] == 2
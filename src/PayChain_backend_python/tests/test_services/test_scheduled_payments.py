@@ -0,0 +1,125 @@
+from datetime import date
+
+from app import crud, listcache, models, schemas
+
+TODAY = date(2025, 3, 25)
+
+
+def _schedule(db, payer, payee, amount: float, frequency: str):
+    return crud.create_scheduled_payment(db, schemas.ScheduledPaymentCreate(
+        recipient_principal=payee.principal_id,
+        amount=amount,
+        description=f"{frequency} payment",
+        start_date=TODAY,
+        frequency=frequency
+    ), user_id=payer.id)
+
+
+def test_once_schedule_is_paid_once_and_deactivated(db, make_user):
+    payer, payee = make_user("payer"), make_user("payee")
+    once = _schedule(db, payer, payee, 30.0, "once")
+    # Processed in the same chunk as the one-time schedule
+    monthly = _schedule(db, payer, payee, 20.0, "monthly")
+
+    stats = crud.process_scheduled_payments(db, TODAY)
+    assert stats["processed"] == 2
+    assert stats["failed"] == 0
+
+    db.expire_all()
+    once = crud.get_scheduled_payment(db, once.id)
+    assert not once.is_active
+    assert once.payments_made == 1
+    assert once.next_payment_date is None
+    assert once.lease_owner is None
+    monthly = crud.get_scheduled_payment(db, monthly.id)
+    assert monthly.next_payment_date == date(2025, 4, 25)
+    assert crud.get_user_balance(db, payer.id) == 950.0
+    assert crud.get_user_balance(db, payee.id) == 1050.0
+
+    # Nothing is left to pay
+    assert crud.process_scheduled_payments(db, TODAY)["due"] == 0
+    assert db.query(models.ScheduledPaymentTransaction).filter_by(scheduled_payment_id=once.id).count() == 1
+
+
+def test_failed_chunk_counts_only_failures(db, make_user, monkeypatch):
+    payer, payee = make_user("payer"), make_user("payee")
+    _schedule(db, payer, payee, 10.0, "monthly")
+    # Would be counted as deactivated before the chunk fails
+    finished = _schedule(db, payer, payee, 10.0, "monthly")
+    finished.max_payments = finished.payments_made = 1
+    db.commit()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("write failed")
+    monkeypatch.setattr(listcache, "stage", fail)
+
+    stats = crud.process_scheduled_payments(db, TODAY)
+    assert stats == {**crud._empty_processing_stats(), "failed": 2}
+    assert crud.get_user_balance(db, payer.id) == 1000.0
+
+
+def test_failing_schedule_does_not_hold_back_its_chunk(db, make_user, monkeypatch):
+    payer, payee = make_user("payer"), make_user("payee")
+    schedule_ids = [_schedule(db, payer, payee, 1.0, "monthly").id for _ in range(8)]
+    bad_id = schedule_ids[5]
+
+    payment_events = crud._payment_events
+    def fail_for_bad_schedule(tx, *args, scheduled_payment_id=None, **extra):
+        if scheduled_payment_id == bad_id:
+            raise RuntimeError("bad schedule")
+        return payment_events(tx, *args, scheduled_payment_id=scheduled_payment_id, **extra)
+    monkeypatch.setattr(crud, "_payment_events", fail_for_bad_schedule)
+
+    stats = crud.process_scheduled_payments(db, TODAY, chunk_size=8)
+    assert stats["processed"] == 7
+    assert stats["failed"] == 1
+
+    # Only the failing schedule keeps its lease, to be retried once it expires
+    db.expire_all()
+    sp = models.ScheduledPayment
+    assert [payment_id for (payment_id,) in db.query(sp.id).filter(sp.lease_owner.isnot(None))] == [bad_id]
+    assert db.query(sp).filter(sp.payments_made == 1).count() == 7
+    assert crud.get_user_balance(db, payer.id) == 993.0
+
+
+def test_schedule_waits_for_its_recipient_to_register(db, make_user):
+    payer = make_user("payer")
+    schedule = crud.create_scheduled_payment(db, schemas.ScheduledPaymentCreate(
+        recipient_principal="ghost", amount=10.0, start_date=TODAY, frequency="monthly"
+    ), user_id=payer.id)
+    template = crud.create_payment_template(db, schemas.PaymentTemplateCreate(name="Ghost", recipient_principal="ghost"), payer.id)
+    assert schedule.recipient_id is None and schedule.recipient_unresolvable
+    assert template.recipient_id is None
+
+    # Flagged schedules are not claimed
+    assert crud.process_scheduled_payments(db, TODAY)["due"] == 0
+
+    ghost = make_user("ghost")
+    db.expire_all()
+    assert crud.get_scheduled_payment(db, schedule.id).recipient_id == ghost.id
+    assert not crud.get_scheduled_payment(db, schedule.id).recipient_unresolvable
+    assert crud.get_template(db, template.id).recipient_id == ghost.id
+    assert crud.process_scheduled_payments(db, TODAY)["processed"] == 1
+    assert crud.get_user_balance(db, ghost.id) == 1010.0
+
+
+def test_resolve_recipients_pins_legacy_rows(db, make_user):
+    payer, payee = make_user("payer"), make_user("payee")
+    legacy = [_schedule(db, payer, payee, 10.0, "monthly") for _ in range(3)]
+    missing = _schedule(db, payer, payee, 10.0, "weekly")
+    # Rows written before recipients were pinned
+    db.query(models.ScheduledPayment).update({models.ScheduledPayment.recipient_id: None}, synchronize_session=False)
+    db.query(models.ScheduledPayment).filter_by(id=missing.id).update(
+        {models.ScheduledPayment.recipient_principal: "nobody"}, synchronize_session=False
+    )
+    db.commit()
+
+    batches = []
+    stats = crud.resolve_payment_recipients(db, batch_size=2, on_batch=batches.append)
+    assert stats == {"resolved": 3, "unresolvable": 1}
+    assert len(batches) == 2
+
+    db.expire_all()
+    assert {crud.get_scheduled_payment(db, payment.id).recipient_id for payment in legacy} == {payee.id}
+    assert crud.get_scheduled_payment(db, missing.id).recipient_unresolvable
+    assert crud.process_scheduled_payments(db, TODAY)["processed"] == 3
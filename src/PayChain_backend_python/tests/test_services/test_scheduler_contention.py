@@ -0,0 +1,23 @@
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                      "benchmarks", "scheduler_contention.py")
+
+
+def test_concurrent_schedulers_pay_every_schedule_exactly_once():
+    # Its own processes and SQLite file: scheduler processes plus one that crashes holding leases
+    completed = subprocess.run(
+        [sys.executable, SCRIPT, "--schedules", "300", "--users", "50", "--processes", "3",
+         "--chunk-size", "50", "--timeout", "60"],
+        capture_output=True, text=True, timeout=180
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    assert result["missing"] == 0, completed.stdout
+    assert result["duplicated"] == 0, completed.stdout
+    assert result["transactions"] == result["schedules"]
+    assert result["balance_conserved"]
+    assert completed.returncode == 0, completed.stderr
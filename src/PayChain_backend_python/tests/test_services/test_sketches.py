@@ -0,0 +1,188 @@
+import math
+import random
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import crud, models, schemas, sketches
+from app.database import SessionLocal
+from app.sketches import DDSketch, HyperLogLog
+
+# Documented bounds (ANALYTICS_GUIDE.md, Approximate Mode)
+HLL_STANDARD_ERROR = 1.04 / math.sqrt(2 ** sketches.HLL_PRECISION)
+SMALL_COUNT_ERROR = 0.05
+QUANTILES = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+
+def _exact_quantile(values, q: float) -> float:
+    # The rank DDSketch.quantile answers for
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def _assert_quantiles_within_alpha(sketch: DDSketch, values):
+    for q in QUANTILES:
+        exact = _exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= sketch.alpha * exact * (1 + 1e-9), q
+
+
+def test_hyperloglog_error_within_standard_error():
+    for n in (1000, 10000):
+        errors = []
+        for trial in range(30):
+            sketch = HyperLogLog()
+            for i in range(n):
+                sketch.add(f"{trial}-{i}")
+            errors.append(sketch.count() / n - 1)
+        rms = math.sqrt(sum(e * e for e in errors) / len(errors))
+        assert rms <= 1.25 * HLL_STANDARD_ERROR, (n, rms)
+        assert max(abs(e) for e in errors) <= 4 * HLL_STANDARD_ERROR, n
+
+
+def test_hyperloglog_near_exact_for_small_counts():
+    for n in (10, 50, 100, 200):
+        for trial in range(10):
+            sketch = HyperLogLog()
+            for i in range(n):
+                # Repeats must not be counted twice
+                sketch.add(f"{trial}-{i}")
+                sketch.add(f"{trial}-{i}")
+            assert abs(sketch.count() - n) <= SMALL_COUNT_ERROR * n, (n, trial)
+
+
+def test_ddsketch_quantiles_within_alpha():
+    rng = random.Random(7)
+    for values in (
+        [rng.lognormvariate(3, 1.5) for _ in range(50000)],
+        [rng.uniform(0.01, 10000) for _ in range(50000)],
+        [round(rng.expovariate(1 / 40), 2) + 0.01 for _ in range(5000)],
+    ):
+        sketch = DDSketch()
+        for value in values:
+            sketch.add(value)
+        _assert_quantiles_within_alpha(sketch, values)
+        # Stored and merged sketches keep the bound
+        merged = DDSketch()
+        half = len(values) // 2
+        for part in (values[:half], values[half:]):
+            part_sketch = DDSketch()
+            for value in part:
+                part_sketch.add(value)
+            merged.merge(DDSketch.from_bytes(part_sketch.to_bytes()))
+        _assert_quantiles_within_alpha(merged, values)
+
+
+def test_counterparty_stats_match_exact_answers(db):
+    rng = random.Random(11)
+    user_id = 1
+    start = datetime(2025, 3, 1)
+    payments = []
+    for day in range(14):
+        timestamp = start + timedelta(days=day, hours=12)
+        batch = []
+        for _ in range(300):
+            other = rng.randint(2, 2000)
+            amount = round(rng.lognormvariate(3, 1.2), 2)
+            batch.append((user_id, other, amount) if rng.random() < 0.6 else (other, user_id, amount))
+        sketches.record_transactions(db, batch, timestamp)
+        db.commit()
+        payments += batch
+
+    stats = sketches.get_approx_counterparty_stats(db, user_id, start, start + timedelta(days=13))
+    counterparties = {recipient if sender == user_id else sender for sender, recipient, _ in payments}
+    payers = {sender for sender, recipient, _ in payments if recipient == user_id}
+    amounts = [amount for _, _, amount in payments]
+
+    assert stats["payment_count"] == len(payments)
+    for approx, exact in ((stats["distinct_counterparties"], len(counterparties)), (stats["unique_payers"], len(payers))):
+        assert abs(approx - exact) <= 3 * HLL_STANDARD_ERROR * exact, (approx, exact)
+    for key, q in (("median_payment", 0.5), ("p95_payment", 0.95)):
+        exact = _exact_quantile(amounts, q)
+        assert abs(stats[key] - exact) <= sketches.DDSKETCH_ALPHA * exact * (1 + 1e-9), key
+
+
+def test_prune_sketches_deletes_expired_buckets(db):
+    now = datetime.utcnow()
+    for days_ago in (sketches.SKETCH_RETENTION_DAYS + 30, sketches.SKETCH_RETENTION_DAYS + 1, 0):
+        sketches.record_transactions(db, [(1, 2, 10.0)], now - timedelta(days=days_ago))
+    db.commit()
+    sketches.platform_buffer.flush()
+
+    batches = []
+    stats = sketches.prune_sketches(db, batch_size=5, on_batch=batches.append)
+    # Two expired days of sender, recipient and platform-wide sketches
+    assert stats == {"deleted": 14}
+    assert sum(batch["deleted"] for batch in batches) == 14
+    assert {bucket for (bucket,) in db.query(models.AnalyticsSketch.bucket).distinct()} == {now.date()}
+
+
+def test_concurrent_writers_share_one_row_per_sketch(db):
+    day = datetime(2025, 3, 10, 12)
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def write(worker: int):
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            for i in range(10):
+                sketches.record_transactions(session, [(1, 100 * worker + i, 1.0)], day)
+                session.commit()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    sketches.platform_buffer.flush()
+
+    sketch = models.AnalyticsSketch
+    keys = db.query(sketch.user_id, sketch.kind).all()
+    assert len(keys) == len(set(keys))
+    # No update was lost between writers
+    stats = sketches.get_approx_counterparty_stats(db, 1, day, day)
+    assert stats["payment_count"] == 40
+    assert stats["distinct_counterparties"] == 40
+    assert sketches.get_approx_counterparty_stats(db, None, day, day)["payment_count"] == 40
+
+
+def test_platform_sketches_are_stored_after_commit(db):
+    sketch = models.AnalyticsSketch
+    day = datetime(2025, 3, 10, 12)
+    platform_rows = db.query(sketch).filter(sketch.user_id.is_(None))
+
+    sketches.record_transactions(db, [(1, 2, 10.0)], day)
+    db.rollback()
+    sketches.record_transactions(db, [(1, 3, 20.0)], day)
+    db.commit()
+    # Buffered in this process, not written by the payment's transaction
+    assert platform_rows.count() == 0
+
+    stats = sketches.get_approx_counterparty_stats(db, None, day, day)
+    assert platform_rows.count() == 2
+    assert stats["payment_count"] == 1
+    assert stats["median_payment"] == pytest.approx(20.0, rel=sketches.DDSKETCH_ALPHA)
+    assert {bucket for (bucket,) in db.query(sketch.bucket).distinct()} == {date(2025, 3, 10)}
+
+
+def test_counterparty_stats_endpoint_agrees_with_exact(client, login, db):
+    headers = login("alice")
+    alice = crud.get_user_by_principal(db, "alice")
+    for index, amount in enumerate([5.0, 12.5, 12.5, 40.0, 80.0, 300.0]):
+        crud.create_transaction(db, schemas.TransactionCreate(
+            recipient_principal=f"shop-{index % 4}", amount=amount, description="payment", category="Food"
+        ), user_id=alice.id)
+
+    exact = client.get("/reports/counterparty-stats/", headers=headers).json()
+    approx = client.get("/reports/counterparty-stats/?approx=true", headers=headers).json()
+    assert (exact["approximate"], approx["approximate"]) == (False, True)
+    for key in ("distinct_counterparties", "unique_payers", "payment_count"):
+        assert approx[key] == exact[key] and exact[key] is not None, key
+    for key in ("median_payment", "p95_payment"):
+        assert abs(approx[key] - exact[key]) <= sketches.DDSKETCH_ALPHA * exact[key] * (1 + 1e-9), key
@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+
+from app import startup_profile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_import_app_main_within_budget():
+    # Fresh interpreters, so modules already imported by the tests don't count
+    report = startup_profile.profile(runs=3)
+    assert report["total_seconds"] <= startup_profile.STARTUP_BUDGET_SECONDS, (
+        f"import app.main took {report['total_seconds']:.3f}s, budget "
+        f"{startup_profile.STARTUP_BUDGET_SECONDS:.3f}s (STARTUP_BUDGET_SECONDS); "
+        f"slowest packages: {list(report['packages'].items())[:5]}"
+    )
+
+
+def test_startup_profile_command(tmp_path):
+    completed = subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, "paychain-startup-profile"), "--runs", "1", "--json"],
+        cwd=tmp_path, capture_output=True, text=True, timeout=120
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert json.loads(completed.stdout)["target"] == "app.main"
@@ -0,0 +1,77 @@
+from sqlalchemy import event
+
+from app import crud, listcache, models, schemas
+from app.database import SessionLocal, engine
+
+
+def _pay(db, payer, recipient_principal: str, amount: float, tags=None):
+    return crud.create_transaction(db, schemas.TransactionCreate(
+        recipient_principal=recipient_principal,
+        amount=amount,
+        description="payment",
+        category="Food",
+        tags=tags
+    ), user_id=payer.id)
+
+
+def _statements(fn):
+    """SQL statements issued while fn runs"""
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def test_payment_is_one_commit(db, make_user):
+    payer = make_user("payer")
+    commits = []
+    event.listen(db, "after_commit", commits.append)
+
+    # New recipient and a new tag, repeated
+    tx = _pay(db, payer, "newcomer", 25.0, tags=["rent", "rent", "march"])
+    assert len(commits) == 1
+
+    recipient = crud.get_user_by_principal(db, "newcomer")
+    assert tx.sender_principal == "payer" and tx.recipient_principal == "newcomer"
+    assert crud.get_user_balance(db, payer.id) == 975.0
+    assert crud.get_user_balance(db, recipient.id) == 1025.0
+    assert sorted(tag.name for tag in tx.tags) == ["march", "rent"]
+    receipt = db.query(models.NFTReceipt).filter_by(transaction_id=tx.id).one()
+    assert receipt.owner_id == payer.id
+    assert receipt.receipt_metadata["recipient"] == "newcomer"
+    assert db.query(models.Notification.user_id).all() == [(recipient.id,)]
+
+
+def test_payment_advances_cached_lists_without_reading_back(db, make_user):
+    payer, payee = make_user("payer"), make_user("payee")
+    version = crud.get_user_data_version(db, payer.id)
+    crud.get_user_template_rows(db, payer.id, version)
+
+    statements = _statements(lambda: _pay(db, payer, "payee", 10.0))
+    assert not [s for s in statements if s.startswith("SELECT users.id AS users_id, users.data_version ")]
+
+    # Still served from the cache at the new version
+    hits = listcache.cache.hits
+    assert crud.get_user_template_rows(db, payer.id, crud.get_user_data_version(db, payer.id)) == []
+    assert listcache.cache.hits == hits + 1
+
+
+def test_payment_after_another_writer_misses_the_cache(db, make_user):
+    payer, payee = make_user("payer"), make_user("payee")
+    crud.get_user_template_rows(db, payer.id, crud.get_user_data_version(db, payer.id))
+
+    # A template added by another process, which this cache never saw
+    other = SessionLocal()
+    other.add(models.PaymentTemplate(owner_id=payer.id, name="Rent", recipient_principal="payee", amount=5.0))
+    other.query(models.User).filter_by(id=payer.id).update({models.User.data_version: models.User.data_version + 1})
+    other.commit()
+    other.close()
+
+    _pay(db, payer, "payee", 10.0)
+    rows = crud.get_user_template_rows(db, payer.id, crud.get_user_data_version(db, payer.id))
+    assert [row["name"] for row in rows] == ["Rent"]